@@ -0,0 +1,307 @@
+"""
+Команды сотрудников для просмотра анкет прямо в Telegram.
+
+/pending — кандидаты, которые прошли собеседование, от новых к старым, страницами с кнопками.
+/teacher <id> — анкета кандидата: ответы собеседования, оценка (scoring.py), присланные видео.
+/stats — сколько анкет на каждом этапе воронки по городам.
+
+Страницы /pending листаются по ключу (registration_time, id): кнопка хранит ключ последней
+показанной анкеты, и запрос продолжает индекс ix_teachers_stage_registration с этого места,
+а не пропускает OFFSET строк, — дальняя страница открывается так же быстро, как первая,
+и не съезжает, когда появляются новые анкеты. Цифры /stats берутся из teacher_counters:
+счетчики меняются вместе с этапом анкеты (см. repository.py), COUNT(*) по teachers не нужен.
+
+Команды доступны только пользователям из ADMIN_IDS: список ADMIN_IDS в setting.py и/или
+переменная окружения ADMIN_IDS (id через запятую). Остальным бот на них не отвечает.
+
+Запуск (без Telegram):
+    python admin.py stats
+    python admin.py pending --pages 2
+"""
+import argparse
+import html
+import os
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import wraps
+from typing import Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from db import run_db
+
+# ============================ НАСТРОЙКА ============================
+ADMIN_PAGE_SIZE = 10  # Анкет на странице /pending
+CURSOR_EPOCH = datetime(2020, 1, 1)  # Время в кнопках — микросекунды от этой даты (callback_data до 64 байт)
+
+
+def _configured_admins() -> frozenset:
+    import setting
+
+    ids = set(getattr(setting, "ADMIN_IDS", ()))
+    ids.update(int(value) for value in os.environ.get("ADMIN_IDS", "").replace(",", " ").split())
+    return frozenset(ids)
+
+
+ADMIN_IDS = _configured_admins()
+
+
+@dataclass(frozen=True)
+class PendingRow:
+    id: int
+    full_name: str
+    city: str
+    registration_time: datetime
+
+
+@dataclass(frozen=True)
+class PendingPage:
+    rows: tuple
+    newer: bool  # Есть анкеты новее первой на странице
+    older: bool  # Есть анкеты старше последней на странице
+    total: int  # Всего анкет на этапе (по счетчикам)
+
+
+@dataclass(frozen=True)
+class TeacherCard:
+    id: int
+    full_name: str
+    city: str
+    birth_date: Optional[date]
+    stage: int
+    registration_time: Optional[datetime]
+    address: Optional[str]
+    summary: Optional[str]  # Сводка ответов собеседования
+    score: Optional[float]  # Оценка scoring.py (None — еще не посчитана)
+    media: tuple  # Виды присланных видео
+
+
+# ============================ ЗАПРОСЫ К БАЗЕ ДАННЫХ ============================
+# Синхронные функции, выполняются в пуле потоков через run_db.
+
+def _stage_total(session, stage: int) -> int:
+    from sqlalchemy import func, select
+
+    from models import TeacherCounter
+
+    return session.execute(
+        select(func.coalesce(func.sum(TeacherCounter.teachers), 0)).where(TeacherCounter.stage == stage)
+    ).scalar()
+
+
+def _pending_page(session, before: tuple = None, after: tuple = None, limit: int = ADMIN_PAGE_SIZE) -> PendingPage:
+    """
+    Страница кандидатов, прошедших собеседование, от новых к старым.
+    :param before: ключ (registration_time, id) — страница сразу после него (старее)
+    :param after: ключ (registration_time, id) — страница сразу перед ним (новее)
+    """
+    from sqlalchemy import select, tuple_
+
+    from models import Teacher, TeacherStage
+
+    key = tuple_(Teacher.registration_time, Teacher.id)
+    query = (
+        select(Teacher.id, Teacher.full_name, Teacher.city, Teacher.registration_time)
+        .where(Teacher.stage == TeacherStage.INTERVIEWED)
+        .limit(limit + 1)  # Лишняя строка — признак, что дальше есть еще страница
+    )
+    if after is not None:
+        # Назад к новым: читаем индекс в обратную сторону от ключа и разворачиваем страницу
+        rows = session.execute(
+            query.where(key > tuple_(*after)).order_by(Teacher.registration_time, Teacher.id)
+        ).all()
+        newer, older = len(rows) > limit, True
+        rows = rows[:limit][::-1]
+    else:
+        if before is not None:
+            query = query.where(key < tuple_(*before))
+        rows = session.execute(query.order_by(Teacher.registration_time.desc(), Teacher.id.desc())).all()
+        newer, older = before is not None, len(rows) > limit
+        rows = rows[:limit]
+    return PendingPage(tuple(PendingRow(*row) for row in rows), newer, older,
+                       _stage_total(session, TeacherStage.INTERVIEWED))
+
+
+def _teacher_card(session, teacher_id: int) -> Optional[TeacherCard]:
+    from sqlalchemy import select
+
+    from answers import stored_summary
+    from models import CandidateScore, Teacher, TeacherMedia
+
+    teacher = session.get(Teacher, teacher_id)
+    if teacher is None:
+        return None
+    score = session.execute(
+        select(CandidateScore.score).where(CandidateScore.teacher_id == teacher_id)
+    ).scalar()
+    media = session.execute(
+        select(TeacherMedia.kind).where(TeacherMedia.teacher_id == teacher_id).order_by(TeacherMedia.kind)
+    ).scalars().all()
+    return TeacherCard(teacher.id, teacher.full_name, teacher.city, teacher.birth_date, teacher.stage,
+                       teacher.registration_time, teacher.address,
+                       stored_summary(teacher.interview, teacher.text_interview), score, tuple(media))
+
+
+def _stats(session) -> dict:
+    """:return: {город: {этап: анкет}}"""
+    from sqlalchemy import select
+
+    from models import TeacherCounter
+
+    stats = {}
+    for city, stage, count in session.execute(
+            select(TeacherCounter.city, TeacherCounter.stage, TeacherCounter.teachers)
+            .where(TeacherCounter.teachers > 0)):
+        stats.setdefault(city, {})[stage] = count
+    return stats
+
+
+# ============================ ТЕКСТ И КНОПКИ ============================
+
+def encode_cursor(row: PendingRow) -> str:
+    micros = (row.registration_time - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}:{row.id}"
+
+
+def decode_cursor(value: str) -> tuple:
+    micros, teacher_id = value.split(":")
+    return CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(teacher_id)
+
+
+def _stage_names() -> dict:
+    from models import TeacherStage
+
+    return {
+        TeacherStage.REGISTERED: "анкета",
+        TeacherStage.INTERVIEWED: "собеседование",
+        TeacherStage.ADDRESS_CONFIRMED: "адрес",
+    }
+
+
+def render_pending(page: PendingPage) -> tuple:
+    """:return: (текст в HTML, клавиатура или None)"""
+    if not page.rows:
+        return "Нет кандидатов, ожидающих просмотра.", None
+    lines = [f"Прошли собеседование: <b>{page.total}</b>", ""]
+    for row in page.rows:
+        lines.append(f"<code>{row.id}</code> {html.escape(row.full_name)}, {html.escape(row.city)}, "
+                     f"{row.registration_time:%d.%m.%Y %H:%M}")
+    lines += ["", "Анкета: /teacher &lt;id&gt;"]
+    buttons = []
+    if page.newer:
+        buttons.append(InlineKeyboardButton("◀ Новее", callback_data=f"pending_newer:{encode_cursor(page.rows[0])}"))
+    if page.older:
+        buttons.append(InlineKeyboardButton("Старее ▶", callback_data=f"pending_older:{encode_cursor(page.rows[-1])}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def render_card(card: TeacherCard) -> str:
+    stage = _stage_names().get(card.stage, str(card.stage))
+    lines = [
+        f"<b>{html.escape(card.full_name)}</b> (<code>{card.id}</code>)",
+        f"Город: {html.escape(card.city)}",
+        f"Дата рождения: {card.birth_date:%d.%m.%Y}" if card.birth_date else "Дата рождения: —",
+        f"Этап: {stage}",
+        f"Регистрация: {card.registration_time:%d.%m.%Y %H:%M}" if card.registration_time else "Регистрация: —",
+        f"Оценка: {card.score:.0f}" if card.score is not None else "Оценка: еще не посчитана",
+        f"Видео: {', '.join(card.media)}" if card.media else "Видео: нет",
+    ]
+    if card.address:
+        lines.append(f"Адрес: {html.escape(card.address)}")
+    if card.summary:
+        lines += ["", html.escape(card.summary)]
+    return "\n".join(lines)
+
+
+def render_stats(stats: dict) -> str:
+    if not stats:
+        return "Анкет пока нет."
+    names = _stage_names()
+    totals = {stage: sum(counts.get(stage, 0) for counts in stats.values()) for stage in names}
+    lines = ["Анкет по этапам: " + ", ".join(f"{name} {totals[stage]}" for stage, name in names.items()), ""]
+    for city, counts in sorted(stats.items(), key=lambda item: -sum(item[1].values())):
+        lines.append(f"{html.escape(city)}: " + ", ".join(f"{name} {counts.get(stage, 0)}"
+                                                           for stage, name in names.items()))
+    return "\n".join(lines)
+
+
+# ============================ ОБРАБОТЧИКИ ============================
+
+def admin_only(handler):
+    """Обработчик выполняется только для ADMIN_IDS; остальным бот молча не отвечает."""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user is None or user.id not in ADMIN_IDS:
+            if update.callback_query:
+                await update.callback_query.answer()
+            return None
+        return await handler(update, context)
+    return wrapper
+
+
+@admin_only
+async def pending_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text, markup = render_pending(await run_db(_pending_page))
+    await update.message.reply_text(text, reply_markup=markup, parse_mode="HTML")
+
+
+@admin_only
+async def pending_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    direction, _, cursor = query.data.partition(":")
+    if direction == "pending_older":
+        page = await run_db(_pending_page, decode_cursor(cursor))
+    else:
+        page = await run_db(_pending_page, None, decode_cursor(cursor))
+    text, markup = render_pending(page)
+    await query.edit_message_text(text, reply_markup=markup, parse_mode="HTML")
+
+
+@admin_only
+async def teacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("Укажите id анкеты: /teacher 123456789")
+        return
+    card = await run_db(_teacher_card, int(context.args[0]))
+    if card is None:
+        await update.message.reply_text("Анкета не найдена.")
+        return
+    await update.message.reply_text(render_card(card), parse_mode="HTML")
+
+
+@admin_only
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text(render_stats(await run_db(_stats)), parse_mode="HTML")
+
+
+# ============================ ЗАПУСК ============================
+
+def main(argv=None) -> None:
+    from db import session_scope
+
+    parser = argparse.ArgumentParser(description="Команды сотрудников без Telegram")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="анкеты по городам и этапам")
+    pending_parser = subparsers.add_parser("pending", help="кандидаты, прошедшие собеседование")
+    pending_parser.add_argument("--pages", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with session_scope() as session:
+        if args.command == "stats":
+            print(render_stats(_stats(session)))
+            return
+        before = None
+        for _ in range(args.pages):
+            page = _pending_page(session, before)
+            print(render_pending(page)[0], end="\n\n")
+            if not page.older:
+                break
+            before = (page.rows[-1].registration_time, page.rows[-1].id)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,281 @@
+"""
+Аналитика воронки: /start → анкета → собеседование (/step2) → урок Scratch (/step3) → адрес.
+
+Обработчики сообщают о шагах пользователя через FunnelTracker.track(): это только добавление
+в список в памяти. Раз в ANALYTICS_FLUSH_INTERVAL секунд накопленные события пачками по
+ANALYTICS_FLUSH_CHUNK пишутся в журнал funnel_events в общих транзакциях с записями обработчиков
+(db.run_db_batched) и сразу учитываются в агрегатах funnel_daily
+(когорта по дню первого события × город × шаг). Отчеты читают только агрегаты,
+поэтому отвечают за миллисекунды при любом размере журнала.
+
+Запуск отчета:
+    python analytics.py
+    python analytics.py --from 2025-01-01 --to 2025-02-01 --city Москва
+    python analytics.py --states  # с разбивкой по вопросам собеседования (где бросают)
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from datetime import date, datetime
+
+from db import run_db, run_db_batched
+from metrics import FUNNEL_EVENTS_DROPPED
+
+# ============================ НАСТРОЙКА ============================
+ANALYTICS_FLUSH_INTERVAL = 10  # Секунд между записями событий в базу
+ANALYTICS_MAX_PENDING = 100_000  # Больше событий в памяти не держим (старые отбрасываются)
+ANALYTICS_MAX_RETRIES = 3  # Неудачных записей, после которых события отбрасываются
+ANALYTICS_FLUSH_CHUNK = 500  # Событий в одной записи: длинная транзакция задержала бы записи обработчиков
+_IN_CHUNK = 500  # Размер списков в IN (...) при чтении прогресса
+
+logger = logging.getLogger(__name__)
+
+
+# ============================ ШАГИ ВОРОНКИ ============================
+
+class FunnelStep:
+    START = 'start'  # /start
+    SURVEY_STARTED = 'survey_started'  # "Трудоустройство"
+    SURVEY_DONE = 'survey_done'  # Анкета сохранена
+    INTERVIEW_STARTED = 'interview_started'  # /step2
+    INTERVIEW_CONFIRMED = 'interview_confirmed'  # Ответы собеседования подтверждены
+    LESSON_STARTED = 'lesson_started'  # /step3
+    ADDRESS_CONFIRMED = 'address_confirmed'  # Адрес для набора подтвержден
+
+
+FUNNEL_STEPS = (
+    FunnelStep.START, FunnelStep.SURVEY_STARTED, FunnelStep.SURVEY_DONE, FunnelStep.INTERVIEW_STARTED,
+    FunnelStep.INTERVIEW_CONFIRMED, FunnelStep.LESSON_STARTED, FunnelStep.ADDRESS_CONFIRMED,
+)
+
+
+def state_names(*enums) -> dict:
+    """
+    Имена состояний диалога для журнала: {4: 'QState.WAITING_FOR_ONE', ...}.
+    :param enums: классы состояний (SurveyState, QState, LessonState)
+    """
+    return {
+        value: f"{enum.__name__}.{name}"
+        for enum in enums
+        for name, value in vars(enum).items()
+        if not name.startswith('_') and isinstance(value, int)
+    }
+
+
+def detailed_steps(survey, interview, lesson, flow=None) -> tuple:
+    """
+    Шаги воронки вместе с промежуточными состояниями диалога: показывает, на каком вопросе
+    анкеты или собеседования пользователи бросают. Первое состояние каждого сценария совпадает
+    с шагом-командой и пропускается.
+    :param flow: flow.Flow — если передан, берутся только состояния, которые в нем описаны
+    """
+    def states(enum) -> tuple:
+        names = state_names(enum)
+        return tuple(names[state] for state in sorted(names) if flow is None or state in flow)[1:]
+
+    return (
+        (FunnelStep.START, FunnelStep.SURVEY_STARTED) + states(survey)
+        + (FunnelStep.SURVEY_DONE, FunnelStep.INTERVIEW_STARTED) + states(interview)
+        + (FunnelStep.INTERVIEW_CONFIRMED, FunnelStep.LESSON_STARTED) + states(lesson)
+        + (FunnelStep.ADDRESS_CONFIRMED,)
+    )
+
+
+# ============================ ЗАПИСЬ СОБЫТИЙ ============================
+# Модели импортируются в функциях, которые выполняются в пуле потоков базы: FunnelTracker нужен боту
+# с первой секунды, а SQLAlchemy — только к первой записи событий (см. db.get_engine).
+
+def _load_users(session, user_ids) -> tuple:
+    from models import FunnelProgress, FunnelUser
+
+    users, progress = {}, defaultdict(set)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), _IN_CHUNK):
+        chunk = user_ids[start:start + _IN_CHUNK]
+        for user in session.query(FunnelUser).filter(FunnelUser.user_id.in_(chunk)):
+            users[user.user_id] = user
+        for user_id, step in session.query(FunnelProgress.user_id, FunnelProgress.step).filter(
+            FunnelProgress.user_id.in_(chunk)
+        ):
+            progress[user_id].add(step)
+    return users, progress
+
+
+def _apply_events(session, events) -> None:
+    """
+    Пишет события в журнал и обновляет агрегаты одной транзакцией.
+    :param events: список (user_id, step, city или None, время)
+    """
+    from sqlalchemy.dialects.sqlite import insert
+
+    from models import FunnelDaily, FunnelEvent, FunnelProgress, FunnelUser
+
+    session.bulk_insert_mappings(FunnelEvent, [
+        {"user_id": user_id, "step": step, "created_at": created_at} for user_id, step, _, created_at in events
+    ])
+
+    users, progress = _load_users(session, {event[0] for event in events})
+    deltas = defaultdict(int)  # (когорта, город, шаг) -> изменение числа пользователей
+    for user_id, step, city, created_at in events:
+        user = users.get(user_id)
+        if user is None:
+            user = users[user_id] = FunnelUser(user_id=user_id, cohort=created_at.date(), city='')
+            session.add(user)
+        if city and not user.city:
+            # Город стал известен: переносим уже учтенные шаги пользователя из "неизвестного" города
+            for reached_step in progress[user_id]:
+                deltas[(user.cohort, '', reached_step)] -= 1
+                deltas[(user.cohort, city, reached_step)] += 1
+            user.city = city
+        if step not in progress[user_id]:
+            progress[user_id].add(step)
+            session.add(FunnelProgress(user_id=user_id, step=step))
+            deltas[(user.cohort, user.city, step)] += 1
+
+    rows = [{"cohort": cohort, "city": city, "step": step, "users": delta}
+            for (cohort, city, step), delta in deltas.items() if delta]
+    if rows:
+        statement = insert(FunnelDaily)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[FunnelDaily.cohort, FunnelDaily.city, FunnelDaily.step],
+            set_={"users": FunnelDaily.users + statement.excluded.users}
+        ), rows)
+
+
+class FunnelTracker:
+    """
+    Копит события воронки в памяти и пачками пишет их в базу (flush вызывает периодическая задача бота).
+    Пачка, которую не удалось записать, повторяется со следующими flush, но не больше
+    ANALYTICS_MAX_RETRIES раз. Отброшенные события (после повторов или при переполнении очереди)
+    считаются в метрике bot_funnel_events_dropped_total.
+    :param names: имена состояний диалога для событий track_state (см. state_names)
+    """
+
+    def __init__(self, names: dict = None):
+        self.names = names or {}
+        self._pending = []
+        self._retry = []  # [(неудачных записей, события)] — пачки, которые повторяются первыми
+        self._retry_events = 0
+
+    def track(self, user_id: int, step: str, city: str = None) -> None:
+        """Пользователь дошел до шага воронки. city передается, когда он стал известен (анкета)."""
+        if self._pending and len(self._pending) + self._retry_events >= ANALYTICS_MAX_PENDING:
+            dropped = max(len(self._pending) // 10, 1)
+            del self._pending[:dropped]
+            FUNNEL_EVENTS_DROPPED.inc("overflow", amount=dropped)
+            logger.warning("Очередь событий воронки переполнена, отброшено старых событий: %d", dropped)
+        self._pending.append((user_id, step, city, datetime.utcnow()))
+
+    def track_state(self, user_id: int, state) -> None:
+        """Пользователь перешел в состояние диалога (вызывается из Flow)."""
+        if state is not None:
+            self.track(user_id, self.names.get(state, str(state)))
+
+    async def flush(self) -> None:
+        events, self._pending = self._pending, []
+        chunks = self._retry + [(0, events[start:start + ANALYTICS_FLUSH_CHUNK])
+                                for start in range(0, len(events), ANALYTICS_FLUSH_CHUNK)]
+        self._retry, self._retry_events = [], 0
+        for index, (failures, chunk) in enumerate(chunks):
+            try:
+                await run_db_batched(_apply_events, chunk)
+            except Exception:
+                logger.exception("Не удалось сохранить события воронки")
+                # База недоступна: остальные пачки этого flush даже не пробуем, повторим их позже
+                self._retry = [(failures + 1, chunk)] + chunks[index + 1:]
+                if failures + 1 >= ANALYTICS_MAX_RETRIES:
+                    self._retry.pop(0)
+                    FUNNEL_EVENTS_DROPPED.inc("write_failed", amount=len(chunk))
+                    logger.error("События воронки отброшены после %d неудачных записей: %d",
+                                 ANALYTICS_MAX_RETRIES, len(chunk))
+                self._retry_events = sum(len(retry) for _, retry in self._retry)
+                return
+
+
+# ============================ ОТЧЕТЫ ============================
+
+def _funnel_report(session, steps=FUNNEL_STEPS, cohort_from: date = None, cohort_to: date = None,
+                   city: str = None) -> list:
+    from sqlalchemy import func
+
+    from models import FunnelDaily
+
+    query = session.query(FunnelDaily.step, func.sum(FunnelDaily.users)).filter(FunnelDaily.step.in_(list(steps)))
+    if cohort_from is not None:
+        query = query.filter(FunnelDaily.cohort >= cohort_from)
+    if cohort_to is not None:
+        query = query.filter(FunnelDaily.cohort < cohort_to)
+    if city is not None:
+        query = query.filter(FunnelDaily.city == city)
+    totals = dict(query.group_by(FunnelDaily.step).all())
+
+    report, first, previous = [], None, None
+    for step in steps:
+        users = totals.get(step, 0)
+        first = users if first is None else first
+        report.append({
+            "step": step,
+            "users": users,
+            "from_previous": users / previous if previous else None,
+            "from_first": users / first if first else None,
+        })
+        previous = users
+    return report
+
+
+def _cohort_breakdown(session, step: str, cohort_from: date = None, cohort_to: date = None) -> list:
+    from models import FunnelDaily
+
+    query = session.query(FunnelDaily.cohort, FunnelDaily.city, FunnelDaily.users).filter(FunnelDaily.step == step)
+    if cohort_from is not None:
+        query = query.filter(FunnelDaily.cohort >= cohort_from)
+    if cohort_to is not None:
+        query = query.filter(FunnelDaily.cohort < cohort_to)
+    return query.order_by(FunnelDaily.cohort, FunnelDaily.city).all()
+
+
+async def funnel_report(steps=FUNNEL_STEPS, cohort_from: date = None, cohort_to: date = None, city: str = None) -> list:
+    """
+    Конверсия по шагам воронки.
+    :param steps: шаги по порядку (можно вставить состояния диалога, например 'QState.WAITING_FOR_THREE')
+    :param cohort_from: первый день когорты (включительно)
+    :param cohort_to: последний день когорты (не включительно)
+    :param city: только пользователи из города ('' — город неизвестен, анкету не заполнили)
+    :return: [{'step', 'users', 'from_previous', 'from_first'}, ...]
+    """
+    return await run_db(_funnel_report, steps, cohort_from, cohort_to, city)
+
+
+async def cohort_breakdown(step: str, cohort_from: date = None, cohort_to: date = None) -> list:
+    """Сколько пользователей дошли до step: [(когорта, город, пользователей), ...]."""
+    return await run_db(_cohort_breakdown, step, cohort_from, cohort_to)
+
+
+# ============================ ЗАПУСК ============================
+
+def main(argv=None) -> None:
+    from db import session_scope
+
+    parser = argparse.ArgumentParser(description="Отчет по воронке")
+    parser.add_argument("--from", dest="cohort_from", type=date.fromisoformat, help="первый день когорты, ISO")
+    parser.add_argument("--to", dest="cohort_to", type=date.fromisoformat, help="день после последнего, ISO")
+    parser.add_argument("--city")
+    parser.add_argument("--states", action="store_true", help="показать и состояния диалога (вопросы собеседования)")
+    args = parser.parse_args(argv)
+
+    steps = FUNNEL_STEPS
+    if args.states:
+        from main import FLOW, LessonState, QState, SurveyState
+        steps = detailed_steps(SurveyState, QState, LessonState, FLOW)
+
+    with session_scope() as session:
+        report = _funnel_report(session, steps, args.cohort_from, args.cohort_to, args.city)
+    for row in report:
+        from_previous = f"{row['from_previous']:7.1%}" if row['from_previous'] is not None else " " * 7
+        from_first = f"{row['from_first']:7.1%}" if row['from_first'] is not None else " " * 7
+        print(f"{row['step']:<34} {row['users']:>8} {from_previous} {from_first}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+"""
+Ответы собеседования: вопросы, компактное хранение и сводка для показа.
+
+В teachers.interview хранится JSON-массив ответов в порядке INTERVIEW_QUESTIONS — без заголовков
+вопросов, которые раньше повторялись в каждой анкете. Длинный массив сжимается zlib, если так
+выходит короче; сжатые данные отличаются по первому байту (JSON-массив начинается с "[").
+Сводка "Вопрос: ответ" собирается из ответов при показе и выгрузке.
+
+Анкеты, сохраненные до миграции 4 в старом формате (текст в teachers.text_interview), миграция
+переводит в ответы; текст, который не удалось разобрать, остается в text_interview как есть.
+"""
+import json
+import re
+import zlib
+from typing import Optional
+
+# ============================ ВОПРОСЫ ============================
+# Ключ в context.user_data и заголовок в сводке. Новые вопросы добавляются только в конец:
+# по позиции в этом списке ответ читается из сохраненных анкет
+INTERVIEW_QUESTIONS = (
+    ("experience_kids", "Опыт взаимодействия с младшими школьниками"),
+    ("experience_robo", "Опыт в робототехнике"),
+    ("interview_city", "Города для работы"),
+    ("free_time", "Свободное время"),
+    ("best_skills", "Лучшие навыки"),
+)
+COMPRESS_MIN_SIZE = 256  # Байт JSON, начиная с которых пробуем сжатие
+
+# Сводка старого формата: заголовки в порядке вопросов, ответ может занимать несколько строк
+_SUMMARY = re.compile("".join(f"{re.escape(label)}: (.*?)\n" for _, label in INTERVIEW_QUESTIONS) + r"\Z", re.S)
+
+
+# ============================ ОТВЕТЫ ============================
+
+def collect_answers(user_data) -> dict:
+    """Ответы собеседования из context.user_data."""
+    return {key: user_data.get(key) for key, _ in INTERVIEW_QUESTIONS}
+
+
+def _compile_summary():
+    """
+    Сводка как одна f-строка, собранная по INTERVIEW_QUESTIONS при импорте: так она строится
+    втрое быстрее, чем склейкой по списку вопросов или str.format.
+    """
+    parts = " ".join("f" + repr(f"{label}: {{get({key!r})}}\n") for key, label in INTERVIEW_QUESTIONS)
+    namespace = {}
+    exec(f"def render_answers(answers):\n    get = answers.get\n    return {parts}\n", namespace)
+    return namespace["render_answers"]
+
+
+render_answers = _compile_summary()
+render_answers.__doc__ = """
+    Сводка ответов, которую видят пользователь и HR (answers — словарь ответов или сам context.user_data).
+    Единственное место, где задан формат сводки; заголовки — из INTERVIEW_QUESTIONS, как и в _SUMMARY.
+    """
+
+
+def answers_text(answers) -> str:
+    """Только тексты ответов, по строке на ответ (для поиска)."""
+    return "\n".join(str(value) for value in answers.values() if value is not None)
+
+
+def parse_summary(text: str) -> Optional[dict]:
+    """Ответы из сводки старого формата или None, если текст в этом формате не записан."""
+    match = _SUMMARY.match(text)
+    if match is None:
+        return None
+    # f-строка сводки превращала пропущенный ответ в "None"
+    return {key: None if value == "None" else value
+            for (key, _), value in zip(INTERVIEW_QUESTIONS, match.groups())}
+
+
+# ============================ ХРАНЕНИЕ ============================
+
+def pack_answers(answers) -> bytes:
+    """Значение для teachers.interview."""
+    data = json.dumps([answers.get(key) for key, _ in INTERVIEW_QUESTIONS],
+                      ensure_ascii=False, separators=(",", ":")).encode()
+    if len(data) >= COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(data, 9)
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def unpack_answers(data: bytes) -> dict:
+    if data[:1] != b"[":
+        data = zlib.decompress(data)
+    values = json.loads(data)
+    # Анкета могла быть сохранена до появления последних вопросов
+    return {key: values[index] if index < len(values) else None
+            for index, (key, _) in enumerate(INTERVIEW_QUESTIONS)}
+
+
+def stored_answers(interview, text_interview=None) -> Optional[dict]:
+    """Ответы анкеты по столбцам teachers.interview и text_interview (None — ответов нет или их не разобрать)."""
+    if interview is not None:
+        return unpack_answers(interview)
+    if text_interview is not None:
+        return parse_summary(text_interview)
+    return None
+
+
+def stored_summary(interview, text_interview=None) -> Optional[str]:
+    """Сводка ответов анкеты; для неразобранного текста старого формата — он сам."""
+    if interview is not None:
+        return render_answers(unpack_answers(interview))
+    return text_interview
@@ -0,0 +1,58 @@
+"""
+Неизменяемые объекты, которые бот собирает один раз при запуске: валидаторы ответов
+и клавиатуры (сводка ответов собеседования — в answers.py). Обработчики берут их готовыми
+и не тратят время на компиляцию шаблонов и сборку разметки на каждое сообщение.
+Объекты Telegram (клавиатуры) после создания не меняются, поэтому их можно отправлять
+сколько угодно раз из разных обработчиков.
+"""
+import re
+from datetime import datetime
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+from flow import choice_answer, regex_answer, text_answer
+
+# ============================ ГОРОДА ============================
+CITIES = (
+    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург",
+    "Казань", "Нижний Новгород", "Челябинск", "Омск",
+    "Самара", "Ростов-на-Дону"
+)
+
+_SEPARATORS = re.compile(r"[\s\-]+")
+
+
+def normalize_text(value: str) -> str:
+    """Ключ для сравнения ответов: без учета регистра, ё/е, дефисов и лишних пробелов."""
+    return _SEPARATORS.sub(" ", value.casefold().replace("ё", "е")).strip()
+
+
+# ============================ ВАЛИДАТОРЫ ============================
+full_name_answer = regex_answer(r'^[А-ЯЁ][а-яё]+\s[А-ЯЁ][а-яё]+\s[А-ЯЁ][а-яё]+$')
+city_answer = choice_answer(CITIES, normalize=normalize_text)  # "москва" и "Ростов на Дону" тоже подходят
+
+_BIRTH_DATE = re.compile(r'^\d{2}\.\d{2}\.\d{4}$')
+
+
+def birth_date_answer(message):
+    """Дата рождения в формате ДД.ММ.ГГГГ (значение — datetime.date)."""
+    value = text_answer(message)
+    if value is None or not _BIRTH_DATE.match(value):
+        return None
+    try:
+        return datetime.strptime(value, '%d.%m.%Y').date()
+    except ValueError:
+        return None
+
+
+# ============================ КЛАВИАТУРЫ ============================
+START_MARKUP = ReplyKeyboardMarkup([['Зарплата', 'Трудоустройство']], resize_keyboard=True, one_time_keyboard=True)
+CITIES_MARKUP = ReplyKeyboardMarkup([[city] for city in CITIES], one_time_keyboard=True, resize_keyboard=True)
+INTERVIEW_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Подтвердить", callback_data="interview_confirm")],
+    [InlineKeyboardButton("❌ Отклонить", callback_data="interview_reject")]
+])
+ADDRESS_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Подтвердить", callback_data="address_confirm")],
+    [InlineKeyboardButton("✏️ Изменить", callback_data="address_edit")]
+])
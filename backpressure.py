@@ -0,0 +1,125 @@
+"""
+Очередь обновлений перед обработчиками бота.
+
+Обновления разных пользователей обрабатываются параллельно (не больше UPDATE_CONCURRENCY одновременно),
+а обновления одного пользователя — строго по очереди: двойное нажатие кнопки или несколько быстрых
+сообщений не запускают его обработчики одновременно, поэтому проверки вида "есть ли уже анкета"
+перед записью остаются верными.
+
+Очередь ограничена: если ждут обработки уже UPDATE_QUEUE_LIMIT обновлений или у пользователя их
+USER_QUEUE_LIMIT, новое обновление отбрасывается, а пользователь получает BUSY_TEXT. При перегрузке
+бот отвечает "подождите", а не копит задачи и память без предела.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import UPDATES_SHED
+from text import BUSY_TEXT
+
+# ============================ НАСТРОЙКА ============================
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "64"))  # Обработчиков одновременно
+UPDATE_QUEUE_LIMIT = int(os.environ.get("UPDATE_QUEUE_LIMIT", "2000"))  # Обновлений в работе и в очереди
+USER_QUEUE_LIMIT = 5  # Необработанных обновлений одного пользователя (остальные — нажатия подряд)
+
+logger = logging.getLogger(__name__)
+
+
+def update_owner(update):
+    """Чьи обновления обрабатываются по очереди: id пользователя, иначе id чата, иначе None."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class _UserQueue:
+    __slots__ = ("lock", "pending", "notified")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # Ожидающие получают блокировку в порядке прихода
+        self.pending = 0  # Обновлений пользователя в работе и в очереди
+        self.notified = False  # Пользователю уже ответили BUSY_TEXT
+
+
+class UserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик очереди обновлений для ApplicationBuilder.concurrent_updates().
+    :param concurrency: сколько обновлений обрабатывается одновременно
+    :param queue_limit: сколько обновлений может быть в работе и в очереди, остальные отбрасываются
+    :param user_limit: то же для одного пользователя
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, queue_limit: int = UPDATE_QUEUE_LIMIT,
+                 user_limit: int = USER_QUEUE_LIMIT):
+        # Семафор базового класса занимается до do_process_update. Если бы им ограничивался параллелизм,
+        # обновления, ждущие своей очереди у пользователя, занимали бы места других пользователей.
+        # Поэтому он только отсекает лавину задач, а очередь и параллелизм ограничиваются здесь.
+        super().__init__(queue_limit + concurrency)
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.user_limit = user_limit
+        self._slots = asyncio.Semaphore(concurrency)
+        self._users = {}  # id пользователя -> _UserQueue
+        self._admitted = 0
+
+    @property
+    def queued(self) -> int:
+        """Обновлений в работе и в очереди."""
+        return self._admitted
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update, coroutine) -> None:
+        owner = update_owner(update)
+        user = self._users.get(owner) if owner is not None else None
+        if self._admitted >= self.queue_limit:
+            await self._shed(update, coroutine, user, "queue")
+            return
+        if user is not None and user.pending >= self.user_limit:
+            await self._shed(update, coroutine, user, "user")
+            return
+
+        if owner is not None and user is None:
+            user = self._users[owner] = _UserQueue()
+        self._admitted += 1
+        if user is not None:
+            user.pending += 1
+        try:
+            # Сначала очередь пользователя, потом общее место: ожидание своей очереди мест не занимает
+            async with user.lock if user is not None else contextlib.nullcontext():
+                async with self._slots:
+                    await coroutine
+        finally:
+            self._admitted -= 1
+            if user is not None:
+                user.pending -= 1
+                if not user.pending:
+                    del self._users[owner]
+
+    async def _shed(self, update, coroutine, user, reason: str) -> None:
+        coroutine.close()  # Обработчики этого обновления не запускаются
+        UPDATES_SHED.inc(reason)
+        if not isinstance(update, Update):
+            return
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(BUSY_TEXT)  # Всплывающее уведомление вместо часиков на кнопке
+            elif update.effective_message is not None and not (user is not None and user.notified):
+                # Отвечаем один раз за серию, а не на каждое лишнее сообщение
+                await update.effective_message.reply_text(BUSY_TEXT)
+                if user is not None:
+                    user.notified = True
+        except Exception as e:
+            logger.warning("Не удалось ответить на отброшенное обновление: %s", e)
@@ -0,0 +1,1500 @@
+"""
+Нагрузочные замеры бота.
+
+Запуск:
+    python benchmark.py db --users 300
+    python benchmark.py states --users 100000
+    python benchmark.py reminders --users 2000
+    python benchmark.py sqlite --writers 4 --readers 2
+    python benchmark.py media --videos 100
+    python benchmark.py transport --updates 2000
+    python benchmark.py workers --updates 2000 --workers 1 4
+    python benchmark.py updates --users 100 --flood 5000
+    python benchmark.py export --rows 200000
+    python benchmark.py search --rows 300000
+    python benchmark.py interview --rows 200000
+    python benchmark.py scoring --rows 200000 --changed 0.01
+    python benchmark.py admin --rows 300000
+    python benchmark.py analytics --users 50000
+    python benchmark.py startup
+    python benchmark.py boot --runs 10
+    python benchmark.py assets
+    python benchmark.py funnel --users 2000 --concurrency 500 --save baseline.json
+    python benchmark.py funnel --users 2000 --concurrency 500 --compare baseline.json
+    python benchmark.py funnel --users 1000 --concurrency 100 --think 1
+
+Каждый сценарий работает с временной базой данных и не трогает teachers.db.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import random
+import socket
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, event, func, select
+
+from loadgen import percentile
+
+
+# ============================ ВСПОМОГАТЕЛЬНОЕ ============================
+
+def format_latency(name: str, values) -> str:
+    ms = [v * 1000 for v in values]
+    return (f"{name:<28} n={len(ms):<6} p50={percentile(ms, 50):8.2f}ms "
+            f"p99={percentile(ms, 99):8.2f}ms max={max(ms, default=0):8.2f}ms")
+
+
+def use_temp_database() -> str:
+    """Перенаправляет DATABASE_URL во временный файл. Вызывать до импорта db/models."""
+    path = os.path.join(tempfile.mkdtemp(prefix="botum-bench-"), "teachers.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return path
+
+
+# ============================ СЦЕНАРИЙ: БАЗА ДАННЫХ ============================
+
+async def _ping_handler(latencies: list, interval: float, stop: asyncio.Event) -> None:
+    """Имитирует лёгкие обработчики других пользователей и меряет задержку цикла событий."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append(time.perf_counter() - started - interval)
+
+
+def _legacy_engine(path: str):
+    """Движок и сессии, как в боте до run_db: без профиля SQLite (журнал DELETE, synchronous=FULL)."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from models import Teacher
+
+    engine = create_engine(f"sqlite:///{path}")
+    Teacher.__table__.create(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def _legacy_register(Session, user_id: int) -> None:
+    """Запись анкеты, как в старом handle_birth_date: своя сессия, запрос, коммит на каждого пользователя."""
+    from models import Teacher
+
+    session = Session()
+    try:
+        if session.query(Teacher).filter_by(id=user_id).one_or_none() is None:
+            session.add(Teacher(id=user_id, full_name="Иванов Иван Иванович", city="Москва",
+                                birth_date=date(1990, 1, 1)))
+            session.commit()
+    finally:
+        session.close()
+
+
+async def _bench_db(users: int, mode: str, legacy=None) -> dict:
+    import db
+    import repository
+    from models import Teacher
+
+    def register(user_id: int):
+        with db.session_scope() as session:
+            return repository._register_teacher(session, user_id, "Иванов Иван Иванович", "Москва",
+                                                date(1990, 1, 1))
+
+    async def survey_handler(user_id: int, arrived: float, latencies: list):
+        # Все обновления приходят одновременно, задержка считается от момента прихода
+        if mode == "legacy":
+            _legacy_register(legacy[1], user_id)  # Так анкета сохранялась до user-012 и user-013
+        elif mode == "blocking":
+            register(user_id)  # Так работали обработчики до появления run_db
+        elif mode == "pool":
+            await db.run_db(repository._register_teacher, user_id, "Иванов Иван Иванович", "Москва",
+                            date(1990, 1, 1))
+        else:
+            await db.run_db_batched(repository._register_teacher, user_id, "Иванов Иван Иванович", "Москва",
+                                    date(1990, 1, 1))
+        latencies.append(time.perf_counter() - arrived)
+
+    offset = DB_MODES.index(mode) * users  # Разные id, чтобы все прогоны действительно вставляли строки
+    with db.session_scope() as session:
+        session.query(Teacher).delete()
+
+    engine = legacy[0] if mode == "legacy" else db.engine
+    commit_latencies, ping_latencies = [], []
+    transactions = []
+    on_commit = lambda conn: transactions.append(1)
+    event.listen(engine, "commit", on_commit)
+    stop = asyncio.Event()
+    pinger = asyncio.create_task(_ping_handler(ping_latencies, 0.001, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(survey_handler(offset + i, started, commit_latencies) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pinger
+    event.remove(engine, "commit", on_commit)
+    return {"elapsed": elapsed, "commits": commit_latencies, "pings": ping_latencies, "transactions": len(transactions)}
+
+
+DB_MODES = ("legacy", "blocking", "pool", "batched")
+DB_TITLES = {
+    "legacy": "старый обработчик (без профиля SQLite)", "blocking": "синхронная сессия",
+    "pool": "run_db (пул потоков)", "batched": "run_db_batched (пачки)",
+}
+
+
+def run_db_scenario(args) -> None:
+    path = use_temp_database()
+    import models
+    models.create_database()
+    legacy = _legacy_engine(os.path.join(os.path.dirname(path), "legacy.db"))
+
+    throughput = {}
+    for mode in DB_MODES:
+        result = asyncio.run(_bench_db(args.users, mode, legacy))
+        throughput[mode] = args.users / result["elapsed"]
+        print(f"--- {DB_TITLES[mode]}: {args.users} пользователей, {result['elapsed']:.2f}s, "
+              f"{throughput[mode]:.0f} анкет/с, транзакций {result['transactions']}")
+        print(format_latency("обработчик анкеты", result["commits"]))
+        print(format_latency("задержка цикла событий", result["pings"]))
+
+    # Проверка заявленного ускорения записи анкет: пачки против старого обработчика и против run_db
+    failed = False
+    for mode, target in (("legacy", args.min_speedup_legacy), ("pool", args.min_speedup_pool)):
+        speedup = throughput["batched"] / throughput[mode]
+        ok = speedup >= target
+        failed |= not ok
+        print(f"run_db_batched / {DB_TITLES[mode]}: x{speedup:.1f} (нужно не меньше x{target:g}) "
+              f"{'OK' if ok else 'НЕ ДОСТИГНУТО'}")
+    if failed:
+        sys.exit(1)
+
+
+# ============================ СЦЕНАРИЙ: СОСТОЯНИЯ ДИАЛОГОВ ============================
+
+def _measure_states(factory, users: int):
+    from state_store import STATE_BATCH_SIZE
+
+    async def fill(store):
+        for user_id in range(users):
+            store[user_id] = 4 + user_id % 6  # "Заснувшие" пользователи посреди собеседования
+            if user_id % STATE_BATCH_SIZE == 0:
+                await asyncio.sleep(0)  # Как между обновлениями в боте: фоновая запись успевает начаться
+        if hasattr(store, "flush"):
+            await store.flush()
+
+    tracemalloc.start()
+    store = factory()
+    started = time.perf_counter()
+    asyncio.run(fill(store))
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, current, elapsed
+
+
+def run_states_scenario(args) -> None:
+    from state_store import MemoryStateStore, SqliteStateStore
+
+    path = os.path.join(tempfile.mkdtemp(prefix="botum-bench-"), "states.db")
+    variants = [
+        ("dict (как раньше)", dict),
+        ("MemoryStateStore без лимита", lambda: MemoryStateStore(max_size=args.users * 2)),
+        ("MemoryStateStore лимит 10k", lambda: MemoryStateStore(max_size=10_000)),
+        ("SqliteStateStore лимит 10k", lambda: SqliteStateStore(path, max_size=10_000)),
+    ]
+    for title, factory in variants:
+        store, memory, elapsed = _measure_states(factory, args.users)
+        print(f"{title:<30} память={memory / 1024 / 1024:7.2f} MiB  запись={elapsed:6.2f}s")
+    print(f"файл состояний на диске: {os.path.getsize(path) / 1024 / 1024:.2f} MiB")
+
+    # Перезапуск: новое хранилище поверх того же файла видит сохраненные состояния
+    restored = SqliteStateStore(path, max_size=10_000)
+    print(f"после перезапуска состояние пользователя 0: {asyncio.run(restored.load(0))}")
+    _measure_user_data(args.users, os.path.join(os.path.dirname(path), "user_data.db"),
+                       args.changed, args.finished)
+
+
+def _sample_user_data(user_id: int, finished: bool) -> dict:
+    from datetime import date
+
+    from answers import INTERVIEW_QUESTIONS
+
+    data = {"full_name": f"Иванов Иван Иванович {user_id}", "city": "Москва", "birth_date": date(1999, 1, 1)}
+    if finished:
+        data.update({key: f"ответ пользователя {user_id} на вопрос «{key}», " * 3 for key, _ in INTERVIEW_QUESTIONS})
+        data.update({"video_note": f"media/{user_id}/video_note.mp4", "address": f"ул. Ленина, д. {user_id}"})
+    return data
+
+
+def _measure_user_data(users: int, path: str, changed: float, finished: float) -> None:
+    """
+    context.user_data на users пользователей: память, запись раз в интервал и перезапуск
+    для UserDataPersistence против PicklePersistence (весь файл переписывается каждый интервал).
+    Доля finished закончила анкету: их user_data бот сбрасывает при подтверждении адреса.
+    """
+    import pickle
+
+    from state_store import UserDataPersistence
+
+    finished_users = int(users * finished)
+    tracemalloc.start()
+    user_data = {user_id: _sample_user_data(user_id, user_id < finished_users) for user_id in range(users)}
+    before, _ = tracemalloc.get_traced_memory()
+    for user_id in range(finished_users):
+        del user_data[user_id]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"user_data {users} пользователей: память={before / 1024 / 1024:7.2f} MiB, "
+          f"без закончивших анкету ({finished_users}): {after / 1024 / 1024:7.2f} MiB")
+
+    everyone = {user_id: _sample_user_data(user_id, user_id < finished_users) for user_id in range(users)}
+    pickle_path = path + ".pickle"
+    started = time.perf_counter()
+    with open(pickle_path, "wb") as file:  # Так PicklePersistence пишет каждый интервал
+        pickle.dump({"user_data": everyone}, file)
+    print(f"PicklePersistence: запись всех {users} за интервал {time.perf_counter() - started:.3f}s "
+          f"(в цикле событий), файл {os.path.getsize(pickle_path) / 1024 / 1024:.2f} MiB")
+
+    async def write(persistence, user_ids) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(persistence.update_user_data(user_id, user_data[user_id]) for user_id in user_ids))
+        return time.perf_counter() - started
+
+    async def run() -> None:
+        persistence = UserDataPersistence(path)
+        await persistence.get_user_data()
+        await write(persistence, list(user_data))
+        dirty = list(user_data)[:max(1, int(len(user_data) * changed))]
+        elapsed = await write(persistence, dirty)
+        print(f"UserDataPersistence: запись {len(dirty)} изменившихся за интервал {elapsed:.3f}s "
+              f"(в пуле потоков), файл {os.path.getsize(path) / 1024 / 1024:.2f} MiB")
+        await persistence.flush()
+        restored = UserDataPersistence(path)
+        started = time.perf_counter()
+        loaded = await restored.get_user_data()
+        print(f"после перезапуска загружено {len(loaded)} user_data за {time.perf_counter() - started:.2f}s")
+        await restored.flush()
+
+    asyncio.run(run())
+
+
+# ============================ СЦЕНАРИЙ: НАПОМИНАНИЯ ============================
+
+class _FlakyBot:
+    """Имитация Bot API: задержка сети и редкие ошибки, которые должна пережить рассылка."""
+
+    def __init__(self, latency: float, error_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        from telegram.error import NetworkError
+
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise NetworkError("имитация сбоя сети")
+        self.sent.append(chat_id)
+
+
+def run_reminders_scenario(args) -> None:
+    use_temp_database()
+    import db
+    import models
+    import reminders
+
+    models.create_database()
+    now = datetime.utcnow()
+    # users анкет с наступившим напоминанием и pending анкет, которым напоминать еще рано
+    with db.session_scope() as session:
+        session.bulk_insert_mappings(models.Teacher, [
+            {"id": i, "full_name": "Иванов Иван Иванович", "city": "Москва", "birth_date": date(1990, 1, 1),
+             "registration_time": now - timedelta(hours=1) if i <= args.users else now}
+            for i in range(1, args.users + args.pending + 1)
+        ])
+        session.bulk_insert_mappings(models.ReminderJob, [
+            {"teacher_id": i, "due_at": now - timedelta(minutes=30) if i <= args.users else now + reminders.REMINDER_DELAY}
+            for i in range(1, args.users + args.pending + 1)
+        ])
+
+    reminders.BACKOFF_BASE = 0.01
+    bot = _FlakyBot(latency=0.05, error_rate=0.02)
+    dispatcher = reminders.ReminderDispatcher(rate=args.rate)
+    for run in (1, 2):
+        stats = asyncio.run(dispatcher.run(bot))
+        print(f"проход {run}: отправлено {stats['sent']}, ошибок {stats['failed']}, "
+              f"за {stats['elapsed']:.2f}s ({stats['rate']:.1f} сообщений/с)")
+    print(f"уникальных получателей {len(set(bot.sent))}, всего сообщений {len(bot.sent)}")
+
+    # Проход без наступивших напоминаний: один запрос по индексу due_at, сколько бы заданий ни ждало
+    idle = [asyncio.run(dispatcher.run(bot))["elapsed"] for _ in range(20)]
+    print(format_latency(f"проход, ждут {args.pending}", idle))
+
+
+# ============================ СЦЕНАРИЙ: БЛОКИРОВКИ SQLITE ============================
+
+def _contend(engine, args) -> dict:
+    """
+    Писатели регистрируют анкеты, читатели сканируют таблицу, как рассылка напоминаний,
+    параллельно в потоках в течение args.duration секунд.
+    """
+    import threading
+
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+
+    import models
+
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    registered = datetime.utcnow() - timedelta(hours=1)
+    with Session.begin() as session:
+        session.add_all(
+            models.Teacher(id=i, full_name="Иванов Иван Иванович", city="Москва",
+                           birth_date=date(1990, 1, 1), registration_time=registered)
+            for i in range(1, args.users + 1)
+        )
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    result = {"writes": [], "reads": 0, "locked": 0}
+    next_id = iter(range(args.users + 1, 10 ** 9))
+
+    def writer():
+        while not stop.is_set():
+            with lock:
+                user_id = next(next_id)
+            started = time.perf_counter()
+            try:
+                with Session.begin() as session:
+                    session.add(models.Teacher(id=user_id, full_name="Петров Петр Петрович", city="Омск",
+                                               birth_date=date(1990, 1, 1)))
+            except OperationalError:
+                with lock:
+                    result["locked"] += 1
+                continue
+            with lock:
+                result["writes"].append(time.perf_counter() - started)
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with Session() as session:
+                    session.query(models.Teacher.id).filter(
+                        models.Teacher.stage == models.TeacherStage.REGISTERED
+                    ).order_by(models.Teacher.registration_time, models.Teacher.id).all()
+            except OperationalError:
+                with lock:
+                    result["locked"] += 1
+                continue
+            with lock:
+                result["reads"] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return result
+
+
+def run_sqlite_scenario(args) -> None:
+    from sqlalchemy import create_engine
+
+    import db
+
+    profiles = (
+        ("по умолчанию", lambda url: create_engine(url, connect_args={"timeout": args.timeout})),
+        ("профиль db.make_engine", db.make_engine),
+    )
+    for title, factory in profiles:
+        path = os.path.join(tempfile.mkdtemp(prefix="botum-bench-"), "teachers.db")
+        result = _contend(factory(f"sqlite:///{path}"), args)
+        print(f"--- {title}: записей {len(result['writes'])}, сканирований {result['reads']}, "
+              f"ошибок \"database is locked\" {result['locked']}")
+        print(format_latency("коммит анкеты", result["writes"]))
+
+
+# ============================ СЦЕНАРИЙ: ВИДЕО-КРУЖКИ ============================
+
+class _FileBot:
+    """Имитация get_file: отдает ссылку на файл, который раздает тестовый транспорт."""
+
+    async def get_file(self, file_id):
+        class File:
+            file_path = f"https://files.invalid/{file_id}.mp4"
+        return File()
+
+
+def _slow_video_transport(chunks: int, chunk_size: int, delay: float):
+    import httpx
+
+    async def body():
+        for _ in range(chunks):
+            await asyncio.sleep(delay)
+            yield b"\0" * chunk_size
+
+    return httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+
+
+async def _bench_media(videos: int, folder: str) -> dict:
+    import httpx
+    import media
+
+    client = httpx.AsyncClient(transport=_slow_video_transport(chunks=20, chunk_size=256 * 1024, delay=0.01))
+    queue = media.MediaIngestQueue(client=client)
+    await queue.start()
+
+    handler_latencies, ping_latencies = [], []
+    stop = asyncio.Event()
+    pinger = asyncio.create_task(_ping_handler(ping_latencies, 0.001, stop))
+
+    async def video_handler(i: int, arrived: float):
+        # Обработчик только ставит видео в очередь и сразу отвечает пользователю
+        await queue.submit(_FileBot(), f"video{i}", os.path.join(folder, f"{i}.mp4"))
+        handler_latencies.append(time.perf_counter() - arrived)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(video_handler(i, started) for i in range(videos)))
+    await queue.stop()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pinger
+    await client.aclose()
+    return {"elapsed": elapsed, "handlers": handler_latencies, "pings": ping_latencies}
+
+
+def run_media_scenario(args) -> None:
+    folder = tempfile.mkdtemp(prefix="botum-bench-")
+    result = asyncio.run(_bench_media(args.videos, folder))
+    size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+    print(f"{args.videos} видео ({size / 1024 / 1024:.0f} MiB) сохранены за {result['elapsed']:.2f}s")
+    print(format_latency("ответ на видео-кружок", result["handlers"]))
+    print(format_latency("задержка цикла событий", result["pings"]))
+
+
+# ============================ СЦЕНАРИЙ: POLLING ИЛИ ВЕБХУК ============================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _bench_transport(mode: str, updates: int, rate: float) -> dict:
+    from telegram.ext import ApplicationBuilder
+
+    import main
+    from fake_telegram import FakeTelegram
+    from webhook import serve_webhook
+
+    pushed, replied = {}, {}
+    done = asyncio.Event()
+
+    def on_call(method, params):
+        if method == "sendMessage" and params.get("chat_id") in pushed:
+            replied[params["chat_id"]] = time.perf_counter()
+            if len(replied) == updates:
+                done.set()
+
+    fake = FakeTelegram(on_call=on_call)
+    await fake.start()
+    builder = ApplicationBuilder().token("123:TEST").base_url(fake.base_url)
+    app = main.build_application(builder, persistence_file=None)
+
+    stop = asyncio.Event()
+    if mode == "webhook":
+        port = _free_port()
+        server = asyncio.create_task(serve_webhook(app, url=f"http://127.0.0.1:{port}", listen="127.0.0.1",
+                                                   port=port, secret="bench", stop_event=stop))
+        while fake.webhook_url is None:
+            await asyncio.sleep(0.01)
+    else:
+        await app.initialize()
+        await app.post_init(app)
+        await app.start()
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+
+    async def push(user_id: int, delay: float):
+        await asyncio.sleep(delay)
+        pushed[user_id] = time.perf_counter()
+        await fake.push_update(fake.make_message(user_id, "Зарплата"))
+
+    # Пропускная способность: все обновления приходят разом
+    started = time.perf_counter()
+    await asyncio.gather(*(push(1000 + i, 0) for i in range(updates)))
+    await asyncio.wait_for(done.wait(), timeout=120)
+    elapsed = time.perf_counter() - started
+
+    # Задержка: обновления приходят с постоянной скоростью rate в секунду
+    burst = dict(replied)
+    pushed.clear()
+    replied.clear()
+    done.clear()
+    await asyncio.gather(*(push(100_000 + i, i / rate) for i in range(updates)))
+    await asyncio.wait_for(done.wait(), timeout=120)
+
+    if mode == "webhook":
+        stop.set()
+        await server
+    else:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        await app.post_shutdown(app)
+    await fake.stop()
+    return {"elapsed": elapsed, "replies": len(burst),
+            "latencies": [replied[user_id] - pushed[user_id] for user_id in replied]}
+
+
+def run_transport_scenario(args) -> None:
+    use_temp_database()
+    import models
+    models.create_database()
+
+    for mode in ("polling", "webhook"):
+        result = asyncio.run(_bench_transport(mode, args.updates, args.rate))
+        print(f"--- {mode}: {result['replies']} обновлений разом за {result['elapsed']:.2f}s "
+              f"({result['replies'] / result['elapsed']:.0f} обновлений/с)")
+        print(format_latency(f"ответ при {args.rate:.0f} обн./с", result["latencies"]))
+
+
+# ============================ СЦЕНАРИЙ: НЕСКОЛЬКО ПРОЦЕССОВ ============================
+
+async def _bench_workers(workers: int, updates: int, users: int) -> dict:
+    from telegram.ext import ApplicationBuilder
+
+    from fake_telegram import FakeTelegram
+    from workers import ShardRouter, build_front_application
+
+    expected = updates
+    replies = {}  # user_id -> список ответов по порядку
+    done = asyncio.Event()
+
+    def on_call(method, params):
+        if method == "sendMessage":
+            replies.setdefault(params.get("chat_id"), []).append(params.get("text"))
+            if sum(len(texts) for texts in replies.values()) >= expected:
+                done.set()
+
+    fake = FakeTelegram(on_call=on_call)
+    await fake.start()
+    router = ShardRouter(workers, base_url=fake.base_url)
+    app = build_front_application(router, ApplicationBuilder().token("123:TEST").base_url(fake.base_url))
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    await app.updater.start_polling(poll_interval=0, timeout=10)
+    await asyncio.sleep(5)  # Процессам нужно время на импорт и запуск
+
+    # Каждый пользователь начинает анкету и вводит ФИО — валидация регулярным выражением в процессах
+    started = time.perf_counter()
+    for i in range(updates // 2):
+        user_id = 1000 + i % users
+        await fake.push_update(fake.make_message(user_id, "Трудоустройство"))
+        await fake.push_update(fake.make_message(user_id, "Иванов Иван Иванович"))
+    await asyncio.wait_for(done.wait(), timeout=300)
+    elapsed = time.perf_counter() - started
+
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    await app.post_shutdown(app)
+    await fake.stop()
+
+    # Порядок: после приглашения ввести ФИО всегда идет ответ на ФИО
+    ordered = all(
+        texts[i].startswith("Запишите ваше ФИО") and texts[i + 1].startswith("Выберите город")
+        for texts in replies.values() for i in range(0, len(texts), 2)
+    )
+    return {"elapsed": elapsed, "ordered": ordered}
+
+
+UPDATE_MODES = ("sequential", "parallel", "user_queue")
+UPDATE_TITLES = {"sequential": "по одному (как раньше)", "parallel": "256 параллельно, без очереди пользователя",
+                 "user_queue": "UserUpdateProcessor"}
+
+
+def _update_processor(mode: str):
+    from telegram.ext import SimpleUpdateProcessor
+
+    from backpressure import UserUpdateProcessor
+
+    if mode == "sequential":
+        return SimpleUpdateProcessor(1)
+    if mode == "parallel":
+        return SimpleUpdateProcessor(256)
+    return UserUpdateProcessor()
+
+
+def _recording_request(latency: float):
+    """FakeBotRequest, который запоминает время и текст каждого sendMessage."""
+    from loadgen import FakeBotRequest
+
+    class RecordingRequest(FakeBotRequest):
+        def __init__(self):
+            super().__init__(latency)
+            self.messages = []  # (время, chat_id, текст)
+
+        def _result(self, name, params):
+            if name == "sendMessage":
+                self.messages.append((time.perf_counter(), params.get("chat_id"), params.get("text")))
+            return super()._result(name, params)
+
+    return RecordingRequest()
+
+
+async def _bench_updates(mode: str, users: int, first_user_id: int, latency: float, think: float) -> dict:
+    """
+    Пользователи проходят воронку через очередь приложения: следующее сообщение — через think секунд
+    после предыдущего, дату рождения и кнопки подтверждения отправляют дважды подряд.
+    """
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    import db
+    import main
+    import models
+    from loadgen import UpdateFactory, fake_file_client
+    from media import media_queue
+    from metrics import UPDATES_SHED
+
+    shed_before = UPDATES_SHED.value("queue") + UPDATES_SHED.value("user")
+    request = _recording_request(latency)
+    builder = ApplicationBuilder().token("123:TEST").request(request).updater(None)
+    app = main.build_application(builder, persistence_file=None, scheduled_jobs=False, metrics_port=0,
+                                 update_processor=_update_processor(mode))
+    errors = []
+
+    async def on_error(update, context):
+        errors.append(context.error)
+
+    app.add_error_handler(on_error)
+    factory = UpdateFactory()
+
+    async def user(user_id: int) -> None:
+        for data in factory.funnel(user_id):
+            message = data.get("message", {})
+            double = "callback_query" in data or message.get("text") == "01.02.1995"
+            app.update_queue.put_nowait(Update.de_json(data, app.bot))
+            if double:
+                repeat = factory.callback(user_id, data["callback_query"]["data"]) if "callback_query" in data \
+                    else factory.text(user_id, message["text"])
+                app.update_queue.put_nowait(Update.de_json(repeat, app.bot))
+            await asyncio.sleep(think)
+
+    media_queue.use_client(fake_file_client())
+    async with app:
+        await app.post_init(app)
+        await app.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(user(user_id) for user_id in range(first_user_id, first_user_id + users)))
+        await app.update_queue.join()
+        elapsed = time.perf_counter() - started
+        await app.stop()
+    await app.post_shutdown(app)
+
+    with db.session_scope() as session:
+        completed = session.query(models.Teacher).filter(
+            models.Teacher.id >= first_user_id, models.Teacher.id < first_user_id + users,
+            models.Teacher.stage == models.TeacherStage.ADDRESS_CONFIRMED
+        ).count()
+    return {"elapsed": elapsed, "errors": len(errors), "completed": completed,
+            "already": sum(text.startswith("Вы уже проходили") for _, _, text in request.messages),
+            "shed": UPDATES_SHED.value("queue") + UPDATES_SHED.value("user") - shed_before}
+
+
+async def _bench_flood(mode: str, updates: int, latency: float) -> dict:
+    """Лавина /start от разных пользователей: через сколько отвечают и сколько ждут в очереди."""
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    import main
+    from loadgen import UpdateFactory
+    from text import BUSY_TEXT
+
+    request = _recording_request(latency)
+    builder = ApplicationBuilder().token("123:TEST").request(request).updater(None)
+    app = main.build_application(builder, persistence_file=None, scheduled_jobs=False, metrics_port=0,
+                                 update_processor=_update_processor(mode))
+    factory = UpdateFactory()
+    async with app:
+        await app.post_init(app)
+        await app.start()
+        started = time.perf_counter()
+        for i in range(updates):
+            app.update_queue.put_nowait(Update.de_json(factory.text(5_000_000 + i, "/start"), app.bot))
+        await app.update_queue.join()
+        await app.stop()
+    await app.post_shutdown(app)
+    served = [sent - started for sent, _, text in request.messages if text != BUSY_TEXT]
+    return {"served": served, "busy": sum(text == BUSY_TEXT for _, _, text in request.messages)}
+
+
+def run_updates_scenario(args) -> None:
+    import logging
+
+    use_temp_database()
+    import models
+    models.create_database()
+    logging.getLogger("telegram").setLevel(logging.CRITICAL)  # Ошибки обработчиков считаем сами
+
+    for index, mode in enumerate(UPDATE_MODES):
+        result = asyncio.run(_bench_updates(mode, args.users, 1_000_000 * (index + 1), args.latency, args.think))
+        print(f"--- {UPDATE_TITLES[mode]}: {args.users} пользователей за {result['elapsed']:.2f}s, "
+              f"прошли воронку {result['completed']}, ошибок {result['errors']}, "
+              f"ложных \"уже проходили\" {result['already']}, отброшено {result['shed']}")
+
+    for mode in ("parallel", "user_queue"):
+        result = asyncio.run(_bench_flood(mode, args.flood, args.latency))
+        print(f"--- лавина {args.flood} /start, {UPDATE_TITLES[mode]}: ответили {len(result['served'])}, "
+              f"\"подождите\" {result['busy']}")
+        print(format_latency("ответ на /start", result["served"]))
+
+
+def run_workers_scenario(args) -> None:
+    use_temp_database()
+    os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="botum-bench-"), "states.db")
+    os.chdir(tempfile.mkdtemp(prefix="botum-bench-"))
+    import models
+    models.create_database()
+
+    for workers in args.workers:
+        result = asyncio.run(_bench_workers(workers, args.updates, args.users))
+        print(f"процессов {workers}: {args.updates} обновлений за {result['elapsed']:.2f}s "
+              f"({args.updates / result['elapsed']:.0f} обновлений/с), порядок сохранен: {result['ordered']}")
+
+
+# ============================ СЦЕНАРИЙ: ВОРОНКА ЦЕЛИКОМ ============================
+
+def run_funnel_scenario(args) -> None:
+    import json
+
+    use_temp_database()
+    os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="botum-bench-"), "states.db")
+    os.chdir(tempfile.mkdtemp(prefix="botum-bench-"))  # Сюда же загрузятся видео
+    import loadgen
+    import models
+    models.create_database()
+
+    report = asyncio.run(loadgen.replay_funnel(args.users, args.concurrency, args.latency, think=args.think))
+    print(f"{report['users']} пользователей (одновременно до {report['concurrency']}, пауза {report['think']:g}s) "
+          f"за {report['elapsed']:.2f}s, "
+          f"{report['updates_per_sec']:.0f} обновлений/с, пик памяти {report['peak_memory_mb']:.1f} MiB")
+    print(f"БД: {report['db']['queries']} запросов, {report['db']['total_ms']:.0f}ms суммарно")
+    for name, stats in report["handlers"].items():
+        print(f"{name:<28} n={stats['count']:<6} p50={stats['p50_ms']:8.2f}ms "
+              f"p95={stats['p95_ms']:8.2f}ms p99={stats['p99_ms']:8.2f}ms")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            regressions = loadgen.compare_reports(report, json.load(fh), args.tolerance)
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+# ============================ СЦЕНАРИЙ: ВЫГРУЗКА ДЛЯ HR ============================
+
+def run_export_scenario(args) -> None:
+    import threading
+
+    use_temp_database()
+    import db
+    import export
+    import answers
+    import models
+
+    models.create_database()
+    registered = datetime.utcnow() - timedelta(days=30)
+    rows = [
+        {"id": i, "full_name": "Иванов Иван Иванович", "city": random.choice(("Москва", "Казань", "Омск")), "birth_date": date(1990, 1, 1),
+         "registration_time": registered + timedelta(seconds=i), "stage": 1 + i % 3,
+         "interview": answers.pack_answers({key: "2 года" for key, _ in answers.INTERVIEW_QUESTIONS}),
+         "address": "Москва, ул. Ленина, 1" if i % 3 == 2 else None}
+        for i in range(1, args.rows + 1)
+    ]
+    with db.engine.begin() as connection:
+        connection.execute(models.Teacher.__table__.insert(), rows)
+    del rows
+
+    directory = tempfile.mkdtemp(prefix="botum-bench-")
+    for fmt in export.FORMATS:
+        # Параллельно с выгрузкой бот продолжает записывать анкеты
+        stop = threading.Event()
+        commits = []
+
+        def writer(first_id):
+            user_id = first_id
+            while not stop.is_set():
+                started = time.perf_counter()
+                with db.session_scope() as session:
+                    session.add(models.Teacher(id=user_id, full_name="Петров Петр Петрович", city="Омск",
+                                               birth_date=date(1990, 1, 1)))
+                commits.append(time.perf_counter() - started)
+                user_id += 1
+                time.sleep(0.005)
+
+        thread = threading.Thread(target=writer, args=(10 ** 7 * (export.FORMATS.index(fmt) + 1),))
+        thread.start()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            count = export.export_teachers(os.path.join(directory, f"teachers.{fmt}"), fmt)
+        except RuntimeError as e:
+            print(f"{fmt}: {e}")
+            count = None
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stop.set()
+        thread.join()
+        if count is not None:
+            print(f"--- {fmt}: {count} строк за {elapsed:.2f}s ({count / elapsed:.0f} строк/с), "
+                  f"пик памяти {peak / 1024 / 1024:.1f} MiB")
+            print(format_latency("коммит анкеты во время выгрузки", commits))
+
+
+# ============================ СЦЕНАРИЙ: ПОИСК ============================
+
+_SEARCH_WORDS = (
+    "робототехника", "робототехнике", "arduino", "lego", "scratch", "python", "кружок", "школе", "детьми",
+    "вожатым", "лагере", "олимпиады", "физика", "математика", "программирование", "конструктор", "студент",
+    "репетитор", "вечером", "выходные", "часов", "учитель", "информатики", "проекты", "соревнования",
+)
+_SEARCH_QUERIES = (
+    ("частое слово", "робототехника", None),
+    ("два слова", "arduino lego", None),
+    ("редкое слово", "олимпиады", None),
+    ("слово + город", "scratch", "Омск"),
+    ("только город", "", "Казань"),
+)
+
+
+def run_search_scenario(args) -> None:
+    from sqlalchemy import text
+
+    use_temp_database()
+    import db
+    import answers
+    import models
+    import search
+
+    models.create_database()
+    rng = random.Random(1)
+    cities = ("Москва", "Казань", "Омск", "Нижний Новгород", "Ростов-на-Дону")
+    # Частота слов убывает к концу списка: первые встречаются почти в каждой анкете, последние — реже.
+    # Словарь намеренно мал, поэтому почти любое слово совпадает с десятками тысяч анкет (худший случай)
+    weights = [1 / (rank + 1) for rank in range(len(_SEARCH_WORDS))]
+    rows = []
+    for i in range(1, args.rows + 1):
+        values = {key: " ".join(rng.choices(_SEARCH_WORDS, weights, k=4)) for key, _ in answers.INTERVIEW_QUESTIONS}
+        rows.append({
+            "id": i, "full_name": "Иванов Иван Иванович", "city": rng.choice(cities), "birth_date": date(1990, 1, 1),
+            "stage": 1 + i % 3, "interview": answers.pack_answers(values), "answers": answers.answers_text(values),
+            "address": f"ул. Ленина, {i % 200}" if i % 3 == 2 else None,
+        })
+    with db.engine.begin() as connection:
+        connection.execute(models.Teacher.__table__.insert(), rows)
+    started = time.perf_counter()
+    with db.engine.begin() as connection:
+        for offset in range(0, len(rows), 5000):
+            connection.execute(search.INDEX_SQL, [
+                search.index_row(row["id"], row["city"], row["answers"], row["address"])
+                for row in rows[offset:offset + 5000]
+            ])
+    print(f"индекс по {len(rows)} анкетам построен за {time.perf_counter() - started:.1f}s")
+    del rows
+
+    # Обновление одной анкеты вместе с индексом, как в repository._save_interview
+    commits = []
+    for user_id in range(1, 201):
+        started = time.perf_counter()
+        with db.session_scope() as session:
+            teacher = session.get(models.Teacher, user_id)
+            teacher.interview = answers.pack_answers({"experience_robo": "arduino и scratch"})
+            search.index_teacher(session, teacher)
+        commits.append(time.perf_counter() - started)
+    print(format_latency("коммит анкеты с индексом", commits))
+
+    with db.session_scope() as session:
+        for name, query, city in _SEARCH_QUERIES:
+            for page in (0, 10):
+                latencies = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    result = search._search(session, query, city, page)
+                    latencies.append(time.perf_counter() - started)
+                print(format_latency(f"{name}, стр. {page + 1}", latencies) +
+                      f"  найдено {len(result.results)}")
+
+        # Для сравнения: тот же поиск перебором текстов ответов. teachers.interview — сжатый JSON,
+        # LIKE по нему не работает, поэтому перебираются тексты, которые хранит сам индекс
+        word = search.query_stems(_SEARCH_QUERIES[2][1])[0]
+        params = {"pattern": f"%{word}%", "limit": search.SEARCH_PAGE_SIZE, "offset": 10 * search.SEARCH_PAGE_SIZE}
+        started = time.perf_counter()
+        session.execute(text(
+            "SELECT rowid FROM teacher_search WHERE answers LIKE :pattern ORDER BY rowid LIMIT :limit OFFSET :offset"
+        ), params).all()
+        print(f"LIKE '%{word}%' без индекса, стр. 11: {(time.perf_counter() - started) * 1000:.1f}ms")
+        started = time.perf_counter()
+        session.execute(text("SELECT count(*) FROM teacher_search WHERE answers LIKE :pattern"), params).scalar()
+        print(f"LIKE '%{word}%' без индекса, все совпадения: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+# ============================ СЦЕНАРИЙ: ХРАНЕНИЕ ОТВЕТОВ ============================
+
+def run_interview_scenario(args) -> None:
+    """Размер teachers и скорость чтения: сводка текстом (до миграции 4) против ответов в interview."""
+    use_temp_database()
+    import db
+    import answers
+    import migrations
+    import models
+
+    models.create_database()
+    rng = random.Random(1)
+    words = ("опыт", "дети", "школа", "кружок", "робототехника", "arduino", "lego", "вечером", "выходные",
+             "занимался", "проектами", "студент", "учитель", "физики", "умею", "объяснять", "года")
+    rows = []
+    for i in range(1, args.rows + 1):
+        # Чаще короткие ответы, у каждой пятой анкеты — развернутый рассказ об опыте
+        values = {key: " ".join(rng.choices(words, k=rng.randint(1, 6))) for key, _ in answers.INTERVIEW_QUESTIONS}
+        if i % 5 == 0:
+            values["experience_kids"] = " ".join(rng.choices(words, k=rng.randint(40, 120)))
+        rows.append({"id": i, "full_name": "Иванов Иван Иванович", "city": "Москва", "birth_date": date(1990, 1, 1),
+                     "stage": 2, "text_interview": answers.render_answers(values), "address": None})
+    with db.engine.begin() as connection:
+        connection.execute(models.Teacher.__table__.insert(), rows)
+    del rows
+
+    def measure(title):
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+            size = connection.exec_driver_sql("SELECT sum(pgsize) FROM dbstat WHERE name = 'teachers'").scalar()
+            # Полный проход по таблице: address хранится после ответов, поэтому читается вся строка
+            scan = min(_timed(lambda: connection.exec_driver_sql(
+                "SELECT count(*) FROM teachers WHERE address IS NOT NULL").scalar()) for _ in range(5))
+            started = time.perf_counter()
+            for interview_data, text_interview in connection.exec_driver_sql(
+                    "SELECT interview, text_interview FROM teachers"):
+                answers.stored_summary(interview_data, text_interview)
+            render = time.perf_counter() - started
+        print(f"{title:<22} teachers {size / 1024 / 1024:7.1f} MiB ({size / args.rows:6.0f} B/анкету), "
+              f"полный проход {scan * 1000:6.1f}ms, сводки всех анкет {render * 1000:6.0f}ms")
+
+    measure("текст сводки")
+    started = time.perf_counter()
+    with db.engine.begin() as connection:
+        migrations._interview_answers(connection)
+    print(f"миграция 4: {time.perf_counter() - started:.1f}s")
+    measure("ответы в interview")
+
+
+def _timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+# ============================ СЦЕНАРИЙ: ОЦЕНКА КАНДИДАТОВ ============================
+
+def run_scoring_scenario(args) -> None:
+    """Полный пересчет оценок, повторный проход без изменений и после изменения части анкет."""
+    use_temp_database()
+    import answers
+    import db
+    import models
+    import scoring
+
+    models.create_database()
+    rng = random.Random(1)
+    kids = ("вожатым в лагере", "вел кружок в школе", "репетитор по математике", "своих детей двое", "нет опыта",
+            "преподавал информатику младшим классам")
+    robo = ("Arduino и немного электроники", "Lego Mindstorms EV3", "программирую на Python", "нет", "собирал роботов",
+            "Scratch с детьми")
+    cities = ("Москва", "Казань", "Омск", "Нижний Новгород", "Ростов-на-Дону")
+    free_time = ("по 3 часа в день", "выходные", "10 часов в неделю", "вечером", "в любое время", "2-3 часа")
+
+    def random_answers():
+        return {"experience_kids": " и ".join(rng.sample(kids, rng.randint(1, 3))),
+                "experience_robo": " и ".join(rng.sample(robo, rng.randint(1, 2))),
+                "interview_city": rng.choice(cities + ("Центральный район", "любой район")),
+                "free_time": rng.choice(free_time), "best_skills": "объяснять сложное просто"}
+
+    rows = [{"id": i, "full_name": "Иванов Иван Иванович", "city": rng.choice(cities), "birth_date": date(1990, 1, 1),
+             "stage": 2, "interview": answers.pack_answers(random_answers())} for i in range(1, args.rows + 1)]
+    jobs = models.ScoringJob.__table__
+
+    def enqueue(connection, teacher_ids):
+        # Как repository._save_interview: сохраненные ответы ставят анкету в очередь оценки
+        now = datetime.utcnow()
+        connection.execute(jobs.insert().prefix_with("OR REPLACE"),
+                           [{"teacher_id": teacher_id, "queued_at": now} for teacher_id in teacher_ids])
+
+    with db.engine.begin() as connection:
+        connection.execute(models.Teacher.__table__.insert(), rows)
+        enqueue(connection, [row["id"] for row in rows])
+    del rows
+
+    def update(title, full=False):
+        after_id, total, done = 0, 0, False
+        started = time.perf_counter()
+        while not done:
+            with db.session_scope() as session:
+                if full:
+                    after_id, scored = scoring._score_page(session, after_id, scoring.SCORING_BATCH_SIZE)
+                    done = after_id is None
+                else:
+                    fetched, scored = scoring._score_queued(session, scoring.SCORING_BATCH_SIZE)
+                    done = fetched < scoring.SCORING_BATCH_SIZE
+            total += scored
+        elapsed = time.perf_counter() - started
+        print(f"{title:<32} пересчитано {total:>7} за {elapsed:6.3f}s")
+
+    update("первый расчет")
+    update("повторно, без изменений")
+    changed = rng.sample(range(1, args.rows + 1), int(args.rows * args.changed))
+    with db.engine.begin() as connection:
+        connection.execute(
+            models.Teacher.__table__.update().where(models.Teacher.id == bindparam("teacher_id"))
+            .values(interview=bindparam("packed")),
+            [{"teacher_id": teacher_id, "packed": answers.pack_answers(random_answers())} for teacher_id in changed]
+        )
+        enqueue(connection, changed)
+    update(f"изменено {len(changed)} анкет")
+    with db.engine.begin() as connection:
+        enqueue(connection, changed)
+    update("те же анкеты, ответы те же")
+    update("все заново (--full)", full=True)
+
+    # Только вычисление признаков, без чтения и записи базы
+    batch = [random_answers() for _ in range(scoring.SCORING_BATCH_SIZE)]
+    batch_cities = [rng.choice(cities) for _ in batch]
+    elapsed = min(_timed(lambda: scoring.score_batch(scoring._Vocabulary(), batch, batch_cities)) for _ in range(5))
+    print(f"признаки пачки из {len(batch)} анкет: {elapsed * 1000:.1f}ms ({elapsed / len(batch) * 1e6:.1f}us на анкету)")
+
+    with db.session_scope() as session:
+        for city in (None, "Омск"):
+            latencies = [_timed(lambda: scoring._top_candidates(session, 20, city)) for _ in range(20)]
+            print(format_latency(f"лучшие 20{', ' + city if city else ''}", latencies))
+
+
+# ============================ СЦЕНАРИЙ: КОМАНДЫ СОТРУДНИКОВ ============================
+
+def run_admin_scenario(args) -> None:
+    """Страницы /pending по ключу против OFFSET, /stats по счетчикам против COUNT(*), цена счетчиков при записи."""
+    use_temp_database()
+    import admin
+    import db
+    import migrations
+    import models
+    import repository
+
+    models.create_database()
+    rng = random.Random(1)
+    cities = ("Москва", "Санкт-Петербург", "Казань", "Омск", "Самара", "Нижний Новгород")
+    started_at = datetime(2025, 1, 1)
+    rows = [{"id": i, "full_name": "Иванов Иван Иванович", "city": rng.choice(cities), "birth_date": date(1990, 1, 1),
+             "stage": rng.choice((1, 2, 2, 3)), "registration_time": started_at + timedelta(seconds=i * 60)}
+            for i in range(1, args.rows + 1)]
+    with db.engine.begin() as connection:
+        connection.execute(models.Teacher.__table__.insert(), rows)
+        started = time.perf_counter()
+        migrations._teacher_counters(connection)
+        print(f"миграция 6 (подсчет счетчиков): {(time.perf_counter() - started) * 1000:.0f}ms")
+    del rows
+
+    teacher = models.Teacher
+    with db.session_scope() as session:
+        for title, stats in (
+                ("/stats: COUNT(*) по teachers", lambda: session.execute(
+                    select(teacher.city, teacher.stage, func.count()).group_by(teacher.city, teacher.stage)).all()),
+                ("/stats: teacher_counters", lambda: admin._stats(session))):
+            print(format_latency(title, [_timed(stats) for _ in range(20)]))
+
+        # Листаем /pending до конца: OFFSET перечитывает все пропущенные строки, ключ продолжает индекс
+        pages, before, keyset = 0, None, []
+        while True:
+            page_started = time.perf_counter()
+            page = admin._pending_page(session, before)
+            keyset.append(time.perf_counter() - page_started)
+            pages += 1
+            if not page.older or pages == args.pages:
+                break
+            before = (page.rows[-1].registration_time, page.rows[-1].id)
+        offset_query = (
+            select(teacher.id, teacher.full_name, teacher.city, teacher.registration_time)
+            .where(teacher.stage == models.TeacherStage.INTERVIEWED)
+            .order_by(teacher.registration_time.desc(), teacher.id.desc()).limit(admin.ADMIN_PAGE_SIZE + 1)
+        )
+        offsets = [_timed(lambda: session.execute(offset_query.offset(number * admin.ADMIN_PAGE_SIZE)).all())
+                   for number in range(pages)]
+        print(format_latency(f"/pending по ключу, {pages} страниц", keyset))
+        print(format_latency(f"/pending через OFFSET, {pages} страниц", offsets))
+        print(f"последняя страница: по ключу {keyset[-1] * 1000:.2f}ms, OFFSET {offsets[-1] * 1000:.2f}ms")
+
+    # Цена счетчиков при записи: перевод анкеты на следующий этап с обновлением счетчиков и без
+    sample = rng.sample(range(1, args.rows + 1), 2000)
+    for title, move in (("этап без счетчиков", lambda *a: None), ("этап со счетчиками", repository._move_counter)):
+        with db.session_scope() as session:
+            started = time.perf_counter()
+            for teacher_id in sample:
+                row = session.get(teacher, teacher_id)
+                stage, row.stage = row.stage, min(row.stage + 1, 3)
+                session.flush()  # В repository.py анкету сбрасывает в базу запись поискового индекса
+                move(session, row.city, stage, row.stage)
+            elapsed = time.perf_counter() - started
+            session.rollback()
+        print(f"{title:<22} {elapsed / len(sample) * 1e6:6.0f}us на анкету")
+
+
+# ============================ СЦЕНАРИЙ: АНАЛИТИКА ВОРОНКИ ============================
+
+def run_analytics_scenario(args) -> None:
+    use_temp_database()
+    import analytics
+    import db
+    import models
+    from sqlalchemy import func
+
+    models.create_database()
+    cities = ("Москва", "Казань", "Омск", "Самара")
+    started_day = datetime.utcnow() - timedelta(days=30)
+    events = []
+    for user_id in range(args.users):
+        moment = started_day + timedelta(seconds=user_id * 30 * 86400 // args.users)
+        # Каждый следующий шаг проходит примерно 80% пользователей
+        depth = next((i for i in range(1, len(analytics.FUNNEL_STEPS)) if random.random() > 0.8),
+                     len(analytics.FUNNEL_STEPS))
+        for index, step in enumerate(analytics.FUNNEL_STEPS[:depth]):
+            city = cities[user_id % len(cities)] if step == analytics.FunnelStep.SURVEY_DONE else None
+            events.append((user_id, step, city, moment + timedelta(minutes=index)))
+
+    started = time.perf_counter()
+    for first in range(0, len(events), 5000):
+        with db.session_scope() as session:
+            analytics._apply_events(session, events[first:first + 5000])
+    elapsed = time.perf_counter() - started
+    print(f"{len(events)} событий записано за {elapsed:.2f}s ({len(events) / elapsed:.0f} событий/с)")
+
+    with db.session_scope() as session:
+        latencies = []
+        for _ in range(20):
+            started = time.perf_counter()
+            analytics._funnel_report(session, city="Москва", cohort_from=(started_day + timedelta(days=7)).date())
+            latencies.append(time.perf_counter() - started)
+        print(format_latency("отчет по агрегатам", latencies))
+
+        latencies = []
+        for _ in range(3):
+            # Тот же вопрос без агрегатов: по журналу событий
+            started = time.perf_counter()
+            session.query(models.FunnelEvent.step, func.count(func.distinct(models.FunnelEvent.user_id))).group_by(
+                models.FunnelEvent.step
+            ).all()
+            latencies.append(time.perf_counter() - started)
+        print(format_latency("GROUP BY по журналу", latencies))
+
+
+# ============================ СЦЕНАРИЙ: ЗАПУСК ============================
+
+def run_startup_scenario(args) -> None:
+    import subprocess
+
+    path = use_temp_database()
+    import db
+    import migrations
+
+    migrations.migrate()
+    # Сам SQLAlchemy импортируется заранее: замеряется только то, что добавляет models
+    probe = ("import time, sqlalchemy.orm; started = time.perf_counter(); import models; "
+             "print(time.perf_counter() - started)")
+    imports = [float(subprocess.check_output([sys.executable, "-c", probe], cwd=os.path.dirname(__file__) or ".",
+                                             env=os.environ).decode().split()[-1]) for _ in range(args.runs)]
+    print(format_latency("import models", imports))
+
+    checks, full = [], []
+    for _ in range(args.runs):
+        engine = db.make_engine(f"sqlite:///{path}")
+        started = time.perf_counter()
+        migrations.migrate(engine)  # Схема актуальна: только PRAGMA user_version
+        checks.append(time.perf_counter() - started)
+        with engine.begin() as connection:
+            # Что раньше делал каждый импорт models: create_all и чтение схемы teachers
+            started = time.perf_counter()
+            migrations._initial_schema(connection)
+            full.append(time.perf_counter() - started)
+        engine.dispose()
+    print(format_latency("проверка версии схемы", checks))
+    print(format_latency("create_all + чтение схемы", full))
+
+
+# ============================ СЦЕНАРИЙ: ХОЛОДНЫЙ СТАРТ БОТА ============================
+
+# Процесс бота без сети: Bot API отвечает только на getMe. Печатает строку, когда бот готов
+# начать polling (после post_init), и еще одну — когда выполнен первый запрос к базе.
+_BOOT_PROBE = """
+import asyncio, json, sys
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest
+import main
+
+class Offline(BaseRequest):
+    read_timeout = None
+    async def initialize(self): pass
+    async def shutdown(self): pass
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = {"id": 1, "is_bot": True, "first_name": "BotUM", "username": "botum_test_bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+async def boot():
+    builder = ApplicationBuilder().token("123:TEST").request(Offline()).get_updates_request(Offline())
+    app = main.build_application(builder, persistence_file=None, scheduled_jobs=False, metrics_port=0)
+    await app.initialize()
+    await app.post_init(app)
+    print("ready", flush=True)
+    from repository import teachers
+    await teachers.get_profile(1)
+    print("db", flush=True)
+    await app.post_shutdown(app)
+    await app.shutdown()
+
+asyncio.run(boot())
+"""
+
+
+def _import_profile(module: str) -> tuple:
+    """
+    Запускает python -X importtime и разбирает отчет.
+    :return: (полное время импорта module в секундах, [(время, модуль)] для его прямых импортов)
+    """
+    import subprocess
+
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.dirname(__file__) or ".", env=os.environ, capture_output=True,
+                            text=True, check=True).stderr
+    total, children, pending = 0.0, [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        pending.append((depth, int(cumulative) / 1e6, name.strip()))
+    # Модуль печатается после всех своих импортов: его прямые импорты — строки глубиной 1 перед ним
+    for index, (depth, cumulative, name) in enumerate(pending):
+        if depth == 0 and name == module:
+            total = cumulative
+            start = index
+            while start > 0 and pending[start - 1][0] > 0:
+                start -= 1
+            children = sorted(((c, n) for d, c, n in pending[start:index] if d == 1), reverse=True)
+    return total, children
+
+
+def run_boot_scenario(args) -> None:
+    import subprocess
+
+    use_temp_database()
+    total, children = _import_profile("main")
+    print(f"import main: {total * 1000:.0f}ms, самые тяжелые прямые импорты:")
+    for cumulative, name in children[:args.top]:
+        print(f"    {name:<24} {cumulative * 1000:8.1f}ms")
+
+    ready, first_query = [], []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-c", _BOOT_PROBE], cwd=os.path.dirname(__file__) or ".",
+                                   env=os.environ, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for line in process.stdout:
+            if line.strip() == "ready":
+                ready.append(time.perf_counter() - started)
+            elif line.strip() == "db":
+                first_query.append(time.perf_counter() - started)
+        if process.wait() != 0:
+            raise RuntimeError("Бот не запустился, запустите пробу вручную, чтобы увидеть ошибку")
+    print(format_latency("запуск -> готов к polling", ready))
+    print(format_latency("запуск -> первый запрос к БД", first_query))
+
+
+# ============================ СЦЕНАРИЙ: СТАТИЧЕСКИЕ ОБЪЕКТЫ ============================
+
+def run_assets_scenario(args) -> None:
+    """Стоимость на одно сообщение: сборка на лету (как раньше) против готовых объектов из assets.py."""
+    import re
+    import timeit
+    from types import SimpleNamespace
+
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+    import assets
+    import answers
+
+    cities = list(assets.CITIES)
+    name = SimpleNamespace(text="Иванов Иван Иванович")
+    birth = SimpleNamespace(text="01.02.1995")
+    city = SimpleNamespace(text="Ростов-на-Дону")
+    typed_city = SimpleNamespace(text="ростов на дону")  # Раньше такой ответ отклонялся
+    user_data = {"experience_kids": "2 года", "experience_robo": "LEGO", "interview_city": "Москва",
+                 "free_time": "вечером", "best_skills": "объяснять"}
+
+    def legacy_summary():
+        return (
+            f"Опыт взаимодействия с младшими школьниками: {user_data.get('experience_kids')}\n"
+            f"Опыт в робототехнике: {user_data.get('experience_robo')}\n"
+            f"Города для работы: {user_data.get('interview_city')}\n"
+            f"Свободное время: {user_data.get('free_time')}\n"
+            f"Лучшие навыки: {user_data.get('best_skills')}\n"
+        )
+
+    def legacy_confirm_markup():
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ Подтвердить", callback_data="interview_confirm")],
+            [InlineKeyboardButton("❌ Отклонить", callback_data="interview_reject")]
+        ])
+
+    cases = (
+        ("проверка ФИО",
+         lambda: re.match(r'^[А-ЯЁ][а-яё]+\s[А-ЯЁ][а-яё]+\s[А-ЯЁ][а-яё]+$', name.text.strip()),
+         lambda: assets.full_name_answer(name)),
+        ("проверка даты рождения",
+         lambda: re.match(r'^\d{2}\.\d{2}\.\d{4}$', birth.text.strip())
+         and datetime.strptime(birth.text.strip(), '%d.%m.%Y').date(),
+         lambda: assets.birth_date_answer(birth)),
+        ("проверка города", lambda: city.text.strip() in cities, lambda: assets.city_answer(city)),
+        ("город в другом написании", lambda: typed_city.text.strip() in cities, lambda: assets.city_answer(typed_city)),
+        ("клавиатура городов",
+         lambda: ReplyKeyboardMarkup([[c] for c in cities], one_time_keyboard=True, resize_keyboard=True),
+         lambda: assets.CITIES_MARKUP),
+        ("кнопки подтверждения", legacy_confirm_markup, lambda: assets.INTERVIEW_CONFIRM_MARKUP),
+        ("сводка ответов", legacy_summary, lambda: answers.render_answers(user_data)),
+    )
+    print(f"{'операция':<24} {'раньше':>10} {'assets':>10}")
+    for title, before, after in cases:
+        before_us = min(timeit.repeat(before, number=args.number, repeat=5)) / args.number * 1e6
+        after_us = min(timeit.repeat(after, number=args.number, repeat=5)) / args.number * 1e6
+        print(f"{title:<24} {before_us:8.2f}us {after_us:8.2f}us")
+
+
+# ============================ ЗАПУСК ============================
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочные замеры бота")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    db_parser = subparsers.add_parser("db", help="конкурентные коммиты анкет")
+    db_parser.add_argument("--users", type=int, default=300)
+    db_parser.add_argument("--min-speedup-legacy", type=float, default=5,
+                           help="во сколько раз пачки должны обгонять старый обработчик")
+    db_parser.add_argument("--min-speedup-pool", type=float, default=2.5,
+                           help="во сколько раз пачки должны обгонять run_db")
+    db_parser.set_defaults(func=run_db_scenario)
+
+    states_parser = subparsers.add_parser("states", help="память на спящих пользователей")
+    states_parser.add_argument("--users", type=int, default=100_000)
+    states_parser.add_argument("--changed", type=float, default=0.01, help="доля user_data, изменившихся за интервал")
+    states_parser.add_argument("--finished", type=float, default=0.7, help="доля закончивших анкету")
+    states_parser.set_defaults(func=run_states_scenario)
+
+    reminders_parser = subparsers.add_parser("reminders", help="рассылка напоминаний")
+    reminders_parser.add_argument("--users", type=int, default=2000)
+    reminders_parser.add_argument("--rate", type=float, default=1000)
+    reminders_parser.add_argument("--pending", type=int, default=100_000, help="напоминаний, время которых не пришло")
+    reminders_parser.set_defaults(func=run_reminders_scenario)
+
+    sqlite_parser = subparsers.add_parser("sqlite", help="одновременные чтения и записи teachers.db")
+    sqlite_parser.add_argument("--users", type=int, default=20_000)
+    sqlite_parser.add_argument("--writers", type=int, default=4)
+    sqlite_parser.add_argument("--readers", type=int, default=2)
+    sqlite_parser.add_argument("--duration", type=float, default=5)
+    sqlite_parser.add_argument("--timeout", type=float, default=5, help="таймаут pysqlite для движка по умолчанию")
+    sqlite_parser.set_defaults(func=run_sqlite_scenario)
+
+    media_parser = subparsers.add_parser("media", help="одновременная загрузка видео-кружков")
+    media_parser.add_argument("--videos", type=int, default=100)
+    media_parser.set_defaults(func=run_media_scenario)
+
+    transport_parser = subparsers.add_parser("transport", help="polling против вебхука на локальном Bot API")
+    transport_parser.add_argument("--updates", type=int, default=2000)
+    transport_parser.add_argument("--rate", type=float, default=100)
+    transport_parser.set_defaults(func=run_transport_scenario)
+
+    workers_parser = subparsers.add_parser("workers", help="обработка в нескольких процессах")
+    workers_parser.add_argument("--updates", type=int, default=2000)
+    workers_parser.add_argument("--users", type=int, default=200)
+    workers_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    workers_parser.set_defaults(func=run_workers_scenario)
+
+    updates_parser = subparsers.add_parser("updates", help="очередь обновлений: порядок, двойные нажатия, лавина")
+    updates_parser.add_argument("--users", type=int, default=100)
+    updates_parser.add_argument("--think", type=float, default=0.2, help="пауза пользователя между сообщениями")
+    updates_parser.add_argument("--flood", type=int, default=5000, help="обновлений в лавине")
+    updates_parser.add_argument("--latency", type=float, default=0.01, help="задержка Bot API, секунды")
+    updates_parser.set_defaults(func=run_updates_scenario)
+
+    export_parser = subparsers.add_parser("export", help="потоковая выгрузка анкет при работающем боте")
+    export_parser.add_argument("--rows", type=int, default=200_000)
+    export_parser.set_defaults(func=run_export_scenario)
+
+    search_parser = subparsers.add_parser("search", help="полнотекстовый поиск по анкетам против LIKE")
+    search_parser.add_argument("--rows", type=int, default=300_000)
+    search_parser.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса")
+    search_parser.set_defaults(func=run_search_scenario)
+
+    interview_parser = subparsers.add_parser("interview", help="размер анкет и скорость чтения ответов собеседования")
+    interview_parser.add_argument("--rows", type=int, default=200_000)
+    interview_parser.set_defaults(func=run_interview_scenario)
+
+    scoring_parser = subparsers.add_parser("scoring", help="пакетная оценка кандидатов и пересчет только измененных")
+    scoring_parser.add_argument("--rows", type=int, default=200_000)
+    scoring_parser.add_argument("--changed", type=float, default=0.01, help="доля анкет, измененных между проходами")
+    scoring_parser.set_defaults(func=run_scoring_scenario)
+
+    admin_parser = subparsers.add_parser("admin", help="страницы /pending по ключу и счетчики /stats")
+    admin_parser.add_argument("--rows", type=int, default=300_000)
+    admin_parser.add_argument("--pages", type=int, default=0, help="сколько страниц /pending пролистать (0 — все)")
+    admin_parser.set_defaults(func=run_admin_scenario)
+
+    analytics_parser = subparsers.add_parser("analytics", help="запись событий воронки и отчеты по агрегатам")
+    analytics_parser.add_argument("--users", type=int, default=50_000)
+    analytics_parser.set_defaults(func=run_analytics_scenario)
+
+    startup_parser = subparsers.add_parser("startup", help="стоимость импорта models и проверки схемы")
+    startup_parser.add_argument("--runs", type=int, default=10)
+    startup_parser.set_defaults(func=run_startup_scenario)
+
+    boot_parser = subparsers.add_parser("boot", help="профиль импортов и время до готовности бота")
+    boot_parser.add_argument("--runs", type=int, default=10)
+    boot_parser.add_argument("--top", type=int, default=12, help="сколько тяжелых импортов показать")
+    boot_parser.set_defaults(func=run_boot_scenario)
+
+    assets_parser = subparsers.add_parser("assets", help="готовые валидаторы и клавиатуры против сборки на лету")
+    assets_parser.add_argument("--number", type=int, default=20_000)
+    assets_parser.set_defaults(func=run_assets_scenario)
+
+    funnel_parser = subparsers.add_parser("funnel", help="тысячи пользователей проходят всю воронку")
+    funnel_parser.add_argument("--users", type=int, default=2000)
+    funnel_parser.add_argument("--concurrency", type=int, default=500)
+    funnel_parser.add_argument("--latency", type=float, default=0.0, help="задержка Bot API, секунды")
+    funnel_parser.add_argument("--think", type=float, default=0.0,
+                               help="пауза пользователя между сообщениями (0 — замкнутый прогон на пределе)")
+    funnel_parser.add_argument("--save", help="сохранить отчет как эталон (JSON)")
+    funnel_parser.add_argument("--compare", help="сравнить с эталоном и завершиться с ошибкой при регрессии")
+    funnel_parser.add_argument("--tolerance", type=float, default=0.2)
+    funnel_parser.set_defaults(func=run_funnel_scenario)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,8 @@
+"""
+Общая настройка тестов: бот работает с временной базой данных, а не с teachers.db.
+Переменная окружения задается до импорта db (см. db.DATABASE_URL).
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="botum-test-"), "teachers.db")
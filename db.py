@@ -0,0 +1,284 @@
+"""
+Доступ к базе данных бота.
+
+SQLAlchemy импортируется, а движок создается при первом обращении к базе (get_engine):
+бот начинает принимать обновления, не дожидаясь ни импорта ORM, ни проверки схемы.
+Тогда же применяются недостающие миграции (см. migrations.py).
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from metrics import instrument_engine
+
+# ============================ НАСТРОЙКА ============================
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///teachers.db")
+DB_WORKERS = 4  # Количество потоков, выполняющих запросы к базе
+WRITE_BATCH_SIZE = 200  # Максимум изменений в одной транзакции run_db_batched
+WRITE_BATCH_WINDOW = 0.005  # Сколько секунд копить изменения перед коммитом
+
+# Профиль SQLite для нескольких потоков и процессов бота
+SQLITE_BUSY_TIMEOUT = 30  # Секунд ждать освобождения базы другим писателем вместо "database is locked"
+SQLITE_CACHE_SIZE_KB = 64 * 1024  # Кэш страниц на соединение
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # Чтение файла базы через отображение в память
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # Читатели не блокируют писателя и наоборот
+    "PRAGMA synchronous=NORMAL",  # В режиме WAL не теряет закоммиченное при падении процесса
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+# ============================ ДВИЖОК ============================
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def make_engine(url: str = DATABASE_URL, **kwargs):
+    """
+    Создает движок SQLAlchemy. Для SQLite-файла включает профиль SQLITE_PRAGMAS на каждом новом
+    соединении и держит пул постоянных соединений на все потоки run_db, чтобы не открывать файл
+    на каждую сессию. Все модули бота должны пользоваться общим движком db.engine.
+    """
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.engine import make_url
+
+    database = make_url(url)
+    if database.get_backend_name() == "sqlite" and database.database not in (None, "", ":memory:"):
+        kwargs.setdefault("connect_args", {"timeout": SQLITE_BUSY_TIMEOUT})
+        kwargs.setdefault("pool_size", DB_WORKERS + 1)
+        kwargs.setdefault("max_overflow", DB_WORKERS)
+        new_engine = create_engine(url, **kwargs)
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    else:
+        new_engine = create_engine(url, **kwargs)
+    instrument_engine(new_engine)  # Время и ошибки SQL-запросов (см. metrics.py)
+    return new_engine
+
+
+_engine = None  # Общий движок и фабрика сессий создаются при первом обращении к базе
+_session_factory = None
+_engine_lock = threading.RLock()
+_executor = None  # Пул потоков создается при первом запросе
+
+
+def get_engine():
+    """
+    Общий движок бота. Первый вызов создает его и приводит схему к последней версии;
+    обращаться можно из любого потока.
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from sqlalchemy.orm import sessionmaker
+
+                from migrations import migrate
+
+                new_engine = make_engine()
+                migrate(new_engine)
+                _session_factory = sessionmaker(bind=new_engine, expire_on_commit=False)
+                _engine = new_engine
+    return _engine
+
+
+def __getattr__(name):
+    # db.engine и db.Session по-прежнему доступны как атрибуты модуля, но создаются лениво
+    if name == "engine":
+        return get_engine()
+    if name == "Session":
+        get_engine()
+        return _session_factory
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ============================ СЕССИИ ============================
+
+@contextmanager
+def session_scope():
+    """
+    Открывает сессию, фиксирует транзакцию при успешном выходе и откатывает при ошибке.
+    Сессия закрывается в любом случае.
+    """
+    get_engine()
+    session = _session_factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _run_in_session(func, args, kwargs):
+    with session_scope() as session:
+        return func(session, *args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию func(session, *args, **kwargs) в пуле потоков базы данных,
+    не блокируя цикл событий бота.
+    :param func: функция, первым аргументом принимающая сессию
+    :return: результат func
+    """
+    return await _run_in_executor(_run_in_session, func, args, kwargs)
+
+
+async def run_blocking(func, *args):
+    """
+    Выполняет блокирующую функцию func(*args) без сессии SQLAlchemy в том же пуле потоков,
+    что и run_db (например, запрос к отдельному файлу SQLite, см. state_store.py).
+    """
+    return await _run_in_executor(func, *args)
+
+
+async def _run_in_executor(func, *args):
+    """Выполняет func(*args) в пуле потоков базы данных."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(func, *args))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+# ============================ ГРУППОВАЯ ЗАПИСЬ ============================
+
+def _run_batch(batch):
+    """
+    Выполняет все функции пачки в одной транзакции (один коммит и одна синхронизация диска на пачку).
+    Если транзакция падает, функции выполняются по одной, чтобы ошибка досталась только виновнику.
+    :return: список (результат, исключение) в порядке пачки
+    """
+    try:
+        # Без autoflush изменения уходят в базу одним flush перед коммитом, а не после каждой функции.
+        # Повторная запись того же пользователя в пачке видит предыдущую: сессия общая, а вторая
+        # регистрация того же id ничего не вставляет (ON CONFLICT в repository.REGISTER_SQL).
+        with session_scope() as session, session.no_autoflush:
+            results = [(func(session, *args, **kwargs), None) for func, args, kwargs, _ in batch]
+        return results
+    except Exception:
+        results = []
+        for func, args, kwargs, _ in batch:
+            try:
+                results.append((_run_in_session(func, args, kwargs), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+
+class WriteBatcher:
+    """
+    Группирует изменения из разных обработчиков в общие транзакции.
+    Пачка коммитится, когда набирается max_size изменений или проходит window секунд с первого из них.
+    Пока одна пачка пишется на диск, новые изменения копятся и уходят следующей пачкой сразу после
+    коммита, поэтому под нагрузкой пачки растут, а не выстраиваются в очередь мелкими транзакциями.
+    Вызывающий получает результат только после коммита, поэтому ответ пользователю уходит,
+    когда данные уже на диске.
+
+    Пачки отправляются в пул потоков и разбираются после коммита обратными вызовами цикла событий,
+    а не отдельной задачей: под нагрузкой каждый лишний проход цикла — это время всех готовых
+    обработчиков, которое запись ждала бы еще раз.
+    """
+
+    def __init__(self, max_size: int = WRITE_BATCH_SIZE, window: float = WRITE_BATCH_WINDOW):
+        self.max_size = max_size
+        self.window = window
+        self._pending = []  # (func, args, kwargs, future)
+        self._timer = None
+        self._flushing = False
+        self._loop = None
+
+    async def submit(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый цикл событий (перезапуск приложения): старые таймер и запись к нему не относятся
+            self._loop, self._timer, self._flushing, self._pending = loop, None, False, []
+        future = loop.create_future()
+        self._pending.append((func, args, kwargs, future))
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        elif self._timer is None and not self._flushing:
+            self._timer = loop.call_later(self.window, self._start_flush)
+        return await future
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending and not self._flushing:  # Идущая запись сама заберет накопленное после коммита
+            self._flush_next()
+
+    def _flush_next(self) -> None:
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        self._flushing = True
+        loop = self._loop
+        try:
+            done = _get_executor().submit(_run_batch, batch)
+        except Exception as e:  # Пул уже остановлен (shutdown_db)
+            self._finish(loop, batch, e)
+            return
+        done.add_done_callback(lambda done: loop.call_soon_threadsafe(self._finish, loop, batch, done))
+
+    def _finish(self, loop, batch, done) -> None:
+        if isinstance(done, Exception):
+            results = [(None, done)] * len(batch)
+        else:
+            try:
+                results = done.result()
+            except Exception as e:
+                results = [(None, e)] * len(batch)
+        for (_, _, _, future), (result, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        if loop is not self._loop:
+            return  # Пачка старого цикла событий: новая запись идет своим чередом
+        self._flushing = False
+        if self._pending:
+            self._flush_next()  # Все, что накопилось за время коммита, — следующей пачкой
+
+
+write_batcher = WriteBatcher()
+
+
+async def run_db_batched(func, *args, **kwargs):
+    """
+    Как run_db, но func выполняется в общей транзакции с изменениями других пользователей;
+    результат возвращается после коммита. Все короткие записи в teachers.db идут через эту функцию:
+    анкета, собеседование, адрес, ссылки на видео, события воронки, задания напоминаний.
+    Отдельными транзакциями (run_db) остаются только длинные проходы, которые задержали бы всю пачку:
+    пересчет оценок (scoring.py) и очистка медиа (media.compact_media). Состояния диалогов и
+    user_data пишутся в свои файлы SQLite (state_store.py) и за блокировку teachers.db не борются.
+    """
+    return await write_batcher.submit(func, *args, **kwargs)
+
+
+def shutdown_db() -> None:
+    """Дожидается завершения запросов в пуле и закрывает соединения."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _engine is not None:
+        _engine.dispose()
@@ -0,0 +1,205 @@
+"""
+Выгрузка анкет преподавателей для HR: CSV, JSONL или Parquet.
+
+Запуск:
+    python export.py teachers.csv
+    python export.py teachers.jsonl --city Москва --city Казань --stage 2 3
+    python export.py teachers.parquet --registered-from 2025-01-01 --registered-to 2025-02-01
+
+Строки читаются потоком (yield_per) через отдельное соединение только для чтения,
+поэтому память не зависит от размера таблицы. База в режиме WAL (см. db.py), так что
+выгрузка не блокирует запись анкет работающим ботом.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import and_, create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import aliased
+
+from answers import stored_summary
+from db import DATABASE_URL, SQLITE_BUSY_TIMEOUT, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE
+from models import MediaBlob, Teacher, TeacherMedia
+
+# ============================ НАСТРОЙКА ============================
+EXPORT_BATCH_SIZE = 5000  # Строк за одно чтение из курсора (и в одной группе строк Parquet)
+MEDIA_KINDS = ("verification_video", "lesson_video", "video")  # Виды видео, по колонке на каждый
+FORMATS = ("csv", "jsonl", "parquet")
+
+COLUMNS = (
+    "id", "full_name", "city", "birth_date", "registration_time", "stage",
+    "text_interview", "address", "video_path",
+) + MEDIA_KINDS
+
+
+# ============================ ЧТЕНИЕ ============================
+
+def read_only_engine(url: str = DATABASE_URL):
+    """
+    Движок, который открывает SQLite-файл только для чтения: выгрузка не может ничего записать
+    и не берет блокировок записи.
+    """
+    database = make_url(url)
+    if database.get_backend_name() != "sqlite":
+        return create_engine(url)
+
+    def connect():
+        conn = sqlite3.connect(f"file:{database.database}?mode=ro", uri=True, timeout=SQLITE_BUSY_TIMEOUT)
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        return conn
+
+    return create_engine("sqlite://", creator=connect)
+
+
+def build_query(cities=None, registered_from: datetime = None, registered_to: datetime = None, stages=None):
+    """
+    Запрос анкет с путями к видео (по колонке на каждый вид из MEDIA_KINDS).
+    :param cities: список городов (None — все)
+    :param registered_from: начало окна регистрации (включительно)
+    :param registered_to: конец окна регистрации (не включительно)
+    :param stages: список этапов воронки из TeacherStage (None — все)
+    """
+    media_columns, joins = [], []
+    for kind in MEDIA_KINDS:
+        link = aliased(TeacherMedia, name=f"link_{kind}")
+        blob = aliased(MediaBlob, name=f"blob_{kind}")
+        media_columns.append(blob.path.label(kind))
+        joins.append((link, and_(link.teacher_id == Teacher.id, link.kind == kind)))
+        joins.append((blob, blob.id == link.blob_id))
+
+    query = select(
+        Teacher.id, Teacher.full_name, Teacher.city, Teacher.birth_date, Teacher.registration_time,
+        Teacher.stage, Teacher.interview, Teacher.text_interview, Teacher.address, Teacher.video_path, *media_columns
+    ).select_from(Teacher)
+    for target, condition in joins:
+        query = query.outerjoin(target, condition)
+
+    if cities:
+        query = query.where(Teacher.city.in_(list(cities)))
+    if registered_from is not None:
+        query = query.where(Teacher.registration_time >= registered_from)
+    if registered_to is not None:
+        query = query.where(Teacher.registration_time < registered_to)
+    if stages:
+        query = query.where(Teacher.stage.in_(list(stages)))
+    return query.order_by(Teacher.id)
+
+
+def iter_teachers(engine, batch_size: int = EXPORT_BATCH_SIZE, **filters):
+    """Генератор пачек строк (кортежи в порядке COLUMNS). Фильтры — как у build_query."""
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(build_query(**filters))
+        for rows in result.partitions():
+            # В столбце text_interview выгрузки — сводка, собранная из ответов (interview, text_interview)
+            yield [(*row[:6], stored_summary(row[6], row[7]), *row[8:]) for row in rows]
+
+
+# ============================ ФОРМАТЫ ============================
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Нельзя сохранить в JSON: {type(value).__name__}")
+
+
+def _write_csv(batches, path: str) -> int:
+    count = 0
+    # utf-8-sig: Excel открывает кириллицу без ручного выбора кодировки
+    with open(path, "w", encoding="utf-8-sig", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _write_jsonl(batches, path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as fh:
+        for rows in batches:
+            fh.writelines(
+                json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False, default=_json_default) + "\n"
+                for row in rows
+            )
+            count += len(rows)
+    return count
+
+
+def _write_parquet(batches, path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet установите pyarrow: pip install pyarrow") from None
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("full_name", pa.string()), ("city", pa.string()), ("birth_date", pa.date32()),
+        ("registration_time", pa.timestamp("us")), ("stage", pa.int8()), ("text_interview", pa.string()),
+        ("address", pa.string()), ("video_path", pa.string()),
+    ] + [(kind, pa.string()) for kind in MEDIA_KINDS])
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            count += len(rows)
+    return count
+
+
+WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+
+
+def export_teachers(path: str, fmt: str = None, engine=None, batch_size: int = EXPORT_BATCH_SIZE, **filters) -> int:
+    """
+    Выгружает анкеты в файл.
+    :param fmt: csv | jsonl | parquet (по умолчанию — по расширению path)
+    :param engine: движок базы (по умолчанию — read_only_engine() для DATABASE_URL)
+    :return: количество выгруженных строк
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Неизвестный формат {fmt!r}, поддерживаются: {', '.join(FORMATS)}")
+    engine = engine or read_only_engine()
+    # Пишем во временный файл: неполная выгрузка не перезапишет вчерашнюю
+    partial_path = path + ".part"
+    try:
+        count = WRITERS[fmt](iter_teachers(engine, batch_size, **filters), partial_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, path)
+    return count
+
+
+# ============================ ЗАПУСК ============================
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Выгрузка анкет преподавателей")
+    parser.add_argument("output", help="файл выгрузки (.csv, .jsonl или .parquet)")
+    parser.add_argument("--format", choices=FORMATS, help="формат (по умолчанию — по расширению файла)")
+    parser.add_argument("--city", action="append", help="город (можно указать несколько раз)")
+    parser.add_argument("--registered-from", type=datetime.fromisoformat, help="начало окна регистрации, ISO")
+    parser.add_argument("--registered-to", type=datetime.fromisoformat, help="конец окна регистрации, ISO")
+    parser.add_argument("--stage", type=int, nargs="+", help="этапы воронки (1 — анкета, 2 — собеседование, 3 — адрес)")
+    parser.add_argument("--database", default=DATABASE_URL, help="адрес базы, по умолчанию DATABASE_URL")
+    args = parser.parse_args(argv)
+
+    count = export_teachers(
+        args.output, args.format, engine=read_only_engine(args.database), cities=args.city,
+        registered_from=args.registered_from, registered_to=args.registered_to, stages=args.stage
+    )
+    print(f"Выгружено {count} анкет в {args.output}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+"""
+Локальная имитация Telegram Bot API для замеров и ручной проверки без реального Telegram.
+
+Бот подключается к ней через ApplicationBuilder().base_url(server.base_url).
+Сервер запоминает все вызовы методов, отдает обновления через getUpdates
+и умеет отправлять их на вебхук, если бот его зарегистрировал.
+"""
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession, web
+
+
+class FakeTelegram:
+    """
+    Имитация Bot API.
+    :param on_call: функция (method, params), вызывается при каждом запросе бота
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, on_call=None):
+        self.host = host
+        self.port = port
+        self.on_call = on_call
+        self.calls = []  # (время, метод, параметры)
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._updates = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates = asyncio.Event()
+        self._runner = None
+        self._client = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> None:
+        web_app = web.Application()
+        web_app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(web_app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._client = ClientSession()
+
+    async def stop(self) -> None:
+        await self._client.close()
+        await self._runner.cleanup()
+
+    # ============================ ОБНОВЛЕНИЯ ============================
+
+    def make_message(self, user_id: int, text: str) -> dict:
+        """Обновление с текстовым сообщением (команды размечаются как bot_command)."""
+        self._update_id += 1
+        message = {
+            "message_id": self._update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._update_id, "message": message}
+
+    async def push_update(self, update: dict) -> None:
+        """Доставляет обновление боту: на вебхук, если он зарегистрирован, иначе через getUpdates."""
+        if self.webhook_url:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+            async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                response.raise_for_status()
+        else:
+            self._updates.append(update)
+            self._new_updates.set()
+
+    # ============================ МЕТОДЫ BOT API ============================
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        self.calls.append((time.perf_counter(), method, params))
+        if self.on_call is not None:
+            self.on_call(method, params)
+
+        result = await self._result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "BotUM", "username": "botum_test_bot"}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "getFile":
+            return {"file_id": params.get("file_id"), "file_unique_id": str(params.get("file_id")),
+                    "file_path": f"videos/{params.get('file_id')}.mp4"}
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time.time()),
+                    "chat": {"id": params.get("chat_id", 0), "type": "private"}, "text": params.get("text", "")}
+        return True
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = params.get("offset") or 0
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = params.get("limit") or 100
+        return self._updates[:limit]
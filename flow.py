@@ -0,0 +1,153 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Mapping, Optional
+
+from metrics import count_transition
+
+
+# ============================ ИЗВЛЕЧЕНИЕ ОТВЕТОВ ============================
+# Валидатор принимает сообщение и возвращает значение ответа или None, если ответ не подходит.
+
+def text_answer(message) -> Optional[str]:
+    """Любой непустой текст."""
+    if message.text:
+        return message.text.strip() or None
+    return None
+
+
+def video_note_answer(message):
+    """Видео-кружок из сообщения."""
+    return message.video_note
+
+
+def regex_answer(pattern: str) -> Callable:
+    """Текст, полностью совпадающий с pattern. Шаблон компилируется один раз."""
+    compiled = re.compile(pattern)
+
+    def validator(message) -> Optional[str]:
+        value = text_answer(message)
+        if value is not None and compiled.match(value):
+            return value
+        return None
+
+    return validator
+
+
+def choice_answer(choices, normalize: Callable = None) -> Callable:
+    """
+    Текст из заранее известного набора вариантов.
+    :param normalize: приведение текста к ключу сравнения (регистр, ё/е и т.п.); ответом тогда
+        считается вариант в написании из choices
+    """
+    if normalize is None:
+        allowed = frozenset(choices)
+
+        def validator(message) -> Optional[str]:
+            value = text_answer(message)
+            return value if value in allowed else None
+
+        return validator
+
+    # Готовый словарь: и вариант из choices (ответ кнопкой клавиатуры), и его ключ сравнения
+    # ("ростов на дону") находятся одним поиском, normalize вызывается только для прочих написаний
+    canonical = {normalize(choice): choice for choice in choices}
+    lookup = {**canonical, **{choice: choice for choice in choices}}
+
+    def normalized_validator(message) -> Optional[str]:
+        value = text_answer(message)
+        if value is None:
+            return None
+        choice = lookup.get(value)
+        return choice if choice is not None else canonical.get(normalize(value))
+
+    return normalized_validator
+
+
+# ============================ ШАГИ СЦЕНАРИЯ ============================
+
+@dataclass(frozen=True)
+class Step:
+    """
+    Описание одного состояния диалога.
+    :param validator: извлекает ответ из сообщения (None — ответ неверный)
+    :param error: текст, который получает пользователь при неверном ответе
+    :param field: ключ context.user_data, куда сохраняется ответ
+    :param handler: async (update, context) -> Optional[bool]; False оставляет пользователя в текущем состоянии
+    :param next_state: следующее состояние; None завершает сценарий
+    :param prompt: текст, отправляемый после перехода (вопрос из text.py)
+    :param reply_markup: клавиатура к prompt
+    """
+    validator: Callable = text_answer
+    error: str = "Пожалуйста, ответьте текстом."
+    field: Optional[str] = None
+    handler: Optional[Callable] = None
+    next_state: Optional[int] = None
+    prompt: Optional[str] = None
+    reply_markup: Any = None
+
+
+class Flow:
+    """
+    Таблица переходов: состояние -> Step. Поиск шага — одно обращение к словарю.
+    :param on_transition: функция (user_id, новое состояние или None), вызывается после каждого перехода
+    """
+
+    def __init__(self, steps: Mapping[int, Step], user_states, on_transition: Callable = None):
+        self._steps = dict(steps)
+        self._user_states = user_states
+        self._on_transition = on_transition
+
+    def __contains__(self, state) -> bool:
+        return state in self._steps
+
+    async def dispatch(self, update, context, state) -> bool:
+        """
+        Обрабатывает сообщение пользователя в состоянии state.
+        :return: False, если для состояния нет шага
+        """
+        step = self._steps.get(state)
+        if step is None:
+            return False
+
+        message = update.message
+        value = step.validator(message)
+        if value is None:
+            await message.reply_text(step.error)
+            return True
+
+        if step.field:
+            context.user_data[step.field] = value
+        if step.handler is not None and await step.handler(update, context) is False:
+            return True
+
+        user_id = message.from_user.id
+        count_transition(state, step.next_state)
+        if step.next_state is None:
+            self._user_states.pop(user_id, None)
+        else:
+            self._user_states[user_id] = step.next_state
+        if self._on_transition is not None:
+            self._on_transition(user_id, step.next_state)
+        if step.prompt:
+            await message.reply_text(step.prompt, reply_markup=step.reply_markup)
+        return True
+
+
+def compile_flow(user_states, *tables: Mapping[int, Step], on_transition: Callable = None) -> Flow:
+    """
+    Объединяет таблицы сценариев (анкета, собеседование, уроки) в одну таблицу диспетчеризации.
+    Вызывается один раз при запуске; проверяет, что состояния не пересекаются и все переходы ведут
+    в известные состояния.
+    """
+    steps = {}
+    for table in tables:
+        for state, step in table.items():
+            if state in steps:
+                raise ValueError(f"Состояние {state} описано в нескольких сценариях")
+            steps[state] = step
+
+    for state, step in steps.items():
+        if step.next_state is not None and step.next_state not in steps:
+            raise ValueError(f"Переход из состояния {state} в неизвестное состояние {step.next_state}")
+
+    return Flow(steps, user_states, on_transition)
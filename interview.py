@@ -3,14 +3,8 @@ from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, Messa
 from text import *
 from setting import TOKEN
 import re
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
 from datetime import datetime
-from models import Teacher
-
-# Настройка базы данных
-engine = create_engine('sqlite:///teachers.db')
-Session = sessionmaker(bind=engine)
+from db import get_engine  # Движок и модели создаются при первом обращении к базе (см. db.py)
 
 
 # Состояния для анкетирования
@@ -105,6 +99,9 @@ async def handle_city(update: Update, context: ContextTypes) -> None:
 
 # Функция для обработки даты рождения
 async def handle_birth_date(update: Update, context: ContextTypes) -> None:
+    from reminders import REMINDER_DELAY
+    from repository import teachers
+
     user_id = update.message.from_user.id
     birth_date = update.message.text.strip()
 
@@ -114,14 +111,15 @@ async def handle_birth_date(update: Update, context: ContextTypes) -> None:
         full_name = context.user_data.get('full_name')
         city = context.user_data.get('city')
 
-        new_teacher = Teacher(full_name=full_name, city=city, birth_date=birth_date_obj)
-        session = Session()
-        session.add(new_teacher)
-        session.commit()
-        session.close()
+        # Та же запись, что и в основном боте: счетчики, поисковый индекс и напоминание
+        created = await teachers.register(user_id, full_name, city, birth_date_obj,
+                                          remind_at=datetime.utcnow() + REMINDER_DELAY)
+        del user_states[user_id]  # Удаляем состояние пользователя
+        if not created:
+            await update.message.reply_text("Вы уже проходили анкетирование.")
+            return
 
         await update.message.reply_text("Спасибо за заполнение анкеты! Ваши данные сохранены.")
-        del user_states[user_id]  # Удаляем состояние пользователя
     else:
         await update.message.reply_text("Неверный формат даты. Попробуйте снова:")
 
@@ -215,6 +213,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 # Обновление функции main для добавления обработчиков
 def main() -> None:
+    get_engine()  # Схема приводится к последней версии до приема обновлений
     app = ApplicationBuilder().token(TOKEN).build()
 
     app.add_handler(CommandHandler("start", start_q))
@@ -0,0 +1,278 @@
+"""
+Генератор нагрузки: проигрывает синтетические обновления через обработчики из main.build_application()
+без обращения к Telegram.
+
+Бот работает с имитацией Bot API (FakeBotRequest), которая запоминает все вызовы.
+Каждый пользователь проходит воронку анкета → собеседование → урок Scratch → адрес;
+пользователи идут параллельно, сообщения одного пользователя — строго по порядку.
+"""
+import asyncio
+import json
+import time
+import tracemalloc
+from collections import defaultdict
+from functools import wraps
+
+import httpx
+from sqlalchemy import event
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest
+
+from metrics import InstrumentedRequest
+
+# ============================ ИМИТАЦИЯ BOT API ============================
+
+
+class FakeBotRequest(BaseRequest):
+    """
+    Транспорт Bot API, который не ходит в сеть: запоминает вызовы и отвечает правдоподобными результатами.
+    :param latency: имитация сетевой задержки на каждый вызов, секунды
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)  # метод -> количество вызовов
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        name = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[name] += 1
+        return 200, json.dumps({"ok": True, "result": self._result(name, params)}).encode()
+
+    def _result(self, name: str, params: dict):
+        if name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "BotUM", "username": "botum_test_bot"}
+        if name == "getFile":
+            file_id = params.get("file_id")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_path": f"videos/{file_id}.mp4"}
+        if name in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": 0,
+                    "chat": {"id": params.get("chat_id", 0), "type": "private"}, "text": params.get("text", "")}
+        return True
+
+
+def fake_file_client(size: int = 64 * 1024) -> httpx.AsyncClient:
+    """HTTP-клиент для загрузки видео, отдающий файлы заданного размера без сети."""
+    content = b"\0" * size
+    return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=content)))
+
+
+# ============================ СИНТЕТИЧЕСКИЕ ОБНОВЛЕНИЯ ============================
+
+class UpdateFactory:
+    """Собирает словари обновлений в формате Bot API."""
+
+    def __init__(self):
+        self._update_id = 0
+
+    def _next_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Тест"}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        update_id = self._next_id()
+        message = {"message_id": update_id, "date": 0, "chat": {"id": user_id, "type": "private"},
+                   "from": self._user(user_id), **fields}
+        return {"update_id": update_id, "message": message}
+
+    def text(self, user_id: int, text: str) -> dict:
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._message(user_id, **fields)
+
+    def video_note(self, user_id: int, file_id: str) -> dict:
+        return self._message(user_id, video_note={"file_id": file_id, "file_unique_id": file_id,
+                                                  "length": 240, "duration": 10})
+
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id = self._next_id()
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": str(user_id), "data": data, "from": self._user(user_id),
+            "message": {"message_id": update_id, "date": 0, "chat": {"id": user_id, "type": "private"}, "text": "?"}
+        }}
+
+    def funnel(self, user_id: int) -> list:
+        """Полный путь пользователя: анкета, /step2 (6 вопросов), /step3 и адрес."""
+        return [
+            self.text(user_id, "/start"),
+            self.text(user_id, "Трудоустройство"),
+            self.text(user_id, "Иванов Иван Иванович"),
+            self.text(user_id, "Москва"),
+            self.text(user_id, "01.02.1995"),
+            self.text(user_id, "/step2"),
+            self.text(user_id, "Вел кружок в школе, 2 года"),
+            self.text(user_id, "Собирал LEGO и Arduino"),
+            self.text(user_id, "Москва, Химки"),
+            self.text(user_id, "Будни после 16, 10 часов в неделю"),
+            self.text(user_id, "Объяснять сложное простыми словами"),
+            self.video_note(user_id, f"verify{user_id}"),
+            self.callback(user_id, "interview_confirm"),
+            self.text(user_id, "/step3"),
+            self.video_note(user_id, f"lesson{user_id}"),
+            self.text(user_id, "Москва, ул. Ленина, 1, пункт выдачи OZON"),
+            self.callback(user_id, "address_confirm"),
+        ]
+
+
+# ============================ ЗАМЕРЫ ============================
+
+class HandlerTimer:
+    """Оборачивает обработчики приложения и собирает время работы каждого."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # имя обработчика -> [секунды]
+
+    def install(self, app) -> None:
+        for handlers in app.handlers.values():
+            for handler in handlers:
+                handler.callback = self._wrap(handler.callback)
+
+    def _wrap(self, callback):
+        name = callback.__name__
+
+        @wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                self.latencies[name].append(time.perf_counter() - started)
+
+        return timed
+
+
+class DbTimer:
+    """Суммарное время SQL-запросов через события SQLAlchemy."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0.0
+        self.queries = 0
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.total += time.perf_counter() - context._query_started
+        self.queries += 1
+
+
+def percentile(values, q: float) -> float:
+    """q-й перцентиль (0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))]
+
+
+# ============================ ПРОГОН ============================
+
+async def replay_funnel(users: int, concurrency: int, latency: float = 0.0, first_user_id: int = 1_000_000,
+                        think: float = 0.0) -> dict:
+    """
+    Прогоняет users пользователей через воронку, не больше concurrency одновременно.
+    :param think: пауза пользователя между сообщениями, секунды. Без нее прогон замкнутый: каждый
+        пользователь шлет следующее сообщение сразу после ответа, процессор занят полностью, и время
+        обработчиков — это в основном ожидание своей очереди в цикле событий (concurrency / пропускная способность)
+    :return: отчет: время, пропускная способность, перцентили по обработчикам, время БД, память
+    """
+    import db
+    import main
+    from media import media_queue
+
+    request = FakeBotRequest(latency)
+    builder = ApplicationBuilder().token("123:TEST").request(InstrumentedRequest(request)).updater(None)
+    app = main.build_application(builder, persistence_file=None, scheduled_jobs=False)
+    timer = HandlerTimer()
+    timer.install(app)
+    factory = UpdateFactory()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def walk(user_id: int) -> None:
+        async with semaphore:
+            for data in factory.funnel(user_id):
+                await app.process_update(Update.de_json(data, app.bot))
+                if think:
+                    await asyncio.sleep(think)
+
+    media_queue.use_client(fake_file_client())
+    tracemalloc.start()
+    async with app:
+        await app.post_init(app)
+        with DbTimer(db.engine) as db_timer:
+            started = time.perf_counter()
+            await asyncio.gather(*(walk(first_user_id + i) for i in range(users)))
+            await media_queue.stop()
+            elapsed = time.perf_counter() - started
+    await app.post_shutdown(app)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    updates = sum(len(latencies) for latencies in timer.latencies.values())
+    return {
+        "users": users,
+        "concurrency": concurrency,
+        "think": think,
+        "elapsed": elapsed,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "handlers": {
+            name: {
+                "count": len(latencies),
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+            for name, latencies in sorted(timer.latencies.items())
+        },
+        "db": {"queries": db_timer.queries, "total_ms": db_timer.total * 1000},
+        "peak_memory_mb": peak / 1024 / 1024,
+        "api_calls": dict(request.calls),
+    }
+
+
+def compare_reports(current: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Сравнивает отчет с сохраненным эталоном.
+    :param tolerance: допустимое ухудшение p99 и пропускной способности (0.2 = 20%)
+    :return: список описаний регрессий (пустой — регрессий нет)
+    """
+    regressions = []
+    for name, stats in current["handlers"].items():
+        base = baseline["handlers"].get(name)
+        if base and base["p99_ms"] > 0 and stats["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {base['p99_ms']:.2f}ms -> {stats['p99_ms']:.2f}ms")
+    if current["updates_per_sec"] < baseline["updates_per_sec"] * (1 - tolerance):
+        regressions.append(
+            f"пропускная способность {baseline['updates_per_sec']:.0f} -> {current['updates_per_sec']:.0f} обн./с"
+        )
+    return regressions
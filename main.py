@@ -1,15 +1,18 @@
+"""
+Telegram-бот набора преподавателей.
+
+Запуск бота должен быть быстрым: на верхнем уровне импортируется только то, что нужно для приема
+обновлений. Тяжелые подсистемы (SQLAlchemy и модели, загрузка медиа, напоминания, вебхук)
+импортируются при первом использовании, а сразу после запуска прогреваются в фоновом потоке,
+пока бот уже опрашивает Telegram (см. warm_up). Профиль запуска: python benchmark.py boot
+"""
+import asyncio
 import logging
 import os
-import re
-from datetime import datetime, timedelta
-
-import nest_asyncio
-from telegram import (
-    Update,
-    ReplyKeyboardMarkup,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup
-)
+import sys
+from datetime import datetime
+
+from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -17,26 +20,42 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler
 )
-from sqlalchemy import create_engine
-from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import sessionmaker
-
-from models import Teacher
+from telegram.request import HTTPXRequest
+from admin import pending_button_handler, pending_command, stats_command, teacher_command
+from analytics import ANALYTICS_FLUSH_INTERVAL, FunnelStep, FunnelTracker, state_names
+from answers import collect_answers, render_answers
+from assets import (
+    ADDRESS_CONFIRM_MARKUP,
+    CITIES_MARKUP,
+    INTERVIEW_CONFIRM_MARKUP,
+    START_MARKUP,
+    birth_date_answer,
+    city_answer,
+    full_name_answer
+)
+from backpressure import UserUpdateProcessor
+from db import get_engine, shutdown_db
+from flow import Step, compile_flow, video_note_answer
+from metrics import (
+    METRICS_DUMP_INTERVAL,
+    METRICS_PORT,
+    InstrumentedRequest,
+    dump_metrics,
+    instrument_application,
+    start_metrics_server
+)
 from setting import TOKEN
+from state_store import STATE_FLUSH_INTERVAL, STATE_TTL, USER_DATA_DB_PATH, UserDataPersistence, create_state_store
 from text import *
 
-# ============================ КОНСТАНТЫ ============================
-CITIES = [
-    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург",
-    "Казань", "Нижний Новгород", "Челябинск", "Омск",
-    "Самара", "Ростов-на-Дону"
-]
 # ============================ НАСТРОЙКА ============================
-nest_asyncio.apply()
+BOT_MODE = os.environ.get("BOT_MODE", "polling")  # polling | webhook
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "1"))  # Процессов-обработчиков (см. workers.py)
+REMINDER_TICK = 30  # Секунд между проходами рассылки напоминаний (на столько напоминание может опоздать)
+SCORING_TICK = 15 * 60  # Секунд между пересчетами оценок кандидатов (scoring.py)
 
-engine = create_engine("sqlite:///teachers.db")
-Session = sessionmaker(bind=engine)
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 # ============================ СОСТОЯНИЯ ============================
@@ -63,19 +82,17 @@ class LessonState:
     ROBO_KIT = 11
     VIDEO_LESSON = 12
 
-user_states = {}
+# Состояния диалогов переживают перезапуск; брошенные диалоги вытесняются по TTL
+user_states = create_state_store()
+# События воронки для аналитики (см. analytics.py)
+funnel = FunnelTracker(state_names(SurveyState, QState, LessonState))
 
 
 # ============================ ОБРАБОТЧИКИ КОМАНД ============================
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    keyboard = [
-        ['Зарплата', 'Трудоустройство'],
-    ]
-
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-
-    await update.message.reply_text(START_TEXT, reply_markup=reply_markup)
+    funnel.track(update.message.from_user.id, FunnelStep.START)
+    await update.message.reply_text(START_TEXT, reply_markup=START_MARKUP)
 
 
 async def lesson1(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -93,12 +110,14 @@ async def lesson3(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def start_q(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.message.from_user.id
     user_states[user_id] = QState.WAITING_FOR_ONE
+    funnel.track(user_id, FunnelStep.INTERVIEW_STARTED)
     await update.message.reply_text(questions[0])
 
 
 async def les_scratch(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     user_states[user_id] = LessonState.LES_SCRATCH
+    funnel.track(user_id, FunnelStep.LESSON_STARTED)
     await update.message.reply_text(SCRATCH_LESSON_TEXT)
 
 
@@ -107,164 +126,46 @@ async def les_scratch(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def start_survey(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.message.from_user.id
     user_states[user_id] = SurveyState.WAITING_FOR_NAME
+    funnel.track(user_id, FunnelStep.SURVEY_STARTED)
     await update.message.reply_text("Запишите ваше ФИО (формат: Фамилия Имя Отчество):")
 
 
-# Функция для обработки ФИО
-async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_id = update.message.from_user.id
-    name = update.message.text.strip()
-
-    # Проверка формата ФИО
-    if re.match(r'^[А-ЯЁ][а-яё]+\s[А-ЯЁ][а-яё]+\s[А-ЯЁ][а-яё]+$', name):
-        context.user_data['full_name'] = name  # Сохраняем ФИО
-        user_states[user_id] = SurveyState.WAITING_FOR_CITY
-        reply_markup = ReplyKeyboardMarkup(
-            [[city] for city in CITIES],
-            one_time_keyboard=True,
-            resize_keyboard=True
-        )
-        await update.message.reply_text(
-            "Выберите город из списка:",
-            reply_markup=reply_markup
-        )
-    else:
-        await update.message.reply_text(
-            "Неверный формат ФИО. Попробуйте снова:"
-        )
+# Функция для сохранения анкеты (ФИО, город и дата рождения уже в user_data)
+async def handle_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from reminders import REMINDER_DELAY
+    from repository import teachers
 
-
-# Функция для обработки выбора города
-async def handle_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.message.from_user.id
-    city = update.message.text.strip()
-
-    if city in CITIES:
-        context.user_data['city'] = city  # Сохраняем город
-        user_states[user_id] = SurveyState.WAITING_FOR_BIRTH_DATE
-        await update.message.reply_text(
-            "Запишите вашу дату рождения в формате ДД.ММ.ГГГГ:",
-            reply_markup=None
-        )
-    else:
-        await update.message.reply_text(
-            "Город не найден в списке. Попробуйте снова:"
-        )
 
+    # Получаем ФИО, город и дату рождения из состояния пользователя
+    full_name = context.user_data.get('full_name')
+    city = context.user_data.get('city')
+    birth_date = context.user_data.get('birth_date')
 
-# Функция для обработки даты рождения
-async def handle_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_id = update.message.from_user.id
-    birth_date = update.message.text.strip()
-
-    # Проверка формата даты
-    if re.match(r'^\d{2}\.\d{2}\.\d{4}$', birth_date):
-        # Создаем сессию для работы с базой данных
-        session = Session()
-
-        try:
-            # Проверяем, существует ли пользователь в базе данных
-            existing_teacher = session.query(Teacher).filter_by(id=user_id).one()
-            await update.message.reply_text(
-                "Вы уже проходили анкетирование."
-            )
-        except NoResultFound:
-            # Если пользователя нет в базе, создаем нового
-            birth_date_obj = datetime.strptime(birth_date, '%d.%m.%Y').date()
-
-            # Получаем ФИО и город из состояния пользователя
-            full_name = context.user_data.get('full_name')
-            city = context.user_data.get('city')
-
-            # Создаем экземпляр Teacher
-            new_teacher = Teacher(
-                id=user_id,
-                full_name=full_name,
-                city=city,
-                birth_date=birth_date_obj
-            )
-
-            # Сохраняем данные в базу данных
-            session.add(new_teacher)
-            session.commit()
-            await update.message.reply_text(
-                "Спасибо за заполнение анкеты! Ваши данные сохранены. \n"
-                "Как будете готовы к следующему этапу, введите /step2"
-            )
-
-            del user_states[user_id]  # Удаляем состояние пользователя
-        finally:
-            session.close()
-    else:
+    # Сохраняем данные в базу данных, если пользователя там еще нет,
+    # и в той же транзакции планируем напоминание о собеседовании, если пользователь не продолжит
+    created = await teachers.register(user_id, full_name, city, birth_date,
+                                      remind_at=datetime.utcnow() + REMINDER_DELAY)
+    if not created:
         await update.message.reply_text(
-            "Неверный формат даты. Попробуйте снова:"
+            "Вы уже проходили анкетирование."
         )
+        return False
 
-
+    funnel.track(user_id, FunnelStep.SURVEY_DONE, city=city)
+    await update.message.reply_text(
+        "Спасибо за заполнение анкеты! Ваши данные сохранены. \n"
+        "Как будете готовы к следующему этапу, введите /step2"
+    )
 
 
 # ============================ СОБЕСЕДОВАНИЕ (ВОПРОСЫ) ============================
 
-async def handle_experience_kids(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    experience = update.message.text.strip()
-    context.user_data['experience_kids'] = experience
-    user_states[user_id] = QState.WAITING_FOR_TWO
-    await update.message.reply_text(questions[1])
-
-
-async def handle_experience_robo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    experience = update.message.text.strip()
-    context.user_data['experience_robo'] = experience
-    user_states[user_id] = QState.WAITING_FOR_THREE
-    await update.message.reply_text(questions[2])
-
-
-async def handle_interview_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    city_interview = update.message.text.strip()
-    context.user_data['interview_city'] = city_interview
-    user_states[user_id] = QState.WAITING_FOR_FOUR
-    await update.message.reply_text(questions[3])
-
-
-async def handle_free_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    free_time = update.message.text.strip()
-    context.user_data['free_time'] = free_time
-    user_states[user_id] = QState.WAITING_FOR_FIVE
-    await update.message.reply_text(questions[4])
-
-
-async def handle_best_skills(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    best_skills = update.message.text.strip()
-    context.user_data['best_skills'] = best_skills
-    user_states[user_id] = QState.WAITING_FOR_SIX
-    await update.message.reply_text(questions[5])
-
-
 async def handle_algorithm_explanation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    answers = (
-        f"Опыт взаимодействия с младшими школьниками: {context.user_data.get('experience_kids')}\n"
-        f"Опыт в робототехнике: {context.user_data.get('experience_robo')}\n"
-        f"Города для работы: {context.user_data.get('interview_city')}\n"
-        f"Свободное время: {context.user_data.get('free_time')}\n"
-        f"Лучшие навыки: {context.user_data.get('best_skills')}\n"
-    )
-
-    context.user_data['answers'] = answers
-
-    await update.message.reply_text("Вот ваши ответы:\n" + answers)
-
-    keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить", callback_data="interview_confirm")],
-        [InlineKeyboardButton("❌ Отклонить", callback_data="interview_reject")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.message.reply_text("Вот ваши ответы:\n" + render_answers(context.user_data))
 
-    await update.message.reply_text("Пожалуйста, подтвердите или отклоните ваши данные:", reply_markup=reply_markup)
+    await update.message.reply_text("Пожалуйста, подтвердите или отклоните ваши данные:",
+                                    reply_markup=INTERVIEW_CONFIRM_MARKUP)
 
 
 # ============================ ОБРАБОТКА МЕДИА ============================
@@ -272,89 +173,70 @@ async def handle_algorithm_explanation(update: Update, context: ContextTypes.DEF
 async def save_user_video(
     video_note,
     bot,
-    folder_name: str,
-    video_name: str
+    user_id: int,
+    video_name: str,
+    chat_id: int = None
 ) -> str:
     """
-    Сохраняет видео пользователя в папку media/<folder_name>/<video_name>.mp4
-    :param video_note: объект video_note из update.message.video_note
+    Ставит видео пользователя в очередь на сохранение в хранилище медиа.
+    Загрузка идет в фоне, обработчик сразу продолжает диалог; одинаковые видео хранятся один раз.
+    :param video_note: объект video_note (или video) из update.message
     :param bot: context.bot
-    :param folder_name: имя папки (например, ФИО или id пользователя)
-    :param video_name: имя файла (без расширения)
-    :return: путь к сохранённому видеофайлу
+    :param user_id: id пользователя, к которому привязывается видео
+    :param video_name: вид видео (например, verification_video)
+    :param chat_id: чат, куда сообщить, если видео сохранить не удалось
+    :return: путь, по которому будет сохранён видеофайл
     """
-    user_folder = os.path.join('media', folder_name.strip().replace(' ', '_'))
-    os.makedirs(user_folder, exist_ok=True)
-    if not video_name.lower().endswith('.mp4'):
-        video_name += '.mp4'
-    video_path = os.path.join(user_folder, video_name)
-    if video_note:
-        file = await bot.get_file(video_note.file_id)
-        await file.download_to_drive(video_path)
-    return video_path
+    from media import store_video
 
+    async def on_done(path, error):
+        if error is not None and chat_id is not None:
+            await bot.send_message(chat_id=chat_id, text="Не удалось сохранить видео. Пожалуйста, отправьте его еще раз.")
+
+    return await store_video(bot, video_note, user_id, video_name, on_done=on_done)
 
 
 async def handle_video(update: Update, context: ContextTypes) -> None:
     user_id = update.message.from_user.id
-    video_file = update.message.video.file_id
-
-    # Создаем папку media, если она не существует
-    os.makedirs('media', exist_ok=True)
-
-    try:
-        # Сохраняем видео в папку "медиа"
-        new_file = await context.bot.get_file(video_file)
-        await new_file.download_to_drive(f'media/{user_id}_video.mp4')  # Сохранение видео
-        await update.message.reply_text("Ваше видео успешно сохранено.")
-    except Exception as e:
-        await update.message.reply_text("Произошла ошибка при сохранении видео.")
-        print(f"Ошибка: {e}")
-
 
+    # Сохраняем видео в хранилище медиа в фоне
+    await save_user_video(
+        video_note=update.message.video,
+        bot=context.bot,
+        user_id=user_id,
+        video_name='video',
+        chat_id=update.message.chat_id
+    )
+    await update.message.reply_text("Ваше видео получено.")
 
 
 async def handle_video_note_verification(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    video_note = update.message.video_note
-    session = Session()
-    teacher = session.get(Teacher, user_id)
-    folder_name = teacher.full_name  # или teacher.id, или любой другой параметр
-    video_name = "verification_video"  # или любое другое имя
-
-    video_path = await save_user_video(
-        video_note=video_note,
+    # teachers.video_path обновится, когда видео скачается и будет связано с анкетой (см. media.py)
+    await save_user_video(
+        video_note=update.message.video_note,
         bot=context.bot,
-        folder_name=folder_name,
-        video_name=video_name
+        user_id=update.message.from_user.id,
+        video_name="verification_video",
+        chat_id=update.message.chat_id
     )
-    context.user_data['video_note'] = video_path
 
     # Теперь вы можете делать что угодно дальше:
-    await update.message.reply_text("Ваше видео успешно сохранено!")
+    await update.message.reply_text("Ваше видео получено!")
     await handle_algorithm_explanation(update, context)
 
 
 async def handle_video_note_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    video_note = update.message.video_note
-    session = Session()
-    teacher = session.get(Teacher, user_id)
-    folder_name = teacher.full_name  # или teacher.id, или любой другой параметр
-    video_name = "lesson_video"  # или любое другое имя
-
-    video_path = await save_user_video(
-        video_note=video_note,
+    # teachers.video_path обновится, когда видео скачается и будет связано с анкетой (см. media.py)
+    await save_user_video(
+        video_note=update.message.video_note,
         bot=context.bot,
-        folder_name=folder_name,
-        video_name=video_name
+        user_id=update.message.from_user.id,
+        video_name="lesson_video",
+        chat_id=update.message.chat_id
     )
-    context.user_data['video_note'] = video_path
 
     # Теперь вы можете делать что угодно дальше:
-    await update.message.reply_text("Ваше видео успешно сохранено!")
-    await update.message.reply_text(ROBO_KIT_TEXT)
-    user_states[user_id] = LessonState.ROBO_KIT
+    await update.message.reply_text("Ваше видео получено!")
 
 
 
@@ -362,24 +244,80 @@ async def handle_video_note_lesson(update: Update, context: ContextTypes.DEFAULT
 
 
 async def handle_adress(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    address = update.message.text.strip()
-    context.user_data['address'] = address  # Сохраняем адрес под ключом 'address'
-
-    keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить", callback_data="address_confirm")],
-        [InlineKeyboardButton("✏️ Изменить", callback_data="address_edit")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    address = context.user_data['address']  # Адрес уже сохранен шагом сценария
 
     await update.message.reply_text(
         f"Вы указали адрес:\n\n<b>{address}</b>\n\nВсе верно?",
-        reply_markup=reply_markup,
+        reply_markup=ADDRESS_CONFIRM_MARKUP,
         parse_mode="HTML"
     )
 
 
 
+# ============================ СЦЕНАРИИ ============================
+# Каждое состояние описывается шагом: как проверить ответ, куда его сохранить,
+# что сделать после ответа, куда перейти и что спросить дальше.
+
+SURVEY_FLOW = {
+    SurveyState.WAITING_FOR_NAME: Step(
+        validator=full_name_answer,
+        error="Неверный формат ФИО. Попробуйте снова:",
+        field='full_name',
+        next_state=SurveyState.WAITING_FOR_CITY,
+        prompt="Выберите город из списка:",
+        reply_markup=CITIES_MARKUP
+    ),
+    SurveyState.WAITING_FOR_CITY: Step(
+        validator=city_answer,
+        error="Город не найден в списке. Попробуйте снова:",
+        field='city',
+        next_state=SurveyState.WAITING_FOR_BIRTH_DATE,
+        prompt="Запишите вашу дату рождения в формате ДД.ММ.ГГГГ:"
+    ),
+    SurveyState.WAITING_FOR_BIRTH_DATE: Step(
+        validator=birth_date_answer,
+        error="Неверный формат даты. Попробуйте снова:",
+        field='birth_date',
+        handler=handle_birth_date
+    ),
+}
+
+VIDEO_NOTE_ERROR = "Пожалуйста, отправьте видео-кружок (кнопка 📹 в Telegram)!"
+
+INTERVIEW_FLOW = {
+    QState.WAITING_FOR_ONE: Step(field='experience_kids', next_state=QState.WAITING_FOR_TWO, prompt=questions[1]),
+    QState.WAITING_FOR_TWO: Step(field='experience_robo', next_state=QState.WAITING_FOR_THREE, prompt=questions[2]),
+    QState.WAITING_FOR_THREE: Step(field='interview_city', next_state=QState.WAITING_FOR_FOUR, prompt=questions[3]),
+    QState.WAITING_FOR_FOUR: Step(field='free_time', next_state=QState.WAITING_FOR_FIVE, prompt=questions[4]),
+    QState.WAITING_FOR_FIVE: Step(field='best_skills', next_state=QState.WAITING_FOR_SIX, prompt=questions[5]),
+    # Здесь бот ждет видео-кружок; состояние снимается после подтверждения ответов
+    QState.WAITING_FOR_SIX: Step(
+        validator=video_note_answer,
+        error=VIDEO_NOTE_ERROR,
+        handler=handle_video_note_verification,
+        next_state=QState.WAITING_FOR_SIX
+    ),
+}
+
+LESSON_FLOW = {
+    # Здесь бот ждет видео-кружок для этапа Scratch
+    LessonState.LES_SCRATCH: Step(
+        validator=video_note_answer,
+        error="Пожалуйста, отправьте видео-кружок (кнопка 📹 в Telegram) для проверки!",
+        handler=handle_video_note_lesson,
+        next_state=LessonState.ROBO_KIT,
+        prompt=ROBO_KIT_TEXT
+    ),
+    LessonState.ROBO_KIT: Step(
+        field='address',
+        handler=handle_adress,
+        next_state=LessonState.ROBO_KIT
+    ),
+}
+
+FLOW = compile_flow(user_states, SURVEY_FLOW, INTERVIEW_FLOW, LESSON_FLOW, on_transition=funnel.track_state)
+
+
 # ============================ ОБРАБОТКА ТЕКСТА И СОСТОЯНИЙ ============================
 
 async def handle_text(update: Update, context: ContextTypes) -> None:
@@ -398,42 +336,10 @@ async def handle_text(update: Update, context: ContextTypes) -> None:
             await update.message.reply_text("Чем меньше, тем лучше)")
             return
 
-    # Обработка состояний анкетирования
-    if user_id in user_states:
-        current_state = user_states[user_id]
-
-        if current_state == SurveyState.WAITING_FOR_NAME:
-            await handle_name(update, context)
-        elif current_state == SurveyState.WAITING_FOR_CITY:
-            await handle_city(update, context)
-        elif current_state == SurveyState.WAITING_FOR_BIRTH_DATE:
-            await handle_birth_date(update, context)
-
-        # Обработка состояний собеседования
-        elif current_state == QState.WAITING_FOR_ONE:
-            await handle_experience_kids(update, context)
-        elif current_state == QState.WAITING_FOR_TWO:
-            await handle_experience_robo(update, context)
-        elif current_state == QState.WAITING_FOR_THREE:
-            await handle_interview_city(update, context)
-        elif current_state == QState.WAITING_FOR_FOUR:
-            await handle_free_time(update, context)
-        elif current_state == QState.WAITING_FOR_FIVE:
-            await handle_best_skills(update, context)
-        # Здесь бот ждет видео-кружок (QState.WAITING_FOR_SIX)
-        elif current_state == QState.WAITING_FOR_SIX:
-            if update.message.video_note:
-                await handle_video_note_verification(update, context)
-            else:
-                await update.message.reply_text("Пожалуйста, отправьте видео-кружок (кнопка 📹 в Telegram)!")
-        # Здесь бот ждет видео-кружок для этапа Scratch
-        elif current_state == LessonState.LES_SCRATCH:
-            if update.message.video_note:
-                await handle_video_note_lesson(update, context)
-            else:
-                await update.message.reply_text("Пожалуйста, отправьте видео-кружок (кнопка 📹 в Telegram) для проверки!")
-        elif current_state == LessonState.ROBO_KIT:
-            await handle_adress(update, context)
+    # Обработка состояний анкетирования, собеседования и уроков
+    state = await user_states.load(user_id)  # После перезапуска состояние читается с диска
+    if state is not None:
+        await FLOW.dispatch(update, context, state)
 
     # Обработка видео
     if update.message.video:
@@ -447,45 +353,32 @@ async def handle_text(update: Update, context: ContextTypes) -> None:
 
 # Обработчик для интервью
 async def interview_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    from repository import teachers
+
     query = update.callback_query
     await query.answer()
 
     user_id = query.from_user.id
-    session = Session()
-
-    try:
-        # Получаем текст интервью из user_data
-        text_interview = (
-            f"Опыт взаимодействия с младшими школьниками: {context.user_data.get('experience_kids')}\n"
-            f"Опыт в робототехнике: {context.user_data.get('experience_robo')}\n"
-            f"Города для работы: {context.user_data.get('interview_city')}\n"
-            f"Свободное время: {context.user_data.get('free_time')}\n"
-            f"Лучшие навыки: {context.user_data.get('best_skills')}\n"
-        )
-
-        if query.data == 'interview_confirm':
-            # Обновляем запись в базе данных
-            existing_teacher = session.query(Teacher).filter_by(id=user_id).one()
-            existing_teacher.text_interview = text_interview  # Сохраняем текст интервью
-            existing_teacher.video_path = os.path.dirname(context.user_data['video_note'])
-            session.commit()  # Сохраняем изменения в базе данных
-
-            await query.message.reply_text("Ваши данные подтверждены. Спасибо!")
-        elif query.data == 'interview_reject':
-            await query.message.reply_text("Ваши данные отклонены. Пожалуйста, начните заново.")
-            # Здесь можно добавить логику для сброса данных или повторного начала опроса
-        if user_id in user_states:
-            del user_states[user_id]  # Удаляем состояние пользователя
 
+    if query.data == 'interview_confirm':
+        # Обновляем запись в базе данных (напоминание о собеседовании снимается в той же транзакции)
+        updated = await teachers.save_interview(user_id, collect_answers(context.user_data))
+        if not updated:
+            await query.message.reply_text("Пользователь не найден в базе данных.")
+            return
 
-    except NoResultFound:
-        await query.message.reply_text("Пользователь не найден в базе данных.")
-    finally:
-        session.close()
+        funnel.track(user_id, FunnelStep.INTERVIEW_CONFIRMED)
+        await query.message.reply_text("Ваши данные подтверждены. Спасибо!")
+    elif query.data == 'interview_reject':
+        await query.message.reply_text("Ваши данные отклонены. Пожалуйста, начните заново.")
+        # Здесь можно добавить логику для сброса данных или повторного начала опроса
+    user_states.pop(user_id, None)  # Удаляем состояние пользователя
 
 
 # Обработчик для адреса
 async def address_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    from repository import teachers
+
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
@@ -496,23 +389,22 @@ async def address_button_handler(update: Update, context: ContextTypes.DEFAULT_T
             await query.edit_message_text("Адрес не найден. Пожалуйста, введите адрес заново.")
             return
 
-        session = Session()
         try:
-            teacher = session.query(Teacher).filter_by(id=user_id).one_or_none()
-            if teacher is None:
-                await query.edit_message_text("Пользователь не найден в базе данных.")
-                return
-
-            teacher.address = address  # Сохраняем адрес
-            session.commit()
-
-            await query.edit_message_text(f"Адрес сохранён:\n{address}\nСпасибо!")
-            # Здесь можно перейти к следующему шагу, например:
-            # await query.message.reply_text("Следующий шаг...")
+            updated = await teachers.save_address(user_id, address)  # Сохраняем адрес
         except Exception as e:
             await query.edit_message_text(f"Ошибка при сохранении адреса: {e}")
-        finally:
-            session.close()
+            return
+
+        if not updated:
+            await query.edit_message_text("Пользователь не найден в базе данных.")
+            return
+
+        funnel.track(user_id, FunnelStep.ADDRESS_CONFIRMED)
+        # Анкета закончена и лежит в базе: ответы в памяти и в user_data.db больше не нужны
+        context.application.drop_user_data(user_id)
+        await query.edit_message_text(f"Адрес сохранён:\n{address}\nСпасибо!")
+        # Здесь можно перейти к следующему шагу, например:
+        # await query.message.reply_text("Следующий шаг...")
 
     elif query.data == 'address_edit':
         await query.edit_message_text("Пожалуйста, введите адрес еще раз:")
@@ -521,34 +413,102 @@ async def address_button_handler(update: Update, context: ContextTypes.DEFAULT_T
 
 
 
-# ============================ НАПОМИНАНИЯ ============================
+# ============================ MAIN ============================
+
+async def flush_states(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await user_states.flush()
+
+
+async def evict_user_data(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Брошенные анкеты: user_data без изменений дольше STATE_TTL убираются из памяти и с диска
+    persistence = context.application.persistence
+    if isinstance(persistence, UserDataPersistence):
+        for user_id in persistence.stale_users(STATE_TTL):
+            context.application.drop_user_data(user_id)
+
+
+async def flush_funnel(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await funnel.flush()
 
-async def send_reminders(app):
-    session = Session()
+
+async def send_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    from reminders import send_reminders
+
+    await send_reminders(context)
+
+
+async def compact_media(context: ContextTypes.DEFAULT_TYPE) -> None:
+    from media import compact_media
+
+    await compact_media(context)
+
+
+async def score_candidates(context: ContextTypes.DEFAULT_TYPE) -> None:
+    from scoring import score_candidates  # numpy нужен только этой задаче
+
+    await score_candidates(context)
+
+
+def _import_heavy_modules() -> None:
+    import media
+    import reminders
+    import repository
+
+    get_engine()  # Импорт SQLAlchemy и моделей, проверка схемы
+
+
+async def warm_up() -> None:
+    """
+    Загружает подсистемы, которые импортируются лениво, в фоновом потоке: бот уже принимает обновления,
+    а первый обработчик, которому нужна база, не ждет импорта SQLAlchemy в цикле событий.
+    """
+    started = asyncio.get_running_loop().time()
     try:
-        current_time = datetime.utcnow()
-        # Получаем всех учителей, которые зарегистрировались более 1 минуты назад и не заполнили анкету
-        teachers = session.query(Teacher).filter(
-            Teacher.text_interview.is_(None),
-            Teacher.registration_time <= current_time - timedelta(minutes=24)
-        ).all()
-
-        for teacher in teachers:
-            try:
-                await app.bot.send_message(
-                    chat_id=teacher.id,
-                    text="Напоминаем вам, что вы еще не прошли анкетирование. Пожалуйста, перейдите ко второму шагу."
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке сообщения: {e}")
-    finally:
-        session.close()
+        await asyncio.to_thread(_import_heavy_modules)
+    except Exception:
+        logger.exception("Не удалось подготовить базу данных")
+    else:
+        logger.info("Подсистемы загружены за %.2fs", asyncio.get_running_loop().time() - started)
 
 
-# ============================ MAIN ============================
+async def on_startup(app) -> None:
+    app.bot_data["warm_up"] = asyncio.create_task(warm_up())
+    if app.bot_data.get("metrics_port"):
+        app.bot_data["metrics_runner"] = await start_metrics_server(app.bot_data["metrics_port"])
 
-async def main() -> None:
-    app = ApplicationBuilder().token(TOKEN).build()
+
+async def on_shutdown(app) -> None:
+    if app.bot_data.get("warm_up"):
+        await app.bot_data.pop("warm_up")
+    if app.bot_data.get("metrics_runner"):
+        await app.bot_data.pop("metrics_runner").cleanup()
+    if "media" in sys.modules:  # Загрузки идут, только если модуль уже импортирован
+        await sys.modules["media"].media_queue.stop()
+    await funnel.flush()
+    await user_states.close()
+    shutdown_db()
+
+
+def build_application(builder: ApplicationBuilder = None, persistence_file: str = USER_DATA_DB_PATH,
+                      scheduled_jobs: bool = True, metrics_port: int = METRICS_PORT, update_processor=None):
+    """
+    Собирает приложение бота со всеми обработчиками и периодическими задачами.
+    :param builder: заранее настроенный ApplicationBuilder (например, с другим base_url для тестового сервера)
+    :param persistence_file: файл SQLite для context.user_data между перезапусками (None — не сохранять)
+    :param scheduled_jobs: запускать ли напоминания и очистку медиа (при нескольких процессах — только в одном)
+    :param metrics_port: порт отдельного сервера /metrics (0 — не запускать)
+    :param update_processor: очередь обновлений (по умолчанию UserUpdateProcessor, см. backpressure.py)
+    """
+    builder = builder or ApplicationBuilder().token(TOKEN).request(
+        # Пул как у PTB по умолчанию, плюс замер времени каждого метода Bot API
+        InstrumentedRequest(HTTPXRequest(connection_pool_size=256))
+    )
+    # Разные пользователи — параллельно, один пользователь — по очереди, при перегрузке — "подождите"
+    builder = builder.concurrent_updates(update_processor or UserUpdateProcessor())
+    if persistence_file:
+        # Ответы пользователей (context.user_data) тоже сохраняются между перезапусками
+        builder = builder.persistence(UserDataPersistence(persistence_file))
+    app = builder.post_init(on_startup).post_shutdown(on_shutdown).build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("lesson1", lesson1))
@@ -556,16 +516,46 @@ async def main() -> None:
     app.add_handler(CommandHandler("step3", les_scratch))
     app.add_handler(CommandHandler("lesson2", lesson2))
     app.add_handler(CommandHandler("lesson3", lesson3))
+    # Команды сотрудников (только ADMIN_IDS, см. admin.py)
+    app.add_handler(CommandHandler("pending", pending_command))
+    app.add_handler(CommandHandler("teacher", teacher_command))
+    app.add_handler(CommandHandler("stats", stats_command))
     app.add_handler(MessageHandler(None, handle_text))
     app.add_handler(CallbackQueryHandler(interview_button_handler, pattern=r"^interview_"))
     app.add_handler(CallbackQueryHandler(address_button_handler, pattern=r"^address_"))
-    app.job_queue.run_repeating(lambda context: send_reminders(app), interval=3600, first=0)
-
-    app.run_polling()
+    app.add_handler(CallbackQueryHandler(pending_button_handler, pattern=r"^pending_"))
+    instrument_application(app)
+    app.bot_data["metrics_port"] = metrics_port
+
+    app.job_queue.run_repeating(flush_states, interval=STATE_FLUSH_INTERVAL)
+    app.job_queue.run_repeating(flush_funnel, interval=ANALYTICS_FLUSH_INTERVAL)
+    if persistence_file:
+        app.job_queue.run_repeating(evict_user_data, interval=3600, first=3600)
+    if METRICS_DUMP_INTERVAL > 0:
+        app.job_queue.run_repeating(dump_metrics, interval=METRICS_DUMP_INTERVAL, first=METRICS_DUMP_INTERVAL)
+    if scheduled_jobs:
+        app.job_queue.run_repeating(send_reminders, interval=REMINDER_TICK, first=0)
+        app.job_queue.run_repeating(compact_media, interval=24 * 3600, first=3600)
+        app.job_queue.run_repeating(score_candidates, interval=SCORING_TICK, first=SCORING_TICK)
+    return app
+
+
+def main() -> None:
+    if BOT_WORKERS > 1:
+        from workers import run_sharded
+        run_sharded(BOT_WORKERS, BOT_MODE)
+        return
+
+    app = build_application()
+
+    if BOT_MODE == 'webhook':
+        from webhook import serve_webhook
+
+        # Свой цикл событий для aiohttp-сервера и бота
+        asyncio.run(serve_webhook(app))
+    else:
+        app.run_polling()
 
 
 if __name__ == '__main__':
-    import asyncio
-
-    # Запускаем основной цикл
-    asyncio.run(main())
+    main()
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import DateTime, bindparam, exists, text
+
+from db import run_db, run_db_batched
+from models import MediaBlob, TeacherMedia
+
+# ============================ НАСТРОЙКА ============================
+MEDIA_ROOT = 'media'
+MEDIA_WORKERS = 4  # Одновременных загрузок
+MEDIA_QUEUE_SIZE = 200  # Сколько загрузок может ждать в очереди
+CHUNK_SIZE = 256 * 1024  # Размер блока при потоковой записи на диск
+DOWNLOAD_TIMEOUT = 120  # Секунд на загрузку одного файла
+ORPHAN_RETENTION = timedelta(days=7)  # Сколько хранить видео, на которые больше никто не ссылается
+INTERVIEW_VIDEO_KINDS = ("verification_video", "lesson_video")  # Видео, путь к которым пишется в teachers.video_path
+
+logger = logging.getLogger(__name__)
+
+
+# ============================ ФАЙЛОВЫЕ ОПЕРАЦИИ ============================
+# Выполняются в пуле потоков, чтобы не блокировать цикл событий.
+
+def _open_part(path: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return open(path + '.part', 'wb')
+
+
+def _finish_part(fh, path: str) -> None:
+    fh.flush()
+    os.fsync(fh.fileno())
+    fh.close()
+    os.replace(path + '.part', path)  # Атомарно: файл либо целиком на месте, либо его нет
+
+
+def _copy_local(source: str, fh) -> None:
+    with open(source, 'rb') as src:
+        shutil.copyfileobj(src, fh, CHUNK_SIZE)
+
+
+def _file_size(path: str):
+    """Размер файла или None, если его нет."""
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+def _discard_part(fh, path: str) -> None:
+    fh.close()
+    try:
+        os.remove(path + '.part')
+    except FileNotFoundError:
+        pass
+
+
+# ============================ ОЧЕРЕДЬ ЗАГРУЗОК ============================
+
+class MediaIngestQueue:
+    """
+    Фоновая загрузка медиафайлов пользователей.
+    Обработчик ставит файл в очередь и сразу продолжает диалог; загрузку выполняет
+    ограниченный пул обработчиков, записывая файл блоками во временный файл с атомарным переименованием.
+    """
+
+    def __init__(self, workers: int = MEDIA_WORKERS, maxsize: int = MEDIA_QUEUE_SIZE, client=None):
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._client = client
+        self._own_client = client is None
+        self._tasks = []
+        self._callbacks = set()  # Задачи on_done: загрузчик не ждет их и сразу берет следующий файл
+        self._inflight = {}  # path -> (Future, [on_done]), чтобы один и тот же файл не качать дважды
+
+    def use_client(self, client) -> None:
+        """Подменяет HTTP-клиент загрузок (например, на имитацию в нагрузочных тестах). Вызывать до start()."""
+        self._client = client
+        self._own_client = False
+
+    async def start(self) -> None:
+        """Запускает обработчиков. Вызывать не обязательно: submit запустит их сам при первой загрузке."""
+        if self._tasks:
+            return
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Дожидается загрузок из очереди и их обработчиков завершения, останавливает обработчиков."""
+        await self._queue.join()
+        while self._callbacks:
+            await asyncio.gather(*self._callbacks, return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._own_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        # Очередь привязывается к циклу событий: после остановки — новая, для следующего запуска приложения
+        self._queue = asyncio.Queue(maxsize=self._queue.maxsize)
+
+    async def submit(self, bot, file_id: str, path: str, on_done=None) -> asyncio.Future:
+        """
+        Ставит файл в очередь на загрузку.
+        :param bot: context.bot
+        :param file_id: file_id из Telegram
+        :param path: куда сохранить файл
+        :param on_done: async (path, error) — вызывается после загрузки (error=None при успехе)
+        :return: Future с путем к файлу после загрузки
+        """
+        if not self._tasks:
+            await self.start()
+        if path in self._inflight:
+            future, callbacks = self._inflight[path]
+        else:
+            future, callbacks = asyncio.get_running_loop().create_future(), []
+            self._inflight[path] = (future, callbacks)
+            await self._queue.put((bot, file_id, path))
+        if on_done is not None:
+            callbacks.append(on_done)
+        return future
+
+    async def _worker(self) -> None:
+        while True:
+            bot, file_id, path = await self._queue.get()
+            error = None
+            try:
+                await asyncio.wait_for(self._download(bot, file_id, path), DOWNLOAD_TIMEOUT)
+            except Exception as e:
+                error = e
+                logger.error("Не удалось сохранить файл %s: %s", path, e)
+            finally:
+                future, callbacks = self._inflight.pop(path)
+                self._queue.task_done()
+
+            if error is None:
+                future.set_result(path)
+            else:
+                future.set_exception(error)
+                future.exception()  # Ошибка уже залогирована, не ругаемся на необработанное исключение
+            if callbacks:
+                # Запись ссылки в базу ждет пачку run_db_batched: пока она идет, загрузчик качает следующий файл
+                task = asyncio.create_task(self._complete(path, error, callbacks))
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+
+    @staticmethod
+    async def _complete(path: str, error, callbacks: list) -> None:
+        for on_done in callbacks:
+            try:
+                await on_done(path, error)
+            except Exception:
+                logger.exception("Ошибка в обработчике завершения загрузки %s", path)
+
+    async def _download(self, bot, file_id: str, path: str) -> None:
+        file = await bot.get_file(file_id)
+        fh = await asyncio.to_thread(_open_part, path)
+        try:
+            if not str(file.file_path).startswith(('http://', 'https://')):
+                # Локальный Bot API сервер отдает путь к файлу, а не ссылку: копируем его так же через .part
+                await asyncio.to_thread(_copy_local, file.file_path, fh)
+            else:
+                async with self._client.stream('GET', file.file_path) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        await asyncio.to_thread(fh.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(_discard_part, fh, path)
+            raise
+        await asyncio.to_thread(_finish_part, fh, path)
+
+
+media_queue = MediaIngestQueue()
+
+
+# ============================ ХРАНИЛИЩЕ ПО СОДЕРЖИМОМУ ============================
+# Файл хранится один раз под своим file_unique_id; преподаватели ссылаются на него через teacher_media.
+# Файл появляется под своим именем только целиком (os.replace), поэтому, есть ли он, видно по диску без запроса к базе.
+
+def blob_path(file_unique_id: str) -> str:
+    """Путь к файлу: media/blobs/ab/cd/<file_unique_id>.mp4, каталоги — по хэшу идентификатора."""
+    digest = hashlib.sha1(file_unique_id.encode()).hexdigest()
+    return os.path.join(MEDIA_ROOT, 'blobs', digest[:2], digest[2:4], f'{file_unique_id}.mp4')
+
+
+# Готовый SQL: ссылки пишутся в общей транзакции run_db_batched, где тот же файл может прийти
+# от нескольких преподавателей сразу; проверка через session.get не видит еще не записанные объекты пачки
+MEDIA_BLOB_SQL = text(
+    "INSERT INTO media_blobs (id, path, size, created_at) VALUES (:blob_id, :path, :size, :now) "
+    "ON CONFLICT (id) DO NOTHING"
+).bindparams(bindparam("now", type_=DateTime()))
+# Повторная отправка: старый файл станет сиротой и удалится при очистке
+TEACHER_MEDIA_SQL = text(
+    "INSERT INTO teacher_media (teacher_id, kind, blob_id, created_at) VALUES (:teacher_id, :kind, :blob_id, :now) "
+    "ON CONFLICT (teacher_id, kind) DO UPDATE SET blob_id = excluded.blob_id, created_at = excluded.created_at"
+).bindparams(bindparam("now", type_=DateTime()))
+
+
+# teachers.video_path — последнее видео собеседования, только когда файл уже на диске и связан с анкетой
+VIDEO_PATH_SQL = text("UPDATE teachers SET video_path = :path WHERE id = :teacher_id")
+
+
+def _link_media(session, teacher_id: int, kind: str, blob_id: str, path: str, size) -> None:
+    now = datetime.utcnow()
+    session.execute(MEDIA_BLOB_SQL, {"blob_id": blob_id, "path": path, "size": size, "now": now})
+    session.execute(TEACHER_MEDIA_SQL, {"teacher_id": teacher_id, "kind": kind, "blob_id": blob_id, "now": now})
+    if kind in INTERVIEW_VIDEO_KINDS:
+        session.execute(VIDEO_PATH_SQL, {"teacher_id": teacher_id, "path": path})
+
+
+def teacher_videos(session, teacher_id: int) -> dict:
+    """Видео преподавателя: {вид: путь к файлу}."""
+    rows = session.query(TeacherMedia.kind, MediaBlob.path).join(
+        MediaBlob, MediaBlob.id == TeacherMedia.blob_id
+    ).filter(TeacherMedia.teacher_id == teacher_id)
+    return dict(rows)
+
+
+async def store_video(bot, video, teacher_id: int, kind: str, on_done=None) -> str:
+    """
+    Сохраняет видео преподавателя в хранилище. Если такой файл уже есть, он не скачивается повторно.
+    :param video: video_note или video из сообщения
+    :param teacher_id: id преподавателя
+    :param kind: вид видео (verification_video, lesson_video, ...)
+    :param on_done: async (path, error) — вызывается после загрузки
+    :return: путь к файлу
+    """
+    blob_id = video.file_unique_id
+    path = blob_path(blob_id)
+    size = await asyncio.to_thread(_file_size, path)
+    if size is not None:
+        await run_db_batched(_link_media, teacher_id, kind, blob_id, path, size)
+        return path
+
+    async def link(path, error):
+        if error is None:
+            size = await asyncio.to_thread(_file_size, path)
+            await run_db_batched(_link_media, teacher_id, kind, blob_id, path, size)
+        if on_done is not None:
+            await on_done(path, error)
+
+    await media_queue.submit(bot, video.file_id, path, on_done=link)
+    return path
+
+
+# ============================ ОЧИСТКА ============================
+
+def _compact_media(session, older_than: datetime) -> tuple:
+    """
+    Удаляет файлы, на которые не ссылается ни один преподаватель и которые старше older_than.
+    :return: (количество удаленных файлов, освобождено байт)
+    """
+    referenced = exists().where(TeacherMedia.blob_id == MediaBlob.id)
+    orphans = session.query(MediaBlob).filter(MediaBlob.created_at < older_than, ~referenced).all()
+    freed = 0
+    for blob in orphans:
+        try:
+            freed += os.path.getsize(blob.path)
+            os.remove(blob.path)
+        except FileNotFoundError:
+            pass
+        session.delete(blob)
+    return len(orphans), freed
+
+
+async def compact_media(context) -> None:
+    """Задача job_queue: удаление осиротевших видео."""
+    removed, freed = await run_db(_compact_media, datetime.utcnow() - ORPHAN_RETENTION)
+    logger.info("Очистка медиа: удалено файлов %d, освобождено %.1f MiB", removed, freed / 1024 / 1024)
@@ -0,0 +1,276 @@
+"""
+Метрики бота: время обработчиков, SQL-запросов и вызовов Bot API, переходы между состояниями, ошибки.
+
+Метрики отдаются в текстовом формате Prometheus по адресу /metrics (в режиме вебхука — на том же
+сервере, иначе — на отдельном порту METRICS_PORT) и периодически пишутся в лог.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from telegram.request import BaseRequest
+
+# ============================ НАСТРОЙКА ============================
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 — отдельный сервер метрик не запускается
+METRICS_DUMP_INTERVAL = int(os.environ.get("METRICS_DUMP_INTERVAL", "600"))  # Секунд между записями в лог
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger(__name__)
+
+
+# ============================ ТИПЫ МЕТРИК ============================
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label_values -> [счетчики по корзинам..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *label_values):
+        """Контекстный менеджер: замеряет время блока."""
+        return _Timer(self, label_values)
+
+    def quantile(self, q: float, *label_values) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        series = self._series.get(label_values)
+        if not series or not series[-1]:
+            return 0.0
+        rank = q * series[-1]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def series(self) -> dict:
+        """{значения меток: (количество, сумма)}."""
+        return {label_values: (series[-1], series[-2]) for label_values, series in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(names, label_values + (le,))} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+# ============================ МЕТРИКИ БОТА ============================
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время работы обработчика", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+STATE_TRANSITIONS = Counter("bot_state_transitions_total", "Переходы между состояниями диалога", ["from", "to"])
+DB_QUERY_SECONDS = Histogram("bot_db_query_seconds", "Время SQL-запроса", ["operation"])
+DB_ERRORS = Counter("bot_db_errors_total", "Ошибки SQL-запросов", ["operation"])
+API_SECONDS = Histogram("bot_api_seconds", "Время вызова Bot API", ["method"])
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки вызовов Bot API", ["method"])
+UPDATES_SHED = Counter("bot_updates_shed_total", "Обновления, отброшенные при перегрузке", ["reason"])
+FUNNEL_EVENTS_DROPPED = Counter("bot_funnel_events_dropped_total", "События воронки, не записанные в базу", ["reason"])
+
+REGISTRY = [HANDLER_SECONDS, HANDLER_ERRORS, STATE_TRANSITIONS, DB_QUERY_SECONDS, DB_ERRORS, API_SECONDS, API_ERRORS,
+            UPDATES_SHED, FUNNEL_EVENTS_DROPPED]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def count_transition(old_state, new_state) -> None:
+    STATE_TRANSITIONS.inc(old_state if old_state is not None else "none", new_state if new_state is not None else "end")
+
+
+# ============================ ОБРАБОТЧИКИ ============================
+
+def instrument_handler(callback, name: str = None):
+    """Декоратор: время работы и ошибки обработчика."""
+    name = name or callback.__name__
+
+    @wraps(callback)
+    async def instrumented(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return instrumented
+
+
+def instrument_application(app) -> None:
+    """Оборачивает все зарегистрированные обработчики приложения."""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument_handler(handler.callback)
+
+
+# ============================ БАЗА ДАННЫХ ============================
+
+def instrument_engine(engine) -> None:
+    """Подписывается на события SQLAlchemy: время и ошибки каждого запроса по типу операции."""
+    from sqlalchemy import event
+
+    if getattr(engine, "_bot_metrics", False):
+        return
+    engine._bot_metrics = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.observe(time.perf_counter() - context._metrics_started, _operation(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def error(context):
+        DB_ERRORS.inc(_operation(context.statement or ""))
+
+
+def _operation(statement: str) -> str:
+    """Первое слово запроса (SELECT, INSERT, ...); после него может идти и перевод строки."""
+    words = statement.split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+
+# ============================ BOT API ============================
+
+class InstrumentedRequest(BaseRequest):
+    """Обертка над транспортом Bot API: время и ошибки каждого метода (sendMessage, getFile, ...)."""
+
+    def __init__(self, inner: BaseRequest):
+        self._inner = inner
+
+    @property
+    def read_timeout(self):
+        return self._inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self._inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self._inner.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await self._inner.do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout,
+                write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout
+            )
+        except Exception:
+            API_ERRORS.inc(api_method)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, api_method)
+        if status >= 400:
+            API_ERRORS.inc(api_method)
+        return status, payload
+
+
+# ============================ ВЫДАЧА МЕТРИК ============================
+
+# aiohttp импортируется только здесь: без вебхука и сервера метрик он боту не нужен (~150ms при запуске)
+async def metrics_view(request):
+    from aiohttp import web
+
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0"):
+    """
+    Отдельный HTTP-сервер с /metrics (для режима polling).
+    :return: aiohttp.web.AppRunner — остановить через cleanup()
+    """
+    from aiohttp import web
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на порту %s", port)
+    return runner
+
+
+async def dump_metrics(context) -> None:
+    """Задача job_queue: краткая сводка по обработчикам в лог."""
+    for (handler,), (count, total) in sorted(HANDLER_SECONDS.series().items()):
+        logger.info(
+            "Обработчик %s: вызовов %d, среднее %.1fms, p99 <= %.0fms, ошибок %d",
+            handler, count, total / count * 1000, HANDLER_SECONDS.quantile(0.99, handler) * 1000,
+            HANDLER_ERRORS.value(handler)
+        )
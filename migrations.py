@@ -0,0 +1,425 @@
+"""
+Версионные миграции схемы teachers.db.
+
+Версия схемы хранится в самом файле базы (PRAGMA user_version). При запуске бот сравнивает ее
+с последней миграцией — это один PRAGMA без чтения схемы. Если база отстала, недостающие
+миграции применяются по порядку в одной транзакции (BEGIN IMMEDIATE), поэтому несколько
+процессов, запущенных одновременно, применят их ровно один раз, а сбой посередине
+не оставит базу в промежуточном состоянии.
+
+Новая миграция — функция (connection) -> None, добавленная в конец MIGRATIONS.
+Уже выпущенные миграции не меняются.
+
+Запуск вручную:
+    python migrations.py
+"""
+import json
+import logging
+import re
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Column, Date, DateTime, Float, Index, Integer, LargeBinary, MetaData, String, Table, Text, bindparam, column,
+    exists, func, insert, inspect, select, table, text,
+)
+
+logger = logging.getLogger(__name__)
+
+_checked = set()  # Движки, схема которых уже проверена в этом процессе
+
+
+# ============================ МИГРАЦИИ ============================
+# Таблицы, константы и форматы данных миграции заданы в ней самой в том виде, какой был при ее выпуске,
+# а не берутся из models.py и модулей бота: иначе изменение модели незаметно меняло бы уже выпущенную
+# миграцию, и новая база отличалась бы от обновленной. Миграции не импортируют ничего, кроме SQLAlchemy.
+# Для чтения и записи хватает table()/column() с нужными столбцами.
+
+def _initial_schema(connection) -> None:
+    """
+    Схема на момент появления миграций. Базы, созданные раньше через create_all, уже содержат
+    часть таблиц, поэтому все создается с проверкой существования.
+    """
+    metadata = MetaData()
+    Table(
+        'teachers', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('full_name', String, nullable=False),
+        Column('city', String, nullable=False),
+        Column('birth_date', Date, nullable=False),
+        Column('hours_per_week', Integer),
+        Column('registration_time', DateTime),
+        Column('video_path', String, nullable=True),
+        Column('text_interview', Text, nullable=True),
+        Column('address', Text, nullable=True),
+        Column('stage', Integer, nullable=False, server_default='1'),
+        Index('ix_teachers_stage_registration', 'stage', 'registration_time'),
+    )
+    Table(
+        'reminder_log', metadata,
+        Column('teacher_id', Integer, primary_key=True),
+        Column('sent_at', DateTime),
+    )
+    Table(
+        'media_blobs', metadata,
+        Column('id', String, primary_key=True),
+        Column('path', String, nullable=False),
+        Column('size', Integer, nullable=True),
+        Column('created_at', DateTime),
+    )
+    Table(
+        'teacher_media', metadata,
+        Column('teacher_id', Integer, primary_key=True),
+        Column('kind', String, primary_key=True),
+        Column('blob_id', String, nullable=False, index=True),
+        Column('created_at', DateTime),
+    )
+    Table(
+        'job_state', metadata,  # Отметка прохода напоминаний; удаляется миграцией 8
+        Column('name', String, primary_key=True),
+        Column('watermark', DateTime, nullable=True),
+    )
+    Table(
+        'funnel_events', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, nullable=False, index=True),
+        Column('step', String, nullable=False),
+        Column('created_at', DateTime, nullable=False, index=True),
+    )
+    Table(
+        'funnel_users', metadata,
+        Column('user_id', Integer, primary_key=True),
+        Column('cohort', Date, nullable=False),
+        Column('city', String, nullable=False),
+    )
+    Table(
+        'funnel_progress', metadata,
+        Column('user_id', Integer, primary_key=True),
+        Column('step', String, primary_key=True),
+    )
+    Table(
+        'funnel_daily', metadata,
+        Column('cohort', Date, primary_key=True),
+        Column('city', String, primary_key=True),
+        Column('step', String, primary_key=True),
+        Column('users', Integer, nullable=False),
+    )
+    metadata.create_all(connection)
+
+    # Столбец stage появился позже таблицы teachers
+    columns = {column['name'] for column in inspect(connection).get_columns('teachers')}
+    if 'stage' not in columns:
+        connection.execute(text("ALTER TABLE teachers ADD COLUMN stage INTEGER NOT NULL DEFAULT 1"))
+        connection.execute(text("UPDATE teachers SET stage = 2 WHERE text_interview IS NOT NULL"))
+        connection.execute(text("UPDATE teachers SET stage = 3 WHERE address IS NOT NULL"))
+    for created in metadata.sorted_tables:
+        for index in created.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _reminder_jobs(connection) -> None:
+    """
+    Очередь напоминаний reminder_jobs. Ее заполняет регистрация, а до этой миграции напоминания
+    находились перебором анкет: ставим в очередь всех, кто заполнил анкету и еще не получил напоминание.
+    """
+    reminder_delay = timedelta(minutes=24)  # reminders.REMINDER_DELAY на момент миграции
+    registered = 1  # TeacherStage.REGISTERED
+
+    jobs = Table(
+        'reminder_jobs', MetaData(),
+        Column('teacher_id', Integer, primary_key=True),
+        Column('due_at', DateTime, nullable=False, index=True),
+    )
+    jobs.create(connection, checkfirst=True)
+    teacher = table('teachers', column('id', Integer), column('registration_time', DateTime), column('stage', Integer))
+    log = table('reminder_log', column('teacher_id', Integer))
+    rows = connection.execute(
+        select(teacher.c.id, teacher.c.registration_time).where(
+            teacher.c.stage == registered,
+            ~exists().where(log.c.teacher_id == teacher.c.id)
+        )
+    ).all()
+    now = datetime.utcnow()
+    if rows:
+        connection.execute(insert(jobs), [
+            {"teacher_id": teacher_id, "due_at": (registration_time or now) + reminder_delay}
+            for teacher_id, registration_time in rows
+        ])
+
+
+# Запись в индекс teacher_search (миграции 3 и 4), как search.INDEX_SQL и search.index_row на момент миграций
+_INDEX_SQL = text(
+    "INSERT OR REPLACE INTO teacher_search (rowid, answers, address, city) VALUES (:id, :answers, :address, :city)"
+)
+
+
+def _index_row(teacher_id: int, city, answers, address) -> dict:
+    def index_text(value) -> str:
+        return (value or "").replace("ё", "е").replace("Ё", "Е")
+
+    return {"id": teacher_id, "answers": index_text(answers), "address": index_text(address), "city": index_text(city)}
+
+
+def _summary_answers(text_interview) -> str:
+    """Ответы из текста сводки старого формата без заголовков вопросов (search.interview_answers)."""
+    if not text_interview:
+        return ""
+    return "\n".join(line.partition(": ")[2] or line for line in text_interview.splitlines())
+
+
+def _teacher_search(connection) -> None:
+    """
+    Полнотекстовый индекс анкет teacher_search (см. search.py): ответы собеседования, адрес и город.
+    Индекс хранит свою копию текста, rowid — id преподавателя. Заполняется по уже сохраненным анкетам.
+    prefix — готовые списки анкет для начал слов длиной до search.STEM_LENGTH.
+    """
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS teacher_search USING fts5("
+        "answers, address, city, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6')"
+    )
+    teacher = table('teachers', column('id', Integer), column('city', String), column('text_interview', Text),
+                    column('address', Text))
+    rows = connection.execute(
+        select(teacher.c.id, teacher.c.city, teacher.c.text_interview, teacher.c.address).execution_options(yield_per=5000)
+    )
+    for batch in rows.partitions():
+        connection.execute(_INDEX_SQL, [_index_row(*row) for row in batch])
+
+
+def _interview_answers(connection) -> None:
+    """
+    Ответы собеседования в teachers.interview (см. answers.py) вместо текста сводки в text_interview.
+    Разобранный текст очищается; текст, который не совпал с форматом сводки, остается как есть.
+    Миграция 3 проиндексировала сводки вместе с заголовками вопросов: эти анкеты индексируются
+    заново, только по текстам ответов.
+    Освободившееся место SQLite переиспользует для новых строк; уменьшить сам файл — VACUUM вручную.
+    """
+    # Вопросы сводки и формат teachers.interview на момент миграции (answers.py)
+    questions = (
+        ("experience_kids", "Опыт взаимодействия с младшими школьниками"),
+        ("experience_robo", "Опыт в робототехнике"),
+        ("interview_city", "Города для работы"),
+        ("free_time", "Свободное время"),
+        ("best_skills", "Лучшие навыки"),
+    )
+    compress_min_size = 256
+    summary = re.compile("".join(f"{re.escape(label)}: (.*?)\n" for _, label in questions) + r"\Z", re.S)
+
+    def parse_summary(text_interview: str):
+        match = summary.match(text_interview)
+        if match is None:
+            return None
+        return {key: None if value == "None" else value for (key, _), value in zip(questions, match.groups())}
+
+    def pack_answers(answers: dict) -> bytes:
+        data = json.dumps([answers.get(key) for key, _ in questions], ensure_ascii=False, separators=(",", ":")).encode()
+        if len(data) >= compress_min_size:
+            compressed = zlib.compress(data, 9)
+            if len(compressed) < len(data):
+                return compressed
+        return data
+
+    def answers_text(answers: dict) -> str:
+        return "\n".join(str(value) for value in answers.values() if value is not None)
+
+    columns = {column['name'] for column in inspect(connection).get_columns('teachers')}
+    if 'interview' not in columns:
+        connection.execute(text("ALTER TABLE teachers ADD COLUMN interview BLOB"))
+    teacher = table('teachers', column('id', Integer), column('text_interview', Text), column('city', String),
+                    column('address', Text), column('interview', LargeBinary))
+    update = (
+        teacher.update().where(teacher.c.id == bindparam("teacher_id"))
+        .values(interview=bindparam("packed"), text_interview=None)
+    )
+    last_id = None
+    while True:
+        # Пачками по id: таблицу, которую читает открытый курсор, SQLite менять не рекомендует
+        query = (
+            select(teacher.c.id, teacher.c.text_interview, teacher.c.city, teacher.c.address)
+            .where(teacher.c.text_interview.is_not(None))
+        )
+        if last_id is not None:
+            query = query.where(teacher.c.id > last_id)
+        batch = connection.execute(query.order_by(teacher.c.id).limit(5000)).all()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        parsed = [(row, parse_summary(row.text_interview)) for row in batch]
+        converted = [{"teacher_id": row.id, "packed": pack_answers(answers)}
+                     for row, answers in parsed if answers is not None]
+        if converted:
+            connection.execute(update, converted)
+        connection.execute(_INDEX_SQL, [
+            _index_row(row.id, row.city, answers_text(answers) if answers is not None
+                       else _summary_answers(row.text_interview), row.address)
+            for row, answers in parsed
+        ])
+        if len(converted) < len(batch):
+            logger.warning("Миграция 4: %d анкет не в формате сводки, текст оставлен в text_interview",
+                           len(batch) - len(converted))
+
+
+def _candidate_scores(connection) -> None:
+    """Таблица оценок кандидатов candidate_scores. Заполняется задачей оценки (см. scoring.py)."""
+    scores = Table(
+        'candidate_scores', MetaData(),
+        Column('teacher_id', Integer, primary_key=True),
+        Column('input_hash', Integer, nullable=False),
+        Column('score', Float, nullable=False, index=True),
+        Column('kids_hits', Integer, nullable=False),
+        Column('robo_hits', Integer, nullable=False),
+        Column('hours_per_week', Float, nullable=False),
+        Column('distance_km', Float, nullable=True),
+        Column('scored_at', DateTime, nullable=False),
+    )
+    scores.create(connection, checkfirst=True)
+
+
+def _teacher_counters(connection) -> None:
+    """
+    Счетчики анкет по городам и этапам teacher_counters (см. admin.py). Дальше их ведет repository.py,
+    здесь — один подсчет по уже сохраненным анкетам.
+    """
+    counter = Table(
+        'teacher_counters', MetaData(),
+        Column('city', String, primary_key=True),
+        Column('stage', Integer, primary_key=True),
+        Column('teachers', Integer, nullable=False),
+    )
+    teacher = table('teachers', column('city', String), column('stage', Integer))
+    counter.create(connection, checkfirst=True)
+    connection.execute(counter.delete())
+    connection.execute(insert(counter).from_select(
+        ["city", "stage", "teachers"],
+        select(teacher.c.city, teacher.c.stage, func.count()).group_by(teacher.c.city, teacher.c.stage)
+    ))
+
+
+def _scoring_jobs(connection) -> None:
+    """
+    Очередь пересчета оценок scoring_jobs (см. scoring.py). До нее проход оценки сверял хэши всех
+    анкет, поэтому изменения, не дошедшие до оценки, неизвестны: в очередь ставятся все анкеты
+    с ответами собеседования, неизменившиеся задача снимет по хэшу без пересчета.
+    """
+    jobs = Table(
+        'scoring_jobs', MetaData(),
+        Column('teacher_id', Integer, primary_key=True),
+        Column('queued_at', DateTime, nullable=False, index=True),
+    )
+    teacher = table('teachers', column('id', Integer), column('interview', LargeBinary), column('text_interview', Text))
+    jobs.create(connection, checkfirst=True)
+    for index in jobs.indexes:
+        index.create(connection, checkfirst=True)
+    connection.execute(insert(jobs).from_select(
+        ["teacher_id", "queued_at"],
+        select(teacher.c.id, bindparam("now", datetime.utcnow()))
+        .where((teacher.c.interview.is_not(None)) | (teacher.c.text_interview.is_not(None)))
+    ))
+
+
+def _drop_job_state(connection) -> None:
+    """
+    Таблица job_state хранила отметку (watermark), с которой проход напоминаний продолжал перебор анкет
+    по индексу ix_teachers_stage_registration. Этот проход заменила очередь reminder_jobs (миграция 2),
+    и таблицу больше никто не читает. Индекс остается: по нему листает анкеты admin.py.
+    """
+    connection.exec_driver_sql("DROP TABLE IF EXISTS job_state")
+
+
+def _reminder_attempts(connection) -> None:
+    """
+    Неудачные попытки напоминаний: счетчик attempts и отметка failed_at в reminder_jobs (см. reminders.py).
+    Индекс по due_at заменяется частичным — только по заданиям без failed_at, чтобы неудавшиеся
+    задания не просматривались при каждом проходе. Журнал reminder_log больше не нужен:
+    в него только писали, очередь напоминаний ведется в reminder_jobs.
+    """
+    columns = {column['name'] for column in inspect(connection).get_columns('reminder_jobs')}
+    if 'attempts' not in columns:
+        connection.exec_driver_sql("ALTER TABLE reminder_jobs ADD COLUMN attempts INTEGER DEFAULT '0' NOT NULL")
+    if 'failed_at' not in columns:
+        connection.exec_driver_sql("ALTER TABLE reminder_jobs ADD COLUMN failed_at DATETIME")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_reminder_jobs_due_at")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_reminder_jobs_pending_due ON reminder_jobs (due_at) WHERE failed_at IS NULL"
+    )
+    connection.exec_driver_sql("DROP TABLE IF EXISTS reminder_log")
+
+
+def _registration_time_required(connection) -> None:
+    """
+    Время регистрации у каждой анкеты: страницы /pending (admin.py) листаются по ключу
+    (registration_time, id), и анкеты без времени в них не попадали. Неизвестное время считается
+    самым ранним из известных — такие анкеты оказываются в конце списка, по порядку id.
+    """
+    teacher = table('teachers', column('registration_time', DateTime))
+    connection.execute(
+        teacher.update().where(teacher.c.registration_time.is_(None)).values(
+            registration_time=func.coalesce(
+                select(func.min(teacher.c.registration_time)).scalar_subquery(),
+                bindparam("now", datetime.utcnow(), type_=DateTime()),
+            )
+        )
+    )
+
+
+MIGRATIONS = [
+    _initial_schema,  # 1
+    _reminder_jobs,  # 2
+    _teacher_search,  # 3
+    _interview_answers,  # 4
+    _candidate_scores,  # 5
+    _teacher_counters,  # 6
+    _scoring_jobs,  # 7
+    _drop_job_state,  # 8
+    _reminder_attempts,  # 9
+    _registration_time_required,  # 10
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+# ============================ ЗАПУСК МИГРАЦИЙ ============================
+
+def schema_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine=None) -> int:
+    """
+    Приводит схему базы к последней версии.
+    Повторный вызов для того же движка в этом процессе ничего не делает.
+    :return: версия схемы после миграции
+    """
+    if engine is None:
+        from db import engine
+    if engine in _checked:
+        return LATEST_VERSION
+
+    # Autocommit на уровне драйвера: транзакцией управляем сами, чтобы DDL попал в нее же
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        version = schema_version(connection)
+        if version < LATEST_VERSION:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")  # Остальные процессы ждут здесь
+            try:
+                version = schema_version(connection)  # Пока ждали, мог успеть другой процесс
+                for number in range(version + 1, LATEST_VERSION + 1):
+                    started = time.perf_counter()
+                    MIGRATIONS[number - 1](connection)
+                    logger.info("Миграция %d (%s) применена за %.2fs", number, MIGRATIONS[number - 1].__name__,
+                                time.perf_counter() - started)
+                connection.exec_driver_sql(f"PRAGMA user_version = {LATEST_VERSION}")
+                connection.exec_driver_sql("COMMIT")
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            version = LATEST_VERSION
+        elif version > LATEST_VERSION:
+            raise RuntimeError(f"Схема базы версии {version} новее, чем знает этот код ({LATEST_VERSION})")
+
+    _checked.add(engine)
+    return version
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"Версия схемы: {migrate()}")
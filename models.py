@@ -1,11 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text, DateTime
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Date, Text, DateTime, Index, LargeBinary, Float, text
 from sqlalchemy.orm import declarative_base
-from datetime import date, datetime
+from datetime import datetime
 
 Base = declarative_base()
 
 
+# Этапы воронки, которые прошел преподаватель
+class TeacherStage:
+    REGISTERED = 1  # Заполнил анкету
+    INTERVIEWED = 2  # Подтвердил ответы собеседования
+    ADDRESS_CONFIRMED = 3  # Подтвердил адрес для отправки набора
+
+
 # Определяем модель Преподавателя
 class Teacher(Base):
     __tablename__ = 'teachers'  # Имя таблицы в базе данных
@@ -15,10 +21,17 @@ class Teacher(Base):
     city = Column(String, nullable=False)  # Город
     birth_date = Column(Date, nullable=False)  # Дата рождения
     hours_per_week = Column(Integer, default=0)  # Часы в неделю (по умолчанию 0)
-    registration_time = Column(DateTime, default=datetime.utcnow)  # Время регистрации
+    registration_time = Column(DateTime, nullable=False, default=datetime.utcnow)  # Время регистрации (миграция 10)
     video_path = Column(String, nullable=True)  # Путь к видеофайлу (может быть пустым)
-    text_interview = Column(Text, nullable=True)  # Текст интервью
+    text_interview = Column(Text, nullable=True)  # Текст интервью в старом формате, который не удалось разобрать
+    interview = Column(LargeBinary, nullable=True)  # Ответы собеседования (см. answers.pack_answers)
     address = Column(Text, nullable=True) # Адрес для отправки набора
+    stage = Column(Integer, nullable=False, default=TeacherStage.REGISTERED, server_default='1')  # Этап воронки
+
+    __table_args__ = (
+        # Страницы /pending (admin.py): этап + время регистрации, id берется из самого индекса
+        Index('ix_teachers_stage_registration', 'stage', 'registration_time'),
+    )
 
     def __repr__(self):
         return (f"<Teacher(full_name='{self.full_name}', city='{self.city}', "
@@ -26,10 +39,113 @@ class Teacher(Base):
                 f"survey_completed={self.survey_completed}, video_path='{self.video_path}')>")
 
 
-# Создаем базу данных и таблицы
-def create_database():
-    engine = create_engine('sqlite:///teachers.db')  # Используем SQLite для примера
-    Base.metadata.create_all(engine)  # Создаем таблицы
+# Запланированное напоминание: одна строка на пользователя, который заполнил анкету, но еще не прошел
+# собеседование. Индекс по due_at — очередь по времени: проход рассылки читает только наступившие.
+# Напоминание, которое так и не удалось отправить, остается в таблице с failed_at и в очередь не попадает
+class ReminderJob(Base):
+    __tablename__ = 'reminder_jobs'
+
+    teacher_id = Column(Integer, primary_key=True)  # id преподавателя (Telegram user_id)
+    due_at = Column(DateTime, nullable=False)  # Когда отправить напоминание (UTC)
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')  # Неудачных проходов рассылки
+    failed_at = Column(DateTime, nullable=True)  # Когда попытки кончились (NULL — напоминание в очереди)
+
+    __table_args__ = (
+        Index('ix_reminder_jobs_pending_due', 'due_at', sqlite_where=text('failed_at IS NULL')),
+    )
+
+
+# Медиафайл в хранилище, адресуемом по содержимому (один файл на file_unique_id)
+class MediaBlob(Base):
+    __tablename__ = 'media_blobs'
+
+    id = Column(String, primary_key=True)  # file_unique_id из Telegram
+    path = Column(String, nullable=False)  # Путь к файлу на диске
+    size = Column(Integer, nullable=True)  # Размер в байтах
+    created_at = Column(DateTime, default=datetime.utcnow)  # Время сохранения
+
+
+# Какие видео прислал преподаватель (одно на каждый вид: проверочное, урок и т.д.)
+class TeacherMedia(Base):
+    __tablename__ = 'teacher_media'
+
+    teacher_id = Column(Integer, primary_key=True)  # id преподавателя (Telegram user_id)
+    kind = Column(String, primary_key=True)  # Вид видео, например verification_video
+    blob_id = Column(String, nullable=False, index=True)  # Ссылка на MediaBlob.id
+    created_at = Column(DateTime, default=datetime.utcnow)  # Время отправки
+
+
+# Журнал событий воронки: каждый шаг пользователя (команда, ответ, подтверждение)
+class FunnelEvent(Base):
+    __tablename__ = 'funnel_events'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)  # Telegram user_id
+    step = Column(String, nullable=False)  # Шаг воронки (см. analytics.FUNNEL_STEPS) или состояние диалога
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)  # Время события
+
+
+# Когорта и город пользователя для агрегатов воронки
+class FunnelUser(Base):
+    __tablename__ = 'funnel_users'
 
+    user_id = Column(Integer, primary_key=True)  # Telegram user_id
+    cohort = Column(Date, nullable=False)  # День первого события пользователя
+    city = Column(String, nullable=False, default='')  # Город из анкеты ('' — пока неизвестен)
 
-create_database()
+
+# Какие шаги пользователь уже прошел (каждый шаг учитывается в агрегатах один раз)
+class FunnelProgress(Base):
+    __tablename__ = 'funnel_progress'
+
+    user_id = Column(Integer, primary_key=True)
+    step = Column(String, primary_key=True)
+
+
+# Агрегат: сколько пользователей когорты из города дошли до шага
+class FunnelDaily(Base):
+    __tablename__ = 'funnel_daily'
+
+    cohort = Column(Date, primary_key=True)
+    city = Column(String, primary_key=True)
+    step = Column(String, primary_key=True)
+    users = Column(Integer, nullable=False, default=0)
+
+
+# Оценка кандидата по ответам собеседования (см. scoring.py). Индекс по score — список лучших кандидатов
+class CandidateScore(Base):
+    __tablename__ = 'candidate_scores'
+
+    teacher_id = Column(Integer, primary_key=True)  # id преподавателя (Telegram user_id)
+    input_hash = Column(Integer, nullable=False)  # Хэш ответов и города, по которым посчитана оценка
+    score = Column(Float, nullable=False, index=True)  # Оценка от 0 до 100
+    kids_hits = Column(Integer, nullable=False)  # Ключевых слов про опыт с детьми
+    robo_hits = Column(Integer, nullable=False)  # Ключевых слов про робототехнику
+    hours_per_week = Column(Float, nullable=False)  # Свободных часов в неделю
+    distance_km = Column(Float, nullable=True)  # До ближайшего названного города (NULL — город не назван)
+    scored_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # Время расчета
+
+
+# Анкета, оценку которой нужно пересчитать (см. scoring.py): ставится при сохранении ответов
+# собеседования. Проход оценки читает только очередь, а не все анкеты
+class ScoringJob(Base):
+    __tablename__ = 'scoring_jobs'
+
+    teacher_id = Column(Integer, primary_key=True)  # id преподавателя (Telegram user_id)
+    queued_at = Column(DateTime, nullable=False, index=True)  # Когда анкета изменилась (UTC)
+
+
+# Сколько анкет из города на каждом этапе воронки (для /stats, см. admin.py).
+# Меняется в той же транзакции, что и этап анкеты (см. repository.py), вместо COUNT(*) по teachers
+class TeacherCounter(Base):
+    __tablename__ = 'teacher_counters'
+
+    city = Column(String, primary_key=True)  # Город из анкеты
+    stage = Column(Integer, primary_key=True)  # Этап воронки (TeacherStage)
+    teachers = Column(Integer, nullable=False, default=0)  # Анкет на этом этапе
+
+
+# Создаем базу данных и таблицы (применяем недостающие миграции, см. migrations.py)
+def create_database():
+    from migrations import migrate
+    migrate()
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, bindparam, case, text
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from db import run_db_batched
+from models import ReminderJob, Teacher, TeacherStage
+
+# ============================ НАСТРОЙКА ============================
+REMINDER_TEXT = "Напоминаем вам, что вы еще не прошли анкетирование. Пожалуйста, перейдите ко второму шагу."
+REMINDER_DELAY = timedelta(minutes=24)  # Через сколько после регистрации напоминать
+RETRY_DELAY = timedelta(minutes=10)  # Когда повторить напоминание, которое не удалось отправить
+PAGE_SIZE = 500  # Сколько наступивших напоминаний читать из базы за раз
+SEND_RATE = 25  # Сообщений в секунду (лимит Telegram — около 30)
+SEND_WORKERS = 8  # Одновременных отправок
+MAX_ATTEMPTS = 4  # Попыток отправки одного напоминания за проход
+MAX_JOB_ATTEMPTS = 5  # Проходов с ошибкой сети, после которых напоминание больше не повторяется
+BACKOFF_BASE = 1.0  # Начальная пауза между попытками, секунды
+
+logger = logging.getLogger(__name__)
+
+
+# ============================ ОГРАНИЧЕНИЕ СКОРОСТИ ============================
+
+class TokenBucket:
+    """
+    Ограничитель скорости «ведро с токенами»: не больше rate операций в секунду
+    с допустимым всплеском до capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# ============================ ЗАПРОСЫ ============================
+
+# Готовый SQL: выполняется и в транзакциях анкеты (repository.py), чтобы регистрация и собеседование
+# не ждали отдельной пачки ради напоминания. Новое расписание сбрасывает счетчик неудач
+SCHEDULE_JOB_SQL = text(
+    "INSERT INTO reminder_jobs (teacher_id, due_at, attempts, failed_at) VALUES (:teacher_id, :due_at, 0, NULL) "
+    "ON CONFLICT (teacher_id) DO UPDATE SET due_at = excluded.due_at, attempts = 0, failed_at = NULL"
+).bindparams(bindparam("due_at", type_=DateTime()))
+CANCEL_JOB_SQL = text("DELETE FROM reminder_jobs WHERE teacher_id = :teacher_id")
+
+
+def _save_job(session, teacher_id: int, due_at: datetime) -> None:
+    session.execute(SCHEDULE_JOB_SQL, {"teacher_id": teacher_id, "due_at": due_at})
+
+
+def _delete_job(session, teacher_id: int) -> None:
+    session.execute(CANCEL_JOB_SQL, {"teacher_id": teacher_id})
+
+
+def _take_due(session, now: datetime, limit: int) -> tuple:
+    """
+    Следующая страница наступивших напоминаний по индексу reminder_jobs.due_at: читаются только
+    они, сколько бы анкет, будущих и неудавшихся напоминаний ни было в базе. Задания тех, кто уже прошел
+    собеседование (или удален), снимаются без отправки.
+    :return: (id получателей, сколько заданий прочитано)
+    """
+    rows = session.query(ReminderJob.teacher_id, Teacher.stage).outerjoin(
+        Teacher, Teacher.id == ReminderJob.teacher_id
+    ).filter(
+        ReminderJob.failed_at.is_(None), ReminderJob.due_at <= now  # Условие частичного индекса
+    ).order_by(ReminderJob.due_at).limit(limit).all()
+    due = [teacher_id for teacher_id, stage in rows if stage == TeacherStage.REGISTERED]
+    if len(due) < len(rows):
+        session.query(ReminderJob).filter(
+            ReminderJob.teacher_id.in_([teacher_id for teacher_id, stage in rows if stage != TeacherStage.REGISTERED])
+        ).delete(synchronize_session=False)
+    return due, len(rows)
+
+
+def _finish_page(session, done: list, retry: list, retry_at: datetime) -> int:
+    """
+    Итог страницы: задания отправленных и недоступных пользователей удаляются, неудачные
+    переносятся на retry_at. Задание, у которого это MAX_JOB_ATTEMPTS-я неудача, помечается
+    failed_at и больше не отправляется.
+    :return: сколько заданий помечено неудавшимися
+    """
+    if done:
+        session.query(ReminderJob).filter(ReminderJob.teacher_id.in_(done)).delete(synchronize_session=False)
+    if not retry:
+        return 0
+    now = datetime.utcnow()
+    session.query(ReminderJob).filter(ReminderJob.teacher_id.in_(retry)).update({
+        ReminderJob.attempts: ReminderJob.attempts + 1,
+        ReminderJob.due_at: retry_at,
+        # В SET SQLite видит значения до изменения строки
+        ReminderJob.failed_at: case((ReminderJob.attempts + 1 >= MAX_JOB_ATTEMPTS, now), else_=None),
+    }, synchronize_session=False)
+    return session.query(ReminderJob).filter(
+        ReminderJob.teacher_id.in_(retry), ReminderJob.failed_at.is_not(None)
+    ).count()
+
+
+# ============================ РАССЫЛКА ============================
+
+class ReminderDispatcher:
+    """
+    Напоминания по расписанию. Регистрация ставит задание в reminder_jobs, подтверждение
+    собеседования его снимает — в тех же транзакциях, что и анкета (см. repository.py), или
+    отдельно через schedule и cancel. Проход рассылки (run, раз в main.REMINDER_TICK секунд) забирает
+    наступившие задания страницами и отправляет их пулом обработчиков с общим ограничением скорости
+    и повторами с экспоненциальной паузой. Напоминание, которое не ушло и за MAX_JOB_ATTEMPTS проходов,
+    помечается failed_at: оно остается в reminder_jobs для разбора, но в очередь больше не попадает.
+    Очередь хранится в базе, поэтому переживает перезапуск и общая для всех процессов бота (см. workers.py).
+    """
+
+    def __init__(self, rate: float = SEND_RATE, workers: int = SEND_WORKERS, page_size: int = PAGE_SIZE):
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.page_size = page_size
+        self._running = asyncio.Lock()
+
+    async def schedule(self, teacher_id: int, due_at: datetime = None) -> None:
+        """Планирует напоминание (по умолчанию — через REMINDER_DELAY). Повторный вызов переносит его."""
+        await run_db_batched(_save_job, teacher_id, due_at or datetime.utcnow() + REMINDER_DELAY)
+
+    async def cancel(self, teacher_id: int) -> None:
+        """Снимает напоминание (пользователь перешел к следующему этапу)."""
+        await run_db_batched(_delete_job, teacher_id)
+
+    async def run(self, bot) -> dict:
+        """
+        Отправляет все наступившие напоминания.
+        :return: статистика прохода (sent, failed, retried, dead, elapsed, rate)
+        """
+        if self._running.locked():
+            logger.warning("Предыдущая рассылка напоминаний еще не закончилась, пропускаем запуск")
+            return {}
+
+        async with self._running:
+            stats = {"sent": 0, "failed": 0, "retried": 0, "dead": 0}
+            started = time.monotonic()
+            now = datetime.utcnow()
+            while True:
+                due, fetched = await run_db_batched(_take_due, now, self.page_size)
+                if due:
+                    await self._send_page(bot, due, stats)
+                if fetched < self.page_size:
+                    break
+
+            stats["elapsed"] = time.monotonic() - started
+            stats["rate"] = stats["sent"] / stats["elapsed"] if stats["elapsed"] else 0.0
+            if stats["sent"] or stats["failed"]:
+                logger.info(
+                    "Напоминания: отправлено %d, ошибок %d (повторим позже %d) за %.1fs, %.1f сообщений/с",
+                    stats["sent"], stats["failed"], stats["retried"], stats["elapsed"], stats["rate"]
+                )
+            if stats["dead"]:
+                logger.warning("Напоминания: %d не удалось отправить за %d проходов, больше не повторяем",
+                               stats["dead"], MAX_JOB_ATTEMPTS)
+            return stats
+
+    async def _send_page(self, bot, due: list, stats: dict) -> None:
+        queue = asyncio.Queue()
+        for teacher_id in due:
+            queue.put_nowait(teacher_id)
+        sent, undeliverable, retry = [], [], []
+        workers = [asyncio.create_task(self._worker(bot, queue, sent, undeliverable, retry))
+                   for _ in range(min(self.workers, len(due)))]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        # Страница фиксируется целиком: следующий запрос _take_due ее уже не увидит
+        dead = await run_db_batched(_finish_page, sent + undeliverable, retry, datetime.utcnow() + RETRY_DELAY)
+        stats["sent"] += len(sent)
+        stats["failed"] += len(undeliverable) + len(retry)
+        stats["retried"] += len(retry) - dead
+        stats["dead"] += dead
+
+    async def _worker(self, bot, queue: asyncio.Queue, sent: list, undeliverable: list, retry: list) -> None:
+        while True:
+            teacher_id = await queue.get()
+            try:
+                if await self._send(bot, teacher_id):
+                    sent.append(teacher_id)
+                else:
+                    undeliverable.append(teacher_id)
+            except Exception:
+                retry.append(teacher_id)
+                logger.exception("Ошибка при отправке напоминания %s", teacher_id)
+            finally:
+                queue.task_done()
+
+    async def _send(self, bot, teacher_id: int) -> bool:
+        """
+        Отправляет одно напоминание с повторами.
+        :return: False, если пользователь недоступен (заблокировал бота и т.п.) — повторять бессмысленно
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(chat_id=teacher_id, text=REMINDER_TEXT)
+                return True
+            except RetryAfter as e:
+                # Telegram сам говорит, сколько ждать
+                delay = e.retry_after
+                await asyncio.sleep(delay.total_seconds() if isinstance(delay, timedelta) else delay)
+            except (Forbidden, BadRequest) as e:
+                logger.info("Напоминание %s не доставлено: %s", teacher_id, e)
+                return False
+            except NetworkError:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(BACKOFF_BASE * 2 ** (attempt - 1))
+        raise NetworkError(f"Не удалось отправить напоминание {teacher_id} за {MAX_ATTEMPTS} попыток")
+
+
+reminder_dispatcher = ReminderDispatcher()
+
+
+async def send_reminders(context) -> None:
+    """Задача job_queue: один проход рассылки напоминаний."""
+    await reminder_dispatcher.run(context.bot)
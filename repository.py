@@ -0,0 +1,212 @@
+"""
+Доступ к анкетам преподавателей (таблица teachers).
+
+Обработчики бота работают с базой только через TeacherRepository: запись идет группами через
+run_db_batched, чтение профиля — через кэш в памяти. Все изменения анкеты проходят через этот же
+объект, поэтому профиль в кэше обновляется сразу после коммита, а поисковый индекс (search.py), счетчики
+анкет по городам и этапам (teacher_counters, см. admin.py), очередь пересчета оценок
+(scoring_jobs, см. scoring.py) и напоминание о собеседовании (reminder_jobs, см. reminders.py)
+обновляются в той же транзакции: обработчик ждет одну пачку, а не по пачке на каждую таблицу. Обновления одного пользователя
+всегда обрабатывает один процесс (см. workers.py), так что кэши разных процессов не расходятся.
+"""
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import Date, DateTime, bindparam, text
+
+from answers import answers_text, collect_answers, pack_answers, unpack_answers
+from cache import TTLCache
+from db import run_db, run_db_batched
+from models import Teacher, TeacherStage
+from reminders import CANCEL_JOB_SQL, SCHEDULE_JOB_SQL
+from search import INDEX_SQL, index_row, interview_answers
+
+# ============================ НАСТРОЙКА ============================
+PROFILE_CACHE_SIZE = 10_000  # Профилей в памяти
+PROFILE_CACHE_TTL = 600  # Секунд, после которых профиль перечитывается из базы
+
+
+@dataclass(frozen=True)
+class TeacherProfile:
+    """Неизменяемый снимок анкеты: безопасно отдавать из кэша в разные обработчики."""
+    id: int
+    full_name: str
+    city: str
+    birth_date: Optional[date]
+    stage: int
+    address: Optional[str] = None
+
+
+# ============================ ЗАПРОСЫ К БАЗЕ ДАННЫХ ============================
+# Синхронные функции, выполняются в пуле потоков через run_db / run_db_batched.
+
+# Готовый SQL: upsert SQLAlchemy, построенный заново, компилируется при каждом вызове (~0.3ms на запись)
+COUNTER_DECREMENT_SQL = text(
+    "UPDATE teacher_counters SET teachers = teachers - 1 WHERE city = :city AND stage = :stage"
+)
+COUNTER_INCREMENT_SQL = text(
+    "INSERT INTO teacher_counters (city, stage, teachers) VALUES (:city, :stage, 1) "
+    "ON CONFLICT (city, stage) DO UPDATE SET teachers = teachers + 1"
+)
+
+# Вставка вместо session.get + session.add: проверка "уже зарегистрирован" и запись — один запрос
+REGISTER_SQL = text(
+    "INSERT INTO teachers (id, full_name, city, birth_date, hours_per_week, registration_time, stage) "
+    "VALUES (:id, :full_name, :city, :birth_date, 0, :registration_time, :stage) ON CONFLICT (id) DO NOTHING"
+).bindparams(bindparam("birth_date", type_=Date()), bindparam("registration_time", type_=DateTime()))
+
+# Запись этапов анкеты без загрузки объекта Teacher: в пачке это почти вдвое дешевле session.get и flush
+TEACHER_STATE_SQL = text("SELECT city, stage, interview, text_interview, address FROM teachers WHERE id = :id")
+SAVE_INTERVIEW_SQL = text(
+    "UPDATE teachers SET interview = :interview, text_interview = NULL, stage = :stage WHERE id = :id"
+)
+SAVE_ADDRESS_SQL = text("UPDATE teachers SET address = :address, stage = :stage WHERE id = :id")
+
+SCORING_JOB_SQL = text(
+    "INSERT INTO scoring_jobs (teacher_id, queued_at) VALUES (:id, :queued_at) "
+    "ON CONFLICT (teacher_id) DO UPDATE SET queued_at = excluded.queued_at"
+).bindparams(bindparam("queued_at", type_=DateTime()))
+
+
+def _move_counter(session, city: str, old_stage: Optional[int], new_stage: int) -> None:
+    """Переносит анкету в teacher_counters с этапа old_stage (None — новая анкета) на new_stage."""
+    if old_stage == new_stage:
+        return
+    if old_stage is not None:
+        session.execute(COUNTER_DECREMENT_SQL, {"city": city, "stage": old_stage})
+    session.execute(COUNTER_INCREMENT_SQL, {"city": city, "stage": new_stage})
+
+
+def _load_profile(session, user_id: int) -> Optional[TeacherProfile]:
+    teacher = session.get(Teacher, user_id)
+    if teacher is None:
+        return None
+    return TeacherProfile(teacher.id, teacher.full_name, teacher.city, teacher.birth_date,
+                          teacher.stage or TeacherStage.REGISTERED, teacher.address)
+
+
+def _register_teacher(session, user_id: int, full_name: str, city: str, birth_date, remind_at=None) -> bool:
+    """
+    Создает запись Teacher и, если задан remind_at, планирует напоминание о собеседовании.
+    Возвращает False, если пользователь уже проходил анкетирование.
+    """
+    created = session.execute(REGISTER_SQL, {
+        "id": user_id, "full_name": full_name, "city": city, "birth_date": birth_date,
+        "registration_time": datetime.utcnow(), "stage": TeacherStage.REGISTERED,
+    }).rowcount
+    if not created:
+        return False
+    session.execute(INDEX_SQL, index_row(user_id, city))
+    _move_counter(session, city, None, TeacherStage.REGISTERED)
+    if remind_at is not None:
+        session.execute(SCHEDULE_JOB_SQL, {"teacher_id": user_id, "due_at": remind_at})
+    return True
+
+
+def _save_interview(session, user_id: int, answers: dict) -> bool:
+    # teachers.video_path пишет media.py, когда видео уже скачано и связано с анкетой
+    teacher = session.execute(TEACHER_STATE_SQL, {"id": user_id}).first()
+    if teacher is None:
+        return False
+    answers = collect_answers(answers)
+    stage = teacher.stage or TeacherStage.REGISTERED
+    new_stage = max(stage, TeacherStage.INTERVIEWED)
+    session.execute(SAVE_INTERVIEW_SQL, {"id": user_id, "interview": pack_answers(answers), "stage": new_stage})
+    session.execute(INDEX_SQL, index_row(user_id, teacher.city, answers_text(answers), teacher.address))
+    _move_counter(session, teacher.city, stage, new_stage)
+    session.execute(SCORING_JOB_SQL, {"id": user_id, "queued_at": datetime.utcnow()})  # Оценка — в scoring.py
+    session.execute(CANCEL_JOB_SQL, {"teacher_id": user_id})  # Собеседование пройдено — напоминать не о чем
+    return True
+
+
+def _save_address(session, user_id: int, address: str) -> bool:
+    teacher = session.execute(TEACHER_STATE_SQL, {"id": user_id}).first()
+    if teacher is None:
+        return False
+    stage = teacher.stage or TeacherStage.REGISTERED
+    session.execute(SAVE_ADDRESS_SQL, {"id": user_id, "address": address, "stage": TeacherStage.ADDRESS_CONFIRMED})
+    session.execute(INDEX_SQL, index_row(user_id, teacher.city, _stored_answers_text(teacher), address))
+    _move_counter(session, teacher.city, stage, TeacherStage.ADDRESS_CONFIRMED)
+    return True
+
+
+def _stored_answers_text(teacher) -> str:
+    """Тексты ответов для поискового индекса по строке teachers (как search.index_teacher)."""
+    if teacher.interview is not None:
+        return answers_text(unpack_answers(teacher.interview))
+    return interview_answers(teacher.text_interview)
+
+
+# ============================ РЕПОЗИТОРИЙ ============================
+
+class TeacherRepository:
+    """
+    Анкеты преподавателей с кэшем профилей (LRU с временем жизни).
+    Методы записи возвращают результат только после коммита.
+    """
+
+    def __init__(self, cache_size: int = PROFILE_CACHE_SIZE, ttl: float = PROFILE_CACHE_TTL):
+        self._profiles = TTLCache(cache_size, ttl)
+
+    async def get_profile(self, user_id: int) -> Optional[TeacherProfile]:
+        """Профиль пользователя или None, если он не проходил анкетирование."""
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = await run_db(_load_profile, user_id)
+            if profile is not None:
+                self._profiles.set(user_id, profile)
+        return profile
+
+    async def register(self, user_id: int, full_name: str, city: str, birth_date, remind_at=None) -> bool:
+        """
+        Сохраняет анкету.
+        :param remind_at: когда напомнить о собеседовании (UTC), None — не напоминать
+        :return: False, если пользователь уже зарегистрирован
+        """
+        if user_id in self._profiles:
+            return False  # Профиль в кэше — запись в базе точно есть
+        created = await run_db_batched(_register_teacher, user_id, full_name, city, birth_date, remind_at)
+        if created:
+            self._profiles.set(user_id, TeacherProfile(user_id, full_name, city, birth_date, TeacherStage.REGISTERED))
+        return created
+
+    async def save_interview(self, user_id: int, answers: dict) -> bool:
+        """
+        Сохраняет ответы собеседования и снимает напоминание о нем.
+        :param answers: ответы собеседования (answers.collect_answers)
+        :return: False, если пользователь не найден
+        """
+        updated = await self._write(user_id, _save_interview, answers)
+        profile = self._profiles.get(user_id)
+        if updated and profile is not None:
+            self._profiles.set(user_id, replace(profile, stage=max(profile.stage, TeacherStage.INTERVIEWED)))
+        return updated
+
+    async def save_address(self, user_id: int, address: str) -> bool:
+        """:return: False, если пользователь не найден"""
+        updated = await self._write(user_id, _save_address, address)
+        profile = self._profiles.get(user_id)
+        if updated and profile is not None:
+            self._profiles.set(user_id, replace(profile, stage=TeacherStage.ADDRESS_CONFIRMED, address=address))
+        return updated
+
+    async def _write(self, user_id: int, func, *args) -> bool:
+        """
+        Записывает изменение анкеты. Если запись не удалась или анкеты нет,
+        профиль убирается из кэша, чтобы следующее чтение взяло его из базы.
+        """
+        try:
+            updated = await run_db_batched(func, user_id, *args)
+        except Exception:
+            self.invalidate(user_id)
+            raise
+        if not updated:
+            self.invalidate(user_id)
+        return updated
+
+    def invalidate(self, user_id: int) -> None:
+        self._profiles.pop(user_id, None)
+
+
+teachers = TeacherRepository()
@@ -0,0 +1,431 @@
+"""
+Оценка кандидатов по ответам собеседования, чтобы HR начинал просмотр с самых подходящих.
+
+Признаки анкеты (вопросы из text.questions):
+- kids_hits — слова про опыт с детьми в ответе об опыте с младшими школьниками;
+- robo_hits — слова про робототехнику и программирование в ответе об опыте в робототехнике;
+- hours_per_week — часов в неделю из ответа о свободном времени ("10 часов", "по 2 часа в день", "выходные";
+  часы умножаются на рабочие дни, только если рядом с ними сказано "в день" или "в будни" и в ответе нет "в неделю");
+- distance_km — от города анкеты до ближайшего из названных в ответе о районе работы городов CITIES
+  (город не назван — баллов за удаленность нет).
+Оценка — взвешенная сумма признаков (SCORE_WEIGHTS), от 0 до 100, хранится в candidate_scores.
+
+Признаки считаются пачками: текст разбирается на слова один раз, каждое новое слово пачки один раз
+сравнивается со списками ключевых слов (словарь _Vocabulary, свой на каждую пачку — память не растет
+с числом разных слов во всех анкетах), а подсчет по всем анкетам пачки идет массивами NumPy.
+
+Пересчитываются только анкеты из очереди scoring_jobs: сохранение ответов собеседования ставит
+в нее анкету в той же транзакции (см. repository.py), проход задачи читает только очередь,
+сколько бы анкет ни было в базе. Ответы, которые не изменились (тот же хэш, что у сохраненной
+оценки), заново не считаются. После изменения правил оценки — python scoring.py update --full.
+
+Запуск:
+    python scoring.py update             # анкеты из очереди (новые и измененные)
+    python scoring.py update --full      # все анкеты
+    python scoring.py top --city Москва --limit 20
+"""
+import argparse
+import hashlib
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.sqlite import insert
+
+from answers import stored_answers
+from assets import CITIES, normalize_text
+from db import run_db
+from models import CandidateScore, ScoringJob, Teacher
+
+# ============================ НАСТРОЙКА ============================
+SCORING_BATCH_SIZE = 5000  # Анкет в одной пачке (и в одной транзакции)
+
+KIDS_KEYWORDS = (
+    "школ", "дет", "ребен", "ребят", "младш", "класс", "вожат", "лагер", "кружк", "кружок",
+    "учител", "педагог", "преподав", "репетит", "воспитат", "занят", "урок",
+)
+ROBO_KEYWORDS = (
+    "робот", "arduino", "ардуино", "lego", "лего", "mindstorms", "wedo", "ev3", "scratch", "скретч",
+    "python", "питон", "программ", "конструкт", "микроконтр", "электрон", "схемотех", "паял", "3d", "олимпиад",
+)
+HOUR_WORDS = frozenset(("час", "часа", "часов", "часы", "ч"))  # Число перед таким словом — часы
+DAY_WORDS = ("день", "дня", "ежеднев", "будн")  # Часы указаны в день: умножаются на рабочие дни
+DAY_WINDOW = 2  # Слово про день не дальше стольких слов после "часа" или до числа: "2 часа в день", "в будни по 3 часа"
+WEEK_WORDS = ("недел",)  # В ответе названы часы в неделю: на рабочие дни не умножаются
+NUMBER_WORDS = {"один": 1, "одна": 1, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5, "шесть": 6,
+                "семь": 7, "восемь": 8, "десять": 10, "двенадцать": 12, "пятнадцать": 15, "двадцать": 20}
+WORK_DAYS = 5
+# Если часы не названы числом — по словам ответа
+WEEKEND_WORDS, WEEKEND_HOURS = ("выходн", "суббот", "воскрес"), 8
+EVENING_WORDS, EVENING_HOURS = ("вечер",), 6
+ANY_TIME_WORDS, ANY_TIME_HOURS = ("любое", "любые", "свобод", "всегда"), 20
+MAX_HOURS = 40
+
+# Город из CITIES по началу слова в ответе о районе работы
+CITY_ALIASES = {
+    "москв": "Москва", "мск": "Москва", "подмосков": "Москва",
+    "петербург": "Санкт-Петербург", "спб": "Санкт-Петербург", "питер": "Санкт-Петербург",
+    "новосибирск": "Новосибирск", "екатеринбург": "Екатеринбург", "екб": "Екатеринбург",
+    "казан": "Казань", "нижн": "Нижний Новгород", "челябинск": "Челябинск", "омск": "Омск",
+    "самар": "Самара", "ростов": "Ростов-на-Дону",
+}
+CITY_COORDINATES = {  # Широта и долгота, градусы
+    "Москва": (55.756, 37.617), "Санкт-Петербург": (59.934, 30.335), "Новосибирск": (55.008, 82.936),
+    "Екатеринбург": (56.839, 60.606), "Казань": (55.796, 49.109), "Нижний Новгород": (56.297, 43.936),
+    "Челябинск": (55.164, 61.437), "Омск": (54.989, 73.324), "Самара": (53.196, 50.100),
+    "Ростов-на-Дону": (47.236, 39.702),
+}
+
+# Вес признаков в оценке: опыт с детьми, робототехника, свободное время, удаленность (штраф)
+SCORE_WEIGHTS = np.array([35.0, 35.0, 20.0, 10.0])
+KEYWORD_HITS_CAP = 3  # Больше совпадений оценку не повышает
+FULL_HOURS = 20  # Часов в неделю для полного балла за время
+FAR_KM = 1000  # Расстояние, с которого штраф максимальный
+
+EARTH_RADIUS_KM = 6371.0
+
+_WORDS = re.compile(r"\w+")
+_CITY_NAMES = tuple(CITIES)
+_CITY_INDEX = {normalize_text(city): index for index, city in enumerate(_CITY_NAMES)}
+_CITY_RADIANS = np.radians(np.array([CITY_COORDINATES[city] for city in _CITY_NAMES]))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RankedCandidate:
+    id: int
+    full_name: str
+    city: str
+    stage: int
+    score: float
+    kids_hits: int
+    robo_hits: int
+    hours_per_week: float
+    distance_km: Optional[float]
+
+
+# ============================ ПРИЗНАКИ ============================
+
+class _Vocabulary:
+    """
+    Слова, которые уже встречались в ответах, и их свойства в массивах NumPy по id слова.
+    Свойства слова вычисляются один раз, поэтому стоимость пачки — в основном разбор текста.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._rows = []  # Свойства слов: kids, robo, hour, day, week, weekend, evening, any_time, number, city
+        self._arrays = None
+
+    def encode(self, text: Optional[str]) -> list:
+        """id слов ответа."""
+        if not text:
+            return []
+        ids, get = [], self._ids.get
+        for word in _WORDS.findall(normalize_text(text)):
+            word_id = get(word)
+            if word_id is None:
+                word_id = self._add(word)
+            ids.append(word_id)
+        return ids
+
+    def _add(self, word: str) -> int:
+        city = next((name for stem, name in CITY_ALIASES.items() if word.startswith(stem)), None)
+        # isdigit верно и для "3²", которое int не разбирает; isdecimal — только для цифр 0-9 любых алфавитов
+        number = NUMBER_WORDS.get(word, int(word) if word.isdecimal() and len(word) <= 3 else 0)
+        word_id = len(self._rows)
+        self._rows.append((
+            word.startswith(KIDS_KEYWORDS), word.startswith(ROBO_KEYWORDS),
+            word in HOUR_WORDS, word.startswith(DAY_WORDS), word.startswith(WEEK_WORDS),
+            word.startswith(WEEKEND_WORDS), word.startswith(EVENING_WORDS), word.startswith(ANY_TIME_WORDS),
+            number, _CITY_NAMES.index(city) if city is not None else -1,
+        ))
+        self._ids[word] = word_id  # Только после строки свойств: id всегда указывает на существующую строку
+        self._arrays = None
+        return word_id
+
+    def arrays(self) -> dict:
+        if self._arrays is None:
+            columns = list(zip(*self._rows)) or [()] * 10
+            names = ("kids", "robo", "hour", "day", "week", "weekend", "evening", "any_time")
+            self._arrays = {name: np.array(column, dtype=bool) for name, column in zip(names, columns)}
+            self._arrays["number"] = np.array(columns[8], dtype=np.float64)
+            self._arrays["city"] = np.array(columns[9], dtype=np.int64)
+        return self._arrays
+
+
+def _flatten(encoded: list) -> tuple:
+    """Слова всех анкет пачки подряд и номер анкеты для каждого слова."""
+    lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+    words = np.fromiter((word for ids in encoded for word in ids), dtype=np.int64, count=int(lengths.sum()))
+    return words, np.repeat(np.arange(len(encoded)), lengths)
+
+
+def _count(mask, rows, size: int):
+    return np.bincount(rows, weights=mask, minlength=size)
+
+
+def _followed_by(mask, rows, window: int):
+    """Слова, за которыми в том же ответе не дальше window слов идет слово из mask."""
+    followed = np.zeros(len(mask), dtype=bool)
+    for shift in range(1, window + 1):
+        followed[:-shift] |= mask[shift:] & (rows[shift:] == rows[:-shift])
+    return followed
+
+
+def _preceded_by(mask, rows, window: int):
+    """Слова, перед которыми в том же ответе не дальше window слов стоит слово из mask."""
+    preceded = np.zeros(len(mask), dtype=bool)
+    for shift in range(1, window + 1):
+        preceded[shift:] |= mask[:-shift] & (rows[:-shift] == rows[shift:])
+    return preceded
+
+
+def _hours_per_week(v: dict, words, rows, size: int):
+    # Число, за которым в том же ответе идет "час"
+    before_hour = _followed_by(v["hour"][words], rows, 1)
+    # Часы в день ("по 2 часа в день", "в будни по 3 часа"): слово про день рядом после "часа"
+    # или перед числом и нигде в ответе нет "в неделю"
+    day = v["day"][words]
+    per_day = _preceded_by(day, rows, DAY_WINDOW)
+    per_day[:-1] |= _followed_by(day, rows, DAY_WINDOW)[1:]
+    per_day &= before_hour & (_count(v["week"][words], rows, size) == 0)[rows]
+    hours = _count(np.where(before_hour, v["number"][words], 0.0) * np.where(per_day, WORK_DAYS, 1), rows, size)
+    # Без чисел — по словам "выходные", "вечером", "любое время"
+    implied = np.where(
+        _count(v["any_time"][words], rows, size) > 0, ANY_TIME_HOURS,
+        (_count(v["weekend"][words], rows, size) > 0) * WEEKEND_HOURS
+        + (_count(v["evening"][words], rows, size) > 0) * EVENING_HOURS
+    )
+    return np.minimum(np.where(hours > 0, hours, implied), MAX_HOURS)
+
+
+def _distance_km(v: dict, words, rows, home, size: int):
+    """Расстояние от города анкеты (home — индекс в CITIES, -1 — неизвестен) до ближайшего названного."""
+    cities = v["city"][words]
+    mentioned = (cities >= 0) & (home[rows] >= 0)
+    rows, cities = rows[mentioned], cities[mentioned]
+    lat1, lon1 = _CITY_RADIANS[home[rows]].T
+    lat2, lon2 = _CITY_RADIANS[cities].T
+    # Формула гаверсинусов
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    nearest = np.full(size, np.inf)
+    np.minimum.at(nearest, rows, distance)
+    return np.where(np.isinf(nearest), np.nan, nearest)  # nan — в ответе нет городов из CITIES
+
+
+def score_batch(vocabulary: _Vocabulary, answers: list, cities: list) -> dict:
+    """
+    Признаки и оценки пачки анкет.
+    :param answers: словари ответов (answers.stored_answers)
+    :param cities: города анкет (teachers.city)
+    :return: массивы NumPy по анкетам: kids_hits, robo_hits, hours_per_week, distance_km, score
+    """
+    size = len(answers)
+    kids_words, kids_rows = _flatten([vocabulary.encode(a.get("experience_kids")) for a in answers])
+    robo_words, robo_rows = _flatten([vocabulary.encode(a.get("experience_robo")) for a in answers])
+    time_words, time_rows = _flatten([vocabulary.encode(a.get("free_time")) for a in answers])
+    city_words, city_rows = _flatten([vocabulary.encode(a.get("interview_city")) for a in answers])
+    home = np.fromiter((_CITY_INDEX.get(normalize_text(city or ""), -1) for city in cities), dtype=np.int64, count=size)
+
+    v = vocabulary.arrays()  # После разбора: в словаре уже есть все слова пачки
+    kids_hits = _count(v["kids"][kids_words], kids_rows, size)
+    robo_hits = _count(v["robo"][robo_words], robo_rows, size)
+    hours = _hours_per_week(v, time_words, time_rows, size)
+    distance = _distance_km(v, city_words, city_rows, home, size)
+
+    features = np.column_stack((
+        np.minimum(kids_hits, KEYWORD_HITS_CAP) / KEYWORD_HITS_CAP,
+        np.minimum(robo_hits, KEYWORD_HITS_CAP) / KEYWORD_HITS_CAP,
+        np.minimum(hours, FULL_HOURS) / FULL_HOURS,
+        # Город не назван — баллов за удаленность нет: пропущенный ответ не лучше далекого города
+        np.where(np.isnan(distance), 0.0, 1 - np.minimum(distance, FAR_KM) / FAR_KM),
+    ))
+    return {
+        "kids_hits": kids_hits.astype(np.int64), "robo_hits": robo_hits.astype(np.int64),
+        "hours_per_week": hours, "distance_km": distance, "score": np.round(features @ SCORE_WEIGHTS, 1),
+    }
+
+
+def input_hash(interview, text_interview, city) -> int:
+    """Хэш всего, от чего зависит оценка анкеты (64 бита со знаком — как INTEGER в SQLite)."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(interview or (text_interview or "").encode())
+    digest.update(b"\0" + (city or "").encode())
+    return int.from_bytes(digest.digest(), "little", signed=True)
+
+
+# ============================ ЗАПРОСЫ К БАЗЕ ДАННЫХ ============================
+
+def _save_scores(session, candidates: list) -> None:
+    """
+    Считает и сохраняет оценки пачки анкет.
+    :param candidates: (id, город, ответы, хэш входных данных)
+    """
+    ids, cities, answers, hashes = zip(*candidates)
+    features = score_batch(_Vocabulary(), list(answers), list(cities))
+    distance = features["distance_km"]
+    now = datetime.utcnow()
+    values = [
+        {"teacher_id": teacher_id, "input_hash": hashes[index], "score": float(features["score"][index]),
+         "kids_hits": int(features["kids_hits"][index]), "robo_hits": int(features["robo_hits"][index]),
+         "hours_per_week": float(features["hours_per_week"][index]),
+         "distance_km": None if np.isnan(distance[index]) else float(distance[index]), "scored_at": now}
+        for index, teacher_id in enumerate(ids)
+    ]
+    # Через таблицу, а не модель: ORM выполнял бы upsert отдельным запросом на каждую строку
+    statement = insert(CandidateScore.__table__)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=["teacher_id"],
+        set_={column: statement.excluded[column] for column in values[0] if column != "teacher_id"},
+    ), values)
+
+
+def _candidate(teacher_id, city, interview, text_interview, stored_hash=None, full=True):
+    """(id, город, ответы, хэш) для _save_scores или None, если считать нечего."""
+    if interview is None and text_interview is None:
+        return None  # Собеседование еще не пройдено
+    current_hash = input_hash(interview, text_interview, city)
+    if not full and current_hash == stored_hash:
+        return None  # Ответы не изменились
+    answers = stored_answers(interview, text_interview)
+    return None if answers is None else (teacher_id, city, answers, current_hash)
+
+
+def _score_queued(session, limit: int = SCORING_BATCH_SIZE) -> tuple:
+    """
+    Пересчитывает оценки следующих limit анкет из очереди scoring_jobs и снимает их с очереди.
+    :return: (прочитано заданий, пересчитано анкет)
+    """
+    jobs = ScoringJob.__table__
+    rows = session.execute(
+        select(jobs.c.teacher_id, jobs.c.queued_at, Teacher.city, Teacher.interview, Teacher.text_interview,
+               CandidateScore.input_hash)
+        .outerjoin(Teacher, Teacher.id == jobs.c.teacher_id)
+        .outerjoin(CandidateScore, CandidateScore.teacher_id == jobs.c.teacher_id)
+        .order_by(jobs.c.queued_at).limit(limit)
+    ).all()
+    if not rows:
+        return 0, 0
+    candidates = [candidate for candidate in (
+        _candidate(teacher_id, city, interview, text_interview, stored_hash, full=False)
+        for teacher_id, _, city, interview, text_interview, stored_hash in rows
+    ) if candidate is not None]
+    if candidates:
+        _save_scores(session, candidates)
+    # Анкету, которую снова поставили в очередь, пока шел расчет, оставляем до следующего прохода
+    session.execute(
+        jobs.delete().where(jobs.c.teacher_id == bindparam("job_id"), jobs.c.queued_at == bindparam("job_queued_at")),
+        [{"job_id": row[0], "job_queued_at": row[1]} for row in rows]
+    )
+    return len(rows), len(candidates)
+
+
+def _score_page(session, after_id: int, limit: int = SCORING_BATCH_SIZE) -> tuple:
+    """
+    Пересчитывает оценки всех анкет с id > after_id (не больше limit анкет), независимо от очереди.
+    :return: (последний просмотренный id или None, если анкет больше нет; пересчитано анкет)
+    """
+    rows = session.execute(
+        select(Teacher.id, Teacher.city, Teacher.interview, Teacher.text_interview)
+        .where(Teacher.id > after_id).order_by(Teacher.id).limit(limit)
+    ).all()
+    if not rows:
+        return None, 0
+    candidates = [candidate for candidate in (_candidate(*row) for row in rows) if candidate is not None]
+    if candidates:
+        _save_scores(session, candidates)
+    return rows[-1][0], len(candidates)
+
+
+def _top_candidates(session, limit: int = 20, city: str = None, offset: int = 0) -> list:
+    query = (
+        select(Teacher.id, Teacher.full_name, Teacher.city, Teacher.stage, CandidateScore.score,
+               CandidateScore.kids_hits, CandidateScore.robo_hits, CandidateScore.hours_per_week,
+               CandidateScore.distance_km)
+        .join(Teacher, Teacher.id == CandidateScore.teacher_id)
+        .order_by(CandidateScore.score.desc(), CandidateScore.teacher_id)
+        .limit(limit).offset(offset)
+    )
+    if city:
+        query = query.where(Teacher.city == city)
+    return [RankedCandidate(*row) for row in session.execute(query)]
+
+
+# ============================ ОЦЕНКА ============================
+
+async def update_scores(full: bool = False) -> int:
+    """
+    Пересчитывает оценки анкет из очереди (full — всех анкет), по пачке за транзакцию.
+    :return: сколько анкет пересчитано
+    """
+    total = 0
+    if full:
+        after_id = 0
+        while after_id is not None:
+            after_id, scored = await run_db(_score_page, after_id, SCORING_BATCH_SIZE)
+            total += scored
+        return total
+    while True:
+        fetched, scored = await run_db(_score_queued, SCORING_BATCH_SIZE)
+        total += scored
+        if fetched < SCORING_BATCH_SIZE:
+            return total
+
+
+async def top_candidates(limit: int = 20, city: str = None, offset: int = 0) -> list:
+    """Кандидаты с лучшей оценкой (RankedCandidate), при city — только из этого города."""
+    return await run_db(_top_candidates, limit, city, offset)
+
+
+async def score_candidates(context) -> None:
+    """Задача job_queue: оценка анкет, пройденных после прошлого запуска."""
+    scored = await update_scores()
+    if scored:
+        logger.info("Оценка кандидатов: пересчитано анкет %d", scored)
+
+
+# ============================ ЗАПУСК ============================
+
+def main(argv=None) -> None:
+    from db import session_scope
+
+    parser = argparse.ArgumentParser(description="Оценка кандидатов по ответам собеседования")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="пересчитать оценки")
+    update_parser.add_argument("--full", action="store_true", help="пересчитать все анкеты, а не только измененные")
+    top_parser = subparsers.add_parser("top", help="лучшие кандидаты")
+    top_parser.add_argument("--city")
+    top_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "update":
+        total, after_id, done = 0, 0, False
+        while not done:
+            with session_scope() as session:
+                if args.full:
+                    after_id, scored = _score_page(session, after_id, SCORING_BATCH_SIZE)
+                    done = after_id is None
+                else:
+                    fetched, scored = _score_queued(session, SCORING_BATCH_SIZE)
+                    done = fetched < SCORING_BATCH_SIZE
+            total += scored
+        print(f"Пересчитано анкет: {total}")
+    else:
+        with session_scope() as session:
+            candidates = _top_candidates(session, args.limit, args.city)
+        for c in candidates:
+            distance = "—" if c.distance_km is None else f"{c.distance_km:.0f} км"
+            print(f"{c.score:5.1f}  {c.id:>12}  {c.full_name:<32} {c.city:<16} дети {c.kids_hits}, "
+                  f"робототехника {c.robo_hits}, {c.hours_per_week:.0f} ч/нед, {distance}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
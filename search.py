@@ -0,0 +1,221 @@
+"""
+Поиск кандидатов по ответам собеседования и адресу для рекрутеров.
+
+Индекс — таблица SQLite FTS5 teacher_search (rowid = id преподавателя): ответы собеседования
+без заголовков вопросов, адрес и город. Индекс обновляется в той же транзакции, что и анкета
+(см. repository.py), поэтому найденное всегда совпадает с сохраненным. Запрос идет по индексу,
+а не перебором строк teachers через LIKE, и занимает миллисекунды на сотнях тысяч анкет.
+
+Слово запроса ищется по началу без окончания (последних двух букв, но не короче 3 и не длиннее
+STEM_LENGTH букв): "игрушек" найдет и "игрушки", а "робототехника" — "робототехнике". Для таких
+начал слов в индексе есть готовые списки анкет (prefix в миграции), поэтому запрос
+не перебирает все слова словаря. Регистр, ё/е и знаки препинания не важны;
+все слова запроса должны встретиться в анкете.
+
+Ранжируются (bm25) все совпадения, страницы идут от лучших к худшим; при равном ранге новые
+анкеты (с большим id) раньше.
+
+Запуск:
+    python search.py arduino lego --city Москва
+    python search.py "кружок робототехника" --page 2
+"""
+import argparse
+import re
+import sys
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+from answers import answers_text, unpack_answers
+from assets import normalize_text
+from db import run_db
+
+# ============================ НАСТРОЙКА ============================
+SEARCH_PAGE_SIZE = 20  # Кандидатов на странице
+SEARCH_WEIGHTS = (1.0, 0.5, 0.0)  # Вес совпадений в bm25: ответы, адрес, город (город — только фильтр)
+STEM_LENGTH = 6  # Больше букв с начала слова не сравнивается (не больше длин prefix в миграции 3)
+SNIPPET_CHARS = 120  # Длина фрагмента с совпадениями
+
+_WORDS = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    id: int
+    full_name: str
+    city: str
+    stage: int
+    snippet: str  # Ответ или адрес с совпадениями в [квадратных скобках]
+    score: float  # bm25: чем меньше, тем точнее совпадение
+
+
+@dataclass(frozen=True)
+class SearchPage:
+    results: tuple
+    page: int
+    has_more: bool
+
+
+# ============================ ИНДЕКС ============================
+
+INDEX_SQL = text(
+    "INSERT OR REPLACE INTO teacher_search (rowid, answers, address, city) "
+    "VALUES (:id, :answers, :address, :city)"
+)
+
+
+def interview_answers(text_interview) -> str:
+    """
+    Ответы из текста сводки старого формата (teachers.text_interview) без заголовков вопросов:
+    они есть в каждой анкете и только мешают поиску.
+    """
+    if not text_interview:
+        return ""
+    return "\n".join(line.partition(": ")[2] or line for line in text_interview.splitlines())
+
+
+def _index_text(value) -> str:
+    # Регистр и дефисы учитывает токенизатор FTS5, а ё и е для него разные буквы — заменяем сами
+    return (value or "").replace("ё", "е").replace("Ё", "Е")
+
+
+def index_row(teacher_id: int, city: str, answers: str = None, address=None) -> dict:
+    """
+    Параметры INDEX_SQL для одной анкеты.
+    :param answers: тексты ответов собеседования без вопросов
+    """
+    return {
+        "id": teacher_id,
+        "answers": _index_text(answers),
+        "address": _index_text(address),
+        "city": _index_text(city),
+    }
+
+
+def index_teacher(session, teacher) -> None:
+    """Обновляет запись анкеты в индексе. Вызывается в транзакции, которая меняет анкету."""
+    if teacher.interview is not None:
+        answers = answers_text(unpack_answers(teacher.interview))
+    else:
+        answers = interview_answers(teacher.text_interview)
+    session.execute(INDEX_SQL, index_row(teacher.id, teacher.city, answers, teacher.address))
+
+
+# ============================ ЗАПРОСЫ ============================
+
+def query_stems(query) -> tuple:
+    """Начала слов запроса, по которым ищутся анкеты."""
+    return tuple(word[:min(STEM_LENGTH, max(len(word) - 2, 3))] for word in _WORDS.findall(normalize_text(query or "")))
+
+
+def build_match(stems, city: str = None) -> str:
+    """
+    Выражение FTS5 MATCH. Слова экранируются, поэтому операторы FTS5 во вводе рекрутера
+    не работают и не ломают запрос.
+    """
+    parts = []
+    if stems:
+        # Для одной буквы готового списка в индексе нет, перебор всех слов на нее был бы долгим
+        terms = " ".join(f'"{stem}"*' if len(stem) > 1 else f'"{stem}"' for stem in stems)
+        parts.append(f"{{answers address}} : ({terms})")
+    if city:
+        city_words = " ".join(_WORDS.findall(normalize_text(city)))
+        if city_words:
+            parts.append(f'city : "{city_words}"')
+    return " AND ".join(parts)
+
+
+def make_snippet(texts, stems) -> str:
+    """Строка ответов или адреса, где больше всего слов запроса; совпадения в [скобках]."""
+    best, best_hits = "", -1
+    for line in (line for value in texts for line in (value or "").splitlines()):
+        hits = 0
+
+        def mark(match):
+            nonlocal hits
+            if normalize_text(match.group()).startswith(stems):
+                hits += 1
+                return f"[{match.group()}]"
+            return match.group()
+
+        marked = _WORDS.sub(mark, line)
+        if hits > best_hits:
+            best, best_hits = marked, hits
+    return best if len(best) <= SNIPPET_CHARS else best[:SNIPPET_CHARS - 1] + "…"
+
+
+def _search(session, query: str = "", city: str = None, page: int = 0, per_page: int = SEARCH_PAGE_SIZE) -> SearchPage:
+    stems = query_stems(query)
+    match = build_match(stems, city)
+    if not match:
+        return SearchPage((), page, False)
+    params = {"match": match, "limit": per_page + 1, "offset": page * per_page}
+    if stems:
+        # bm25 считается внутри запроса FTS5 для всех совпадений, поэтому страницы идут по рангу
+        # среди всей выборки: на любой странице — следующие по точности анкеты, а не лучшие из части
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        ranked = session.execute(text(
+            f"SELECT rowid, bm25(teacher_search, {weights}) AS score FROM teacher_search "
+            "WHERE teacher_search MATCH :match ORDER BY score, rowid DESC LIMIT :limit OFFSET :offset"
+        ), params).all()
+    else:
+        # Только город: ранжировать нечего, страницы идут по id
+        ranked = session.execute(text(
+            "SELECT rowid, 0.0 FROM teacher_search WHERE teacher_search MATCH :match "
+            "ORDER BY rowid DESC LIMIT :limit OFFSET :offset"
+        ), params).all()
+    if not ranked:
+        return SearchPage((), page, False)
+
+    # Анкеты и фрагменты — только для найденной страницы
+    scores = {row[0]: row[1] for row in ranked[:per_page]}
+    rows = session.execute(text(
+        "SELECT teachers.id, teachers.full_name, teachers.city, teachers.stage, "
+        "teacher_search.answers, teacher_search.address "
+        "FROM teacher_search JOIN teachers ON teachers.id = teacher_search.rowid "
+        f"WHERE teacher_search.rowid IN ({', '.join(map(str, scores))})"
+    )).all()
+    results = {
+        teacher_id: SearchResult(teacher_id, full_name, city, stage, make_snippet((answers, address), stems),
+                                 scores[teacher_id])
+        for teacher_id, full_name, city, stage, answers, address in rows
+    }
+    return SearchPage(tuple(results[teacher_id] for teacher_id in scores if teacher_id in results), page,
+                      len(ranked) > per_page)
+
+
+async def search(query: str = "", city: str = None, page: int = 0, per_page: int = SEARCH_PAGE_SIZE) -> SearchPage:
+    """
+    Кандидаты, в ответах или адресе которых есть все слова запроса, от лучших совпадений к худшим.
+    :param query: слова для поиска (пустой запрос с city — все кандидаты из города)
+    :param city: только кандидаты из этого города
+    :param page: номер страницы с нуля
+    """
+    return await run_db(_search, query, city, page, per_page)
+
+
+# ============================ ЗАПУСК ============================
+
+def main(argv=None) -> None:
+    from db import session_scope
+
+    parser = argparse.ArgumentParser(description="Поиск кандидатов по ответам собеседования и адресу")
+    parser.add_argument("query", nargs="*", help="слова для поиска")
+    parser.add_argument("--city")
+    parser.add_argument("--page", type=int, default=1, help="номер страницы, с 1")
+    parser.add_argument("--per-page", type=int, default=SEARCH_PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    with session_scope() as session:
+        result = _search(session, " ".join(args.query), args.city, args.page - 1, args.per_page)
+    for row in result.results:
+        snippet = row.snippet.replace("\n", " / ")
+        print(f"{row.id:>12}  {row.full_name:<32} {row.city:<16} этап {row.stage}  {snippet}")
+    if not result.results:
+        print("Ничего не найдено")
+    if result.has_more:
+        print(f"Следующая страница: --page {args.page + 1}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,389 @@
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from cache import TTLCache
+
+# ============================ НАСТРОЙКА ============================
+STATE_STORE = os.environ.get("STATE_STORE", "sqlite")  # memory | sqlite
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "states.db")
+STATE_TTL = 7 * 24 * 3600  # Через неделю без активности диалог считается брошенным
+STATE_CACHE_SIZE = 50_000  # Максимум состояний в памяти
+STATE_BATCH_SIZE = 500  # Сколько изменений копить до записи на диск
+STATE_FLUSH_INTERVAL = 5  # Как часто (в секундах) сбрасывать изменения на диск
+USER_DATA_DB_PATH = os.environ.get("USER_DATA_DB_PATH", "user_data.db")  # Ответы анкеты (context.user_data)
+
+logger = logging.getLogger(__name__)
+_MISSING = object()
+
+
+# ============================ ХРАНИЛИЩА ============================
+
+class StateStore(ABC):
+    """
+    Хранилище состояний диалога (user_id -> состояние из SurveyState/QState/LessonState).
+
+    Словарный интерфейс (get, set, pop, in, []) работает только с памятью и не блокирует цикл
+    событий. Состояние, которого в памяти нет (например, после перезапуска), сначала загружается
+    через await load(); запись на диск — await flush() (его периодически вызывает бот).
+    """
+
+    @abstractmethod
+    def get(self, user_id, default=None):
+        """Состояние из памяти."""
+
+    @abstractmethod
+    def set(self, user_id, state) -> None:
+        """Меняет состояние; на диск оно попадет при следующем flush()."""
+
+    @abstractmethod
+    def pop(self, user_id, default=None):
+        """Снимает состояние (и с диска при следующем flush(), даже если в памяти его не было)."""
+
+    async def load(self, user_id, default=None):
+        """Состояние пользователя; при промахе кэша читается с диска вне цикла событий."""
+        return self.get(user_id, default)
+
+    async def flush(self) -> None:
+        """Сохраняет накопленные изменения. Для хранилищ в памяти только убирает просроченные."""
+
+    async def close(self) -> None:
+        await self.flush()
+
+    def __contains__(self, user_id) -> bool:
+        return self.get(user_id, _MISSING) is not _MISSING
+
+    def __getitem__(self, user_id):
+        state = self.get(user_id, _MISSING)
+        if state is _MISSING:
+            raise KeyError(user_id)
+        return state
+
+    def __setitem__(self, user_id, state) -> None:
+        self.set(user_id, state)
+
+    def __delitem__(self, user_id) -> None:
+        if self.pop(user_id, _MISSING) is _MISSING:
+            raise KeyError(user_id)
+
+
+class MemoryStateStore(StateStore):
+    """Состояния только в памяти: LRU с ограничением размера и временем жизни."""
+
+    def __init__(self, max_size: int = STATE_CACHE_SIZE, ttl=STATE_TTL):
+        self._cache = TTLCache(max_size, ttl)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, user_id, default=None):
+        return self._cache.get(user_id, default)
+
+    def set(self, user_id, state) -> None:
+        self._cache.set(user_id, state)
+
+    def pop(self, user_id, default=None):
+        return self._cache.pop(user_id, default)
+
+    async def flush(self) -> None:
+        self._cache.evict_expired()
+
+
+class SqliteStateStore(StateStore):
+    """
+    Состояния в SQLite, переживают перезапуск бота.
+    Чтение идет через LRU-кэш в памяти; изменения копятся и записываются одной транзакцией,
+    когда их набирается batch_size или при вызове flush(). Запросы к файлу выполняются в пуле
+    потоков базы данных (db.run_blocking), цикл событий их не ждет.
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH, max_size: int = STATE_CACHE_SIZE, ttl=STATE_TTL,
+                 batch_size: int = STATE_BATCH_SIZE):
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self._cache = TTLCache(max_size, ttl)
+        self._dirty = {}  # user_id -> (state или None для удаления, время изменения)
+        self._writing = {}  # Изменения, которые сейчас записываются на диск
+        self._path = path
+        self._db = None
+        self._db_lock = threading.Lock()  # Соединение одно, а потоков пула несколько
+        self._loop = None
+        self._flush_lock = None
+        self._flush_task = None
+
+    def _conn(self) -> sqlite3.Connection:
+        # Соединение открывается при первом обращении (и заново после close()); вызывать под _db_lock
+        if self._db is None:
+            self._db = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS user_states ("
+                "user_id INTEGER PRIMARY KEY, state INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_user_states_updated_at ON user_states (updated_at)")
+        return self._db
+
+    def get(self, user_id, default=None):
+        for pending in (self._dirty, self._writing):
+            if user_id in pending:
+                state = pending[user_id][0]
+                return default if state is None else state
+        return self._cache.get(user_id, default)
+
+    async def load(self, user_id, default=None):
+        state = self.get(user_id, _MISSING)
+        if state is not _MISSING:
+            return state
+        # Промах кэша: поиск по первичному ключу в локальном файле
+        from db import run_blocking
+
+        row = await run_blocking(self._read, user_id, time.time() - self.ttl)
+        state = self.get(user_id, _MISSING)  # Пока читали, состояние могли изменить
+        if state is not _MISSING:
+            return state
+        if row is None:
+            return default
+        self._cache.set(user_id, row[0])
+        return row[0]
+
+    def set(self, user_id, state) -> None:
+        self._cache.set(user_id, state)
+        self._mark_dirty(user_id, state)
+
+    def pop(self, user_id, default=None):
+        state = self.get(user_id, _MISSING)
+        self._cache.pop(user_id, None)
+        self._mark_dirty(user_id, None)
+        return default if state is _MISSING else state
+
+    def _mark_dirty(self, user_id, state) -> None:
+        self._dirty[user_id] = (state, time.time())
+        if len(self._dirty) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                pass  # Вне цикла событий: изменения запишет следующий flush()
+
+    def _read(self, user_id, since: float):
+        with self._db_lock:
+            return self._conn().execute(
+                "SELECT state FROM user_states WHERE user_id = ? AND updated_at >= ?", (user_id, since)
+            ).fetchone()
+
+    def _write(self, dirty: dict) -> None:
+        upserts = [(user_id, state, ts) for user_id, (state, ts) in dirty.items() if state is not None]
+        deletes = [(user_id,) for user_id, (state, _) in dirty.items() if state is None]
+        with self._db_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN")
+                if upserts:
+                    conn.executemany(
+                        "INSERT INTO user_states (user_id, state, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                        upserts
+                    )
+                if deletes:
+                    conn.executemany("DELETE FROM user_states WHERE user_id = ?", deletes)
+                conn.execute("DELETE FROM user_states WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый цикл событий (перезапуск приложения): старая блокировка к нему не относится
+            self._loop, self._flush_lock = loop, asyncio.Lock()
+        return self._flush_lock
+
+    async def flush(self) -> None:
+        """Записывает накопленные изменения и удаляет просроченные состояния одной транзакцией."""
+        from db import run_blocking
+
+        # По одной записи за раз: иначе более старые изменения могли бы лечь на диск поверх новых
+        async with self._lock():
+            self._writing, self._dirty = self._dirty, {}
+            try:
+                await run_blocking(self._write, self._writing)
+            except sqlite3.Error:
+                # Не теряем изменения: вернем их в очередь (более свежие значения важнее)
+                self._writing.update(self._dirty)
+                self._dirty = self._writing
+                logger.exception("Не удалось сохранить состояния пользователей")
+            finally:
+                self._writing = {}
+            self._cache.evict_expired()
+
+    async def close(self) -> None:
+        await self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# ============================ ОТВЕТЫ ПОЛЬЗОВАТЕЛЕЙ ============================
+
+class UserDataPersistence(BasePersistence):
+    """
+    Сохраняет context.user_data в SQLite: одна строка на пользователя, pickle его словаря.
+
+    В отличие от PicklePersistence, которая раз в интервал целиком переписывает файл со всеми
+    пользователями в цикле событий, на диск уходят только пользователи, от которых с прошлого раза
+    пришли обновления, одной транзакцией в пуле потоков базы данных (db.run_blocking).
+    При запуске загружаются только те, кто был активен последние ttl секунд; бот сам сбрасывает
+    user_data закончивших анкету и долго молчащих (см. stale_users и main.evict_user_data),
+    поэтому в памяти остаются только незаконченные анкеты.
+    Остальные данные PTB (bot_data, chat_data, диалоги) не сохраняются.
+    """
+
+    def __init__(self, path: str = USER_DATA_DB_PATH, ttl=STATE_TTL, update_interval: float = STATE_FLUSH_INTERVAL):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.ttl = ttl
+        self._path = path
+        self._db = None
+        self._db_lock = threading.Lock()  # Соединение одно, а потоков пула несколько
+        self._pending = {}  # user_id -> (pickle словаря или None для удаления, время изменения)
+        self._touched = {}  # user_id -> время последнего изменения (для stale_users)
+        self._loop = None
+        self._save_lock = None
+
+    def _conn(self) -> sqlite3.Connection:
+        # Вызывать под _db_lock
+        if self._db is None:
+            self._db = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS user_data ("
+                "user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_user_data_updated_at ON user_data (updated_at)")
+        return self._db
+
+    def _read_all(self, since: float) -> list:
+        with self._db_lock:
+            conn = self._conn()
+            conn.execute("DELETE FROM user_data WHERE updated_at < ?", (since,))
+            return conn.execute("SELECT user_id, data, updated_at FROM user_data").fetchall()
+
+    def _write(self, pending: dict) -> None:
+        upserts = [(user_id, data, ts) for user_id, (data, ts) in pending.items() if data is not None]
+        deletes = [(user_id,) for user_id, (data, _) in pending.items() if data is None]
+        with self._db_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN")
+                if upserts:
+                    conn.executemany(
+                        "INSERT INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                        upserts
+                    )
+                if deletes:
+                    conn.executemany("DELETE FROM user_data WHERE user_id = ?", deletes)
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый цикл событий (перезапуск приложения): старая блокировка к нему не относится
+            self._loop, self._save_lock = loop, asyncio.Lock()
+        return self._save_lock
+
+    async def _save(self) -> None:
+        # PTB вызывает update_user_data/drop_user_data для всех пользователей разом (asyncio.gather):
+        # первый вызов уступает цикл событий, остальные успевают попасть в ту же транзакцию
+        from db import run_blocking
+
+        await asyncio.sleep(0)
+        async with self._lock():
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                await run_blocking(self._write, pending)
+            except sqlite3.Error:
+                pending.update(self._pending)  # Более свежие изменения важнее
+                self._pending = pending
+                logger.exception("Не удалось сохранить ответы пользователей")
+
+    def stale_users(self, idle: float) -> list:
+        """:return: пользователи, чьи user_data не менялись дольше idle секунд"""
+        cutoff = time.time() - idle
+        return [user_id for user_id, ts in self._touched.items() if ts < cutoff]
+
+    async def get_user_data(self) -> dict:
+        from db import run_blocking
+
+        rows = await run_blocking(self._read_all, time.time() - self.ttl)
+        self._touched = {user_id: ts for user_id, _, ts in rows}
+        return {user_id: pickle.loads(data) for user_id, data, _ in rows}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        now = time.time()
+        self._pending[user_id] = (pickle.dumps(data, pickle.HIGHEST_PROTOCOL), now)
+        self._touched[user_id] = now
+        await self._save()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending[user_id] = (None, time.time())
+        self._touched.pop(user_id, None)
+        await self._save()
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await self._save()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # Остальные данные PTB не сохраняются (store_data выше)
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+
+def create_state_store() -> StateStore:
+    """Создает хранилище состояний согласно настройке STATE_STORE."""
+    if STATE_STORE == "memory":
+        return MemoryStateStore()
+    return SqliteStateStore()
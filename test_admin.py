@@ -0,0 +1,50 @@
+"""
+Проверки страниц /pending (admin._pending_page и ключи в кнопках) на отдельной базе во временном каталоге.
+
+Запуск:
+    python -m pytest -q test_admin.py
+"""
+import sqlite3
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import admin
+import migrations
+from test_migrations import BASELINE_SCHEMA, SUMMARY
+
+
+def _rows() -> list:
+    # Прошли собеседование (есть сводка); у части анкет время регистрации не записано, у части совпадает
+    rows = []
+    for teacher_id in range(1, 24):
+        registered = None if teacher_id % 5 == 0 else f"2024-05-{1 + teacher_id // 3:02d} 10:00:00.000000"
+        rows.append((teacher_id, "Иванов Иван Иванович", "Москва", "1990-01-01", 0, registered, None, SUMMARY, None))
+    return rows
+
+
+def test_pages_forward_and_back_cover_every_row_once(tmp_path):
+    path = tmp_path / "teachers.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute(BASELINE_SCHEMA)
+        connection.executemany("INSERT INTO teachers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", _rows())
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.migrate(engine)
+
+    with Session(engine) as session:
+        forward = [admin._pending_page(session, limit=4)]
+        while forward[-1].older:
+            cursor = admin.decode_cursor(admin.encode_cursor(forward[-1].rows[-1]))
+            forward.append(admin._pending_page(session, before=cursor, limit=4))
+        back = [forward[-1]]
+        while back[-1].newer:
+            cursor = admin.decode_cursor(admin.encode_cursor(back[-1].rows[0]))
+            back.append(admin._pending_page(session, after=cursor, limit=4))
+    engine.dispose()
+
+    ids = [row.id for page in forward for row in page.rows]
+    assert sorted(ids) == list(range(1, 24))
+    assert [[row.id for row in page.rows] for page in back[::-1]] == [[row.id for row in page.rows] for page in forward]
+    # Анкетам без записанного времени досталось самое раннее (как у 1 и 2) — они в конце, по порядку id
+    assert ids[-6:] == [20, 15, 10, 5, 2, 1]
+    assert not forward[0].newer and not forward[-1].older
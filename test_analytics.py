@@ -0,0 +1,54 @@
+"""
+Проверки записи событий воронки (analytics.FunnelTracker, analytics._apply_events) на временной базе
+(см. conftest.py).
+
+Запуск:
+    python -m pytest -q test_analytics.py
+"""
+import asyncio
+
+import analytics
+import db
+from analytics import FunnelStep, FunnelTracker
+from metrics import FUNNEL_EVENTS_DROPPED
+from models import FunnelDaily
+
+
+def _daily(city: str) -> dict:
+    with db.session_scope() as session:
+        return dict(session.query(FunnelDaily.step, FunnelDaily.users).filter(FunnelDaily.city == city).all())
+
+
+def test_step_counted_once_per_user():
+    tracker = FunnelTracker()
+    tracker.track(600_001, FunnelStep.START)
+    tracker.track(600_001, FunnelStep.START)
+    tracker.track(600_002, FunnelStep.START)
+    tracker.track(600_001, FunnelStep.SURVEY_DONE, city="Тестоград")
+    asyncio.run(tracker.flush())
+    tracker.track(600_001, FunnelStep.START)  # Повтор в следующей записи
+    tracker.track(600_002, FunnelStep.SURVEY_DONE, city="Тестоград")
+    asyncio.run(tracker.flush())
+
+    # Шаги до анкеты переносятся в город, когда он становится известен
+    assert _daily("Тестоград") == {FunnelStep.START: 2, FunnelStep.SURVEY_DONE: 2}
+
+
+def test_events_dropped_after_retries(monkeypatch):
+    async def unavailable(func, *args):
+        raise OSError("база недоступна")
+
+    monkeypatch.setattr(analytics, "run_db_batched", unavailable)
+    tracker = FunnelTracker()
+    for user_id in range(3):
+        tracker.track(user_id, FunnelStep.START)
+    dropped = FUNNEL_EVENTS_DROPPED.value("write_failed")
+
+    for _ in range(analytics.ANALYTICS_MAX_RETRIES - 1):
+        asyncio.run(tracker.flush())
+    assert FUNNEL_EVENTS_DROPPED.value("write_failed") == dropped  # Еще повторяются
+    assert tracker._retry_events == 3
+
+    asyncio.run(tracker.flush())
+    assert FUNNEL_EVENTS_DROPPED.value("write_failed") == dropped + 3
+    assert tracker._retry == [] and tracker._retry_events == 0
@@ -0,0 +1,93 @@
+"""
+Проверки групповой записи (db.WriteBatcher, db._run_batch) на временной базе (см. conftest.py).
+
+Запуск:
+    python -m pytest -q test_db.py
+"""
+import asyncio
+from datetime import date
+
+from sqlalchemy import event, func, select
+
+import db
+import repository
+from models import Teacher, TeacherCounter
+
+
+def _call(user_id: int, city: str = "Москва") -> tuple:
+    return repository._register_teacher, user_id, "Иванов Иван Иванович", city, date(1990, 1, 1)
+
+
+def _register(user_id: int, city: str = "Москва") -> tuple:
+    """Элемент пачки _run_batch: (функция, аргументы, именованные аргументы, future)."""
+    func, *args = _call(user_id, city)
+    return func, tuple(args), {}, None
+
+
+def _fail(session, user_id: int):
+    session.add(Teacher(id=user_id, full_name=None, city="Москва", birth_date=date(1990, 1, 1)))  # NOT NULL
+    session.flush()
+
+
+def _teachers(*ids) -> list:
+    with db.session_scope() as session:
+        return session.scalars(select(Teacher.id).where(Teacher.id.in_(ids)).order_by(Teacher.id)).all()
+
+
+def test_batch_commits_once():
+    results = db._run_batch([_register(101), _register(102)])
+    assert results == [(True, None), (True, None)]
+    assert _teachers(101, 102) == [101, 102]
+
+
+def test_failed_batch_runs_calls_one_by_one():
+    results = db._run_batch([_register(201), (_fail, (202,), {}, None), _register(203)])
+    assert [result for result, _ in results] == [True, None, True]
+    assert results[0][1] is None and results[2][1] is None
+    assert results[1][1] is not None  # Ошибка досталась только упавшей функции
+    assert _teachers(201, 202, 203) == [201, 203]
+
+
+def test_same_user_twice_in_batch():
+    results = db._run_batch([_register(301, "Казань"), _register(301, "Казань")])
+    assert results == [(True, None), (False, None)]
+    with db.session_scope() as session:
+        assert session.scalar(select(func.count()).select_from(Teacher).where(Teacher.id == 301)) == 1
+        counter = session.get(TeacherCounter, ("Казань", 1))
+        assert counter.teachers == 1
+
+
+def test_batcher_delivers_error_to_failing_call_only():
+    async def run():
+        return await asyncio.gather(
+            db.run_db_batched(*_call(401)),
+            db.run_db_batched(_fail, 402),
+            db.run_db_batched(*_call(403)),
+            return_exceptions=True,
+        )
+
+    first, failed, last = asyncio.run(run())
+    assert first is True and last is True
+    assert isinstance(failed, Exception)
+    assert _teachers(401, 402, 403) == [401, 403]
+
+
+def test_batcher_splits_by_max_size():
+    batcher = db.WriteBatcher(max_size=3, window=0.001)
+    transactions = []
+
+    def commit(connection):
+        transactions.append(1)
+
+    async def run():
+        return await asyncio.gather(*(
+            batcher.submit(*_call(user_id)) for user_id in range(501, 508)
+        ))
+
+    event.listen(db.get_engine(), "commit", commit)
+    try:
+        assert asyncio.run(run()) == [True] * 7
+    finally:
+        event.remove(db.get_engine(), "commit", commit)
+    assert len(transactions) == 3  # 3 + 3 + 1
+    assert _teachers(*range(501, 508)) == list(range(501, 508))
@@ -0,0 +1,93 @@
+"""
+Проверки таблицы сценариев (flow.compile_flow, Flow.dispatch) без обращения к Telegram.
+
+Запуск:
+    python -m pytest -q test_flow.py
+"""
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import db
+import main
+import repository
+from flow import Step, compile_flow
+from state_store import MemoryStateStore
+
+
+class _Message:
+    def __init__(self, user_id: int, text: str):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append(text)
+
+
+def _dispatch(flow, state, user_id: int, text: str, user_data: dict = None) -> tuple:
+    """:return: результат dispatch, ответы бота, context.user_data"""
+    message = _Message(user_id, text)
+    context = SimpleNamespace(user_data={} if user_data is None else user_data)
+    handled = asyncio.run(flow.dispatch(SimpleNamespace(message=message), context, state))
+    return handled, message.replies, context.user_data
+
+
+def test_transition_to_unknown_state_rejected():
+    with pytest.raises(ValueError, match="неизвестное состояние 2"):
+        compile_flow(MemoryStateStore(), {1: Step(next_state=2)})
+
+
+def test_state_in_two_tables_rejected():
+    with pytest.raises(ValueError, match="Состояние 1"):
+        compile_flow(MemoryStateStore(), {1: Step()}, {1: Step()})
+
+
+def test_unknown_state_not_handled():
+    flow = compile_flow(MemoryStateStore(), {1: Step()})
+    assert 5 not in flow
+    assert _dispatch(flow, 5, 1, "ответ") == (False, [], {})
+
+
+def test_transition_calls_on_transition():
+    states, transitions = MemoryStateStore(), []
+    flow = compile_flow(states, {
+        1: Step(field="answer", next_state=2, prompt="Второй вопрос"),
+        2: Step(field="last"),
+    }, on_transition=lambda user_id, state: transitions.append((user_id, state)))
+
+    handled, replies, user_data = _dispatch(flow, 1, 7, " да ")
+    assert (handled, replies, user_data) == (True, ["Второй вопрос"], {"answer": "да"})
+    assert states.get(7) == 2
+    _dispatch(flow, 2, 7, "нет")
+    assert 7 not in states  # Сценарий закончен
+    assert transitions == [(7, 2), (7, None)]
+
+
+def test_invalid_answer_keeps_state():
+    states, transitions = MemoryStateStore(), []
+    flow = compile_flow(states, {1: Step(error="Ответьте текстом", next_state=1)},
+                        on_transition=lambda user_id, state: transitions.append((user_id, state)))
+    states[7] = 1
+    assert _dispatch(flow, 1, 7, "   ") == (True, ["Ответьте текстом"], {})
+    assert states.get(7) == 1
+    assert transitions == []
+
+
+def test_registered_user_stays_on_birth_date():
+    user_id = 800_001
+    with db.session_scope() as session:
+        repository._register_teacher(session, user_id, "Иванов Иван Иванович", "Москва", date(1990, 1, 1))
+    states, transitions = MemoryStateStore(), []
+    flow = compile_flow(states, main.SURVEY_FLOW,
+                        on_transition=lambda user_id, state: transitions.append((user_id, state)))
+    states[user_id] = main.SurveyState.WAITING_FOR_BIRTH_DATE
+
+    handled, replies, _ = _dispatch(flow, main.SurveyState.WAITING_FOR_BIRTH_DATE, user_id, "01.02.1995",
+                                    {"full_name": "Иванов Иван Иванович", "city": "Москва"})
+    assert handled
+    assert replies == ["Вы уже проходили анкетирование."]
+    assert states.get(user_id) == main.SurveyState.WAITING_FOR_BIRTH_DATE  # handle_birth_date вернул False
+    assert transitions == []
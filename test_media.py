@@ -0,0 +1,79 @@
+"""
+Проверки хранилища видео (media.py) на временной базе (см. conftest.py) и без обращения к Telegram.
+
+Запуск:
+    python -m pytest -q test_media.py
+"""
+import asyncio
+import itertools
+from datetime import date
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import db
+import media
+import repository
+from models import Teacher, TeacherMedia
+
+
+_user_ids = itertools.count(900_000)
+
+
+class _FileBot:
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=f"https://files.example/{file_id}.mp4")
+
+
+def _client(status: int) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(status, content=b"\0" * 1024)))
+
+
+def _store(user_id: int, file_id: str, status: int) -> list:
+    """Сохраняет видео через новую очередь загрузок; возвращает ошибки из on_done."""
+    errors = []
+
+    async def on_done(path, error):
+        errors.append(error)
+
+    async def run():
+        queue = media.MediaIngestQueue(workers=1, client=_client(status))
+        media.media_queue, previous = queue, media.media_queue
+        try:
+            video = SimpleNamespace(file_id=file_id, file_unique_id=file_id)
+            await media.store_video(_FileBot(), video, user_id, "verification_video", on_done=on_done)
+            await queue.stop()
+        finally:
+            media.media_queue = previous
+
+    asyncio.run(run())
+    return errors
+
+
+@pytest.fixture
+def teacher(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # media/ — во временном каталоге
+    user_id = next(_user_ids)
+    with db.session_scope() as session:
+        repository._register_teacher(session, user_id, "Иванов Иван Иванович", "Москва", date(1990, 1, 1))
+    return user_id
+
+
+def _video(user_id: int) -> tuple:
+    with db.session_scope() as session:
+        return session.get(Teacher, user_id).video_path, media.teacher_videos(session, user_id)
+
+
+def test_video_path_after_download(teacher):
+    assert _store(teacher, f"ok{teacher}", 200) == [None]
+    path = media.blob_path(f"ok{teacher}")
+    assert _video(teacher) == (path, {"verification_video": path})
+
+
+def test_failed_download_leaves_no_video_path(teacher):
+    errors = _store(teacher, f"bad{teacher}", 500)
+    assert len(errors) == 1 and errors[0] is not None
+    assert _video(teacher) == (None, {})
+    with db.session_scope() as session:
+        assert session.query(TeacherMedia).filter(TeacherMedia.teacher_id == teacher).count() == 0
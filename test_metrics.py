@@ -0,0 +1,22 @@
+"""
+Проверки меток метрик базы данных (metrics._operation).
+
+Запуск:
+    python -m pytest -q test_metrics.py
+"""
+import pytest
+
+from metrics import _operation
+
+
+@pytest.mark.parametrize("statement, operation", [
+    ("SELECT id FROM teachers", "SELECT"),
+    ("  insert INTO teachers VALUES (1)", "INSERT"),
+    ("SELECT\n  teachers.id\nFROM teachers", "SELECT"),
+    ("\n\tUPDATE\tteachers SET stage = 2", "UPDATE"),
+    ("COMMIT", "COMMIT"),
+    ("", "OTHER"),
+    (" \n ", "OTHER"),
+])
+def test_operation(statement, operation):
+    assert _operation(statement) == operation
@@ -0,0 +1,134 @@
+"""
+Проверки миграций (migrations.py) на новых файлах баз во временном каталоге.
+
+Запуск:
+    python -m pytest -q test_migrations.py
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+import migrations
+from answers import unpack_answers
+
+# Таблица teachers в том виде, в каком ее создавал models.create_database() до миграций
+BASELINE_SCHEMA = """
+CREATE TABLE teachers (
+    id INTEGER NOT NULL,
+    full_name VARCHAR NOT NULL,
+    city VARCHAR NOT NULL,
+    birth_date DATE NOT NULL,
+    hours_per_week INTEGER,
+    registration_time DATETIME,
+    video_path VARCHAR,
+    text_interview TEXT,
+    address TEXT,
+    PRIMARY KEY (id)
+)
+"""
+SUMMARY = (
+    "Опыт взаимодействия с младшими школьниками: 2 года вожатым\n"
+    "Опыт в робототехнике: Arduino\n"
+    "Города для работы: Москва\n"
+    "Свободное время: по 3 часа в будни\n"
+    "Лучшие навыки: объяснять\n"
+)
+BASELINE_ROWS = (
+    (1, "Иванов Иван Иванович", "Москва", "1990-01-01", 0, "2024-05-01 10:00:00.000000", None, None, None),
+    (2, "Петров Петр Петрович", "Омск", "1991-02-02", 0, "2024-05-02 10:00:00.000000", "media/2.mp4", SUMMARY, None),
+    (3, "Сидорова Анна Павловна", "Казань", "1992-03-03", 0, "2024-05-03 10:00:00.000000", None, SUMMARY,
+     "ул. Ленина, 1"),
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Путь к файлу базы и функция, которая мигрирует его новым движком (как новый процесс бота)."""
+    path = tmp_path / "teachers.db"
+
+    def migrate() -> int:
+        engine = create_engine(f"sqlite:///{path}")
+        try:
+            return migrations.migrate(engine)
+        finally:
+            engine.dispose()
+
+    return path, migrate
+
+
+def _query(path, sql: str) -> list:
+    with sqlite3.connect(path) as connection:
+        return connection.execute(sql).fetchall()
+
+
+def _dump(path) -> list:
+    """Схема и все строки обычных таблиц базы."""
+    schema = _query(path, "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'teacher_search_%' "
+                          "ORDER BY type, name")
+    rows = [(name, _query(path, f'SELECT * FROM "{name}" ORDER BY 1')) for kind, name, _ in schema
+            if kind == "table" and not name.startswith("sqlite_")]
+    return schema + rows
+
+
+def _objects(path) -> set:
+    return set(_query(path, "SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+
+
+def test_fresh_database(database):
+    path, migrate = database
+    assert migrate() == migrations.LATEST_VERSION
+    assert _query(path, "PRAGMA user_version") == [(migrations.LATEST_VERSION,)]
+    assert ("table", "teachers") in _objects(path)
+    assert ("table", "job_state") not in _objects(path)  # Удалена миграцией 8
+    assert ("table", "reminder_log") not in _objects(path)  # Удалена миграцией 9
+
+
+def test_baseline_database(database):
+    path, migrate = database
+    with sqlite3.connect(path) as connection:
+        connection.execute(BASELINE_SCHEMA)
+        connection.executemany("INSERT INTO teachers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", BASELINE_ROWS)
+
+    assert migrate() == migrations.LATEST_VERSION
+    assert _query(path, "PRAGMA user_version") == [(migrations.LATEST_VERSION,)]
+    rows = _query(path, "SELECT id, full_name, city, birth_date, video_path, address, stage, text_interview, "
+                        "interview FROM teachers ORDER BY id")
+    assert [row[:6] for row in rows] == [
+        (teacher_id, full_name, city, birth_date, video_path, address)
+        for teacher_id, full_name, city, birth_date, _, _, video_path, _, address in BASELINE_ROWS
+    ]
+    assert [row[6] for row in rows] == [1, 2, 3]
+    # Сводка старого формата переведена в ответы
+    assert rows[0][7:] == (None, None)
+    for row in rows[1:]:
+        assert row[7] is None
+        assert unpack_answers(row[8])["experience_robo"] == "Arduino"
+
+    assert _query(path, "SELECT teacher_id FROM reminder_jobs") == [(1,)]
+    assert _query(path, "SELECT teacher_id FROM scoring_jobs ORDER BY 1") == [(2,), (3,)]
+    assert _query(path, "SELECT city, stage, teachers FROM teacher_counters ORDER BY stage") == [
+        ("Москва", 1, 1), ("Омск", 2, 1), ("Казань", 3, 1)
+    ]
+    assert _query(path, "SELECT rowid FROM teacher_search WHERE teacher_search MATCH 'arduino' ORDER BY 1") == [
+        (2,), (3,)
+    ]
+    # Те же таблицы и индексы, что у новой базы
+    fresh = path.with_name("fresh.db")
+    engine = create_engine(f"sqlite:///{fresh}")
+    migrations.migrate(engine)
+    engine.dispose()
+    assert _objects(path) == _objects(fresh)
+
+
+@pytest.mark.parametrize("baseline", [False, True])
+def test_second_run_changes_nothing(database, baseline):
+    path, migrate = database
+    if baseline:
+        with sqlite3.connect(path) as connection:
+            connection.execute(BASELINE_SCHEMA)
+            connection.executemany("INSERT INTO teachers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", BASELINE_ROWS)
+    migrate()
+    before = _dump(path)
+    assert migrate() == migrations.LATEST_VERSION
+    assert _dump(path) == before
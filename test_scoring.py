@@ -0,0 +1,68 @@
+"""
+Проверки признаков оценки кандидатов (scoring.py), без базы данных.
+
+Запуск:
+    python -m pytest -q test_scoring.py
+"""
+import numpy as np
+
+import scoring
+
+
+def test_superscript_digit_is_not_a_number():
+    vocabulary = scoring._Vocabulary()
+    features = scoring.score_batch(vocabulary, [{"free_time": "3² часа в день"}], ["Москва"])
+    assert features["hours_per_week"][0] == 0
+    # Словарь после такого слова по-прежнему разбирает ответы
+    features = scoring.score_batch(vocabulary, [{"free_time": "3² часа в день, 4 часа в день"}], ["Москва"])
+    assert features["hours_per_week"][0] == 4 * scoring.WORK_DAYS
+
+
+def test_batch_after_bad_word_is_scored():
+    vocabulary = scoring._Vocabulary()
+    scoring.score_batch(vocabulary, [{"free_time": "²³ часа"}], ["Москва"])
+    features = scoring.score_batch(vocabulary, [{"free_time": "²³ часа, по 2 часа в день"}], ["Москва"])
+    assert features["hours_per_week"][0] == 2 * scoring.WORK_DAYS
+
+
+def test_hours_per_day():
+    answers = [
+        {"free_time": "по 2 часа в день"},
+        {"free_time": "3 часа каждый день"},
+        {"free_time": "Будни после 16, 10 часов в неделю"},
+        {"free_time": "1 день в неделю 4 часа"},
+        {"free_time": "в будни по 3 часа"},
+        {"free_time": "ежедневно 2 часа"},
+    ]
+    features = scoring.score_batch(scoring._Vocabulary(), answers, ["Москва"] * len(answers))
+    assert list(features["hours_per_week"]) == [
+        2 * scoring.WORK_DAYS, 3 * scoring.WORK_DAYS, 10, 4, 3 * scoring.WORK_DAYS, 2 * scoring.WORK_DAYS,
+    ]
+
+
+def test_no_city_gets_no_distance_points():
+    answers = [
+        {"interview_city": "Москва"},
+        {"interview_city": "Омск"},
+        {"interview_city": "где удобно"},
+    ]
+    features = scoring.score_batch(scoring._Vocabulary(), answers, ["Москва"] * len(answers))
+    assert np.isnan(features["distance_km"][2])
+    assert features["score"][0] == scoring.SCORE_WEIGHTS[3]
+    # Город дальше FAR_KM и ответ без города — одинаково без баллов за удаленность
+    assert features["score"][1] == features["score"][2] == 0
+
+
+def test_features():
+    answers = [
+        {"experience_kids": "вожатым в лагере, вел кружок в школе", "experience_robo": "Arduino и Lego",
+         "interview_city": "Казань", "free_time": "10 часов в неделю"},
+        {"experience_kids": "нет", "experience_robo": "нет", "interview_city": "любой район", "free_time": "выходные"},
+    ]
+    features = scoring.score_batch(scoring._Vocabulary(), answers, ["Москва", "Омск"])
+    assert list(features["kids_hits"]) == [4, 0]
+    assert list(features["robo_hits"]) == [2, 0]
+    assert list(features["hours_per_week"]) == [10, scoring.WEEKEND_HOURS]
+    assert 700 < features["distance_km"][0] < 750  # Москва — Казань
+    assert np.isnan(features["distance_km"][1])
+    assert features["score"][0] > features["score"][1]
@@ -0,0 +1,60 @@
+"""
+Проверки поиска кандидатов (search.py) на временной базе (см. conftest.py).
+
+Запуск:
+    python -m pytest -q test_search.py
+"""
+import itertools
+from datetime import date
+
+import db
+import repository
+import search
+
+
+_user_ids = itertools.count(700_000)
+
+
+def _add(answers: str, city: str = "Москва") -> int:
+    user_id = next(_user_ids)
+    with db.session_scope() as session:
+        repository._register_teacher(session, user_id, "Иванов Иван Иванович", city, date(1990, 1, 1))
+        session.execute(search.INDEX_SQL, search.index_row(user_id, city, answers))
+    return user_id
+
+
+def _pages(query: str, city: str = None, per_page: int = 4) -> list:
+    pages = []
+    with db.session_scope() as session:
+        for page in itertools.count():
+            pages.append(search._search(session, query, city, page, per_page))
+            if not pages[-1].has_more:
+                return pages
+
+
+def test_best_match_first_among_all_matches():
+    best = _add("квадрокоптер квадрокоптер")  # Самый маленький id
+    others = [_add("собираю квадрокоптеры, веду кружок моделирования и пишу программы для детей") for _ in range(9)]
+    pages = _pages("квадрокоптер")
+    results = [row for page in pages for row in page.results]
+    assert results[0].id == best
+    assert sorted(row.id for row in results) == [best, *others]
+    assert [row.score for row in results] == sorted(row.score for row in results)
+    # Равный ранг — новые анкеты раньше
+    assert [row.id for row in results[1:]] == others[::-1]
+
+
+def test_pages_cover_every_match_once():
+    ids = [_add(f"дрон номер {number}") for number in range(8)]  # Ровно две полные страницы
+    pages = _pages("дрон")
+    assert [len(page.results) for page in pages] == [4, 4]
+    assert sorted(row.id for page in pages for row in page.results) == ids
+    with db.session_scope() as session:
+        assert search._search(session, "дрон", page=2, per_page=4).results == ()
+
+
+def test_city_only_pages_by_id():
+    ids = [_add("", city="Петрозаводск") for _ in range(5)]
+    pages = _pages("", "Петрозаводск", per_page=2)
+    assert [row.id for page in pages for row in page.results] == ids[::-1]
+    assert [row.score for page in pages for row in page.results] == [0.0] * 5
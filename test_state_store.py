@@ -0,0 +1,97 @@
+"""
+Проверки хранилищ состояний и ответов (state_store.py): что записано до перезапуска, читается после него.
+Файлы SQLite — во временном каталоге.
+
+Запуск:
+    python -m pytest -q test_state_store.py
+"""
+import asyncio
+
+from state_store import SqliteStateStore, UserDataPersistence
+
+
+def test_states_survive_restart(tmp_path):
+    path = str(tmp_path / "states.db")
+
+    async def before_restart():
+        store = SqliteStateStore(path)
+        store[1], store[2], store[3] = 4, 9, 11
+        store[2] = 10  # Записывается последнее значение
+        del store[3]
+        await store.close()
+
+    async def after_restart():
+        store = SqliteStateStore(path)
+        assert store.get(1) is None  # В памяти нового хранилища ничего нет, состояние читает load()
+        loaded = [await store.load(user_id) for user_id in (1, 2, 3)]
+        assert 1 in store  # Прочитанное осталось в кэше
+        await store.close()
+        return loaded
+
+    asyncio.run(before_restart())
+    assert asyncio.run(after_restart()) == [4, 10, None]
+
+
+def test_load_prefers_unsaved_change(tmp_path):
+    path = str(tmp_path / "states.db")
+
+    async def run():
+        store = SqliteStateStore(path)
+        store[1] = 4
+        await store.flush()
+        restarted = SqliteStateStore(path)
+        restarted[1] = 5  # Еще не на диске
+        state = await restarted.load(1)
+        await store.close()
+        await restarted.close()
+        return state
+
+    assert asyncio.run(run()) == 5
+
+
+def test_expired_state_not_loaded(tmp_path):
+    path = str(tmp_path / "states.db")
+
+    async def run():
+        store = SqliteStateStore(path)
+        store[1] = 4
+        await store.close()
+        restarted = SqliteStateStore(path, ttl=0)
+        state = await restarted.load(1, "нет")
+        await restarted.close()
+        return state
+
+    assert asyncio.run(run()) == "нет"
+
+
+def test_user_data_survives_restart(tmp_path):
+    path = str(tmp_path / "user_data.db")
+
+    async def before_restart():
+        persistence = UserDataPersistence(path)
+        await persistence.update_user_data(1, {"full_name": "Иванов Иван Иванович", "city": "Москва"})
+        await persistence.update_user_data(2, {"city": "Омск"})
+        await persistence.drop_user_data(2)
+        await persistence.flush()
+
+    asyncio.run(before_restart())
+    assert asyncio.run(UserDataPersistence(path).get_user_data()) == {
+        1: {"full_name": "Иванов Иван Иванович", "city": "Москва"}
+    }
+
+
+def test_worker_files_are_separate(tmp_path):
+    # Как в workers.py: у процесса-обработчика с номером index свой файл user_data.{index}.db
+    paths = [str(tmp_path / f"user_data.{index}.db") for index in range(2)]
+
+    async def save():
+        for index, path in enumerate(paths):
+            persistence = UserDataPersistence(path)
+            await persistence.update_user_data(10 + index, {"worker": index})
+            await persistence.flush()
+
+    async def load():
+        return [await UserDataPersistence(path).get_user_data() for path in paths]
+
+    asyncio.run(save())
+    assert asyncio.run(load()) == [{10: {"worker": 0}}, {11: {"worker": 1}}]
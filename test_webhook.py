@@ -0,0 +1,50 @@
+"""
+Проверки приема обновлений вебхуком (webhook.create_web_app) без Telegram: запросы к локальному серверу aiohttp.
+
+Запуск:
+    python -m pytest -q test_webhook.py
+"""
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, create_web_app
+
+
+def _post(body, secret: str = "", headers: dict = None) -> tuple:
+    """:return: (статус ответа, обновления в очереди бота)"""
+    async def run():
+        app = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        async with TestClient(TestServer(create_web_app(app, "/telegram", secret))) as client:
+            if isinstance(body, str):
+                response = await client.post("/telegram", data=body, headers=headers)
+            else:
+                response = await client.post("/telegram", json=body, headers=headers)
+        updates = []
+        while not app.update_queue.empty():
+            updates.append(app.update_queue.get_nowait())
+        return response.status, updates
+
+    return asyncio.run(run())
+
+
+def test_update_queued():
+    status, updates = _post({"update_id": 1})
+    assert status == 200
+    assert [update.update_id for update in updates] == [1]
+
+
+def test_body_not_json():
+    assert _post("{not json") == (400, [])
+
+
+def test_json_not_update():
+    # Telegram получает 200 и не повторяет обновление, которое все равно не разобрать
+    for body in ([1], {}, {"update_id": 1, "message": 5}, {"update_id": 1, "message": {"text": "без даты"}}):
+        assert _post(body) == (200, [])
+
+
+def test_wrong_secret():
+    assert _post({"update_id": 1}, secret="s3cret", headers={SECRET_HEADER: "other"}) == (403, [])
+    assert _post({"update_id": 1}, secret="s3cret", headers={SECRET_HEADER: "s3cret"})[0] == 200
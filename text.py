@@ -65,4 +65,6 @@ https://rutube.ru/video/ae2e28ac521c4cff5ffc58c0d54d65be/?utm_source=embed&utm_m
 Переходим к следующему шагу:
 Жми команду /lesson5
 """
-)
\ No newline at end of file
+)
+
+BUSY_TEXT = "Сейчас бот очень занят. Пожалуйста, подождите немного и повторите последнее действие."
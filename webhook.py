@@ -0,0 +1,99 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+from metrics import metrics_view
+
+# ============================ НАСТРОЙКА ============================
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+logger = logging.getLogger(__name__)
+
+
+# ============================ ВЕБ-СЕРВЕР ============================
+
+def create_web_app(app, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET) -> web.Application:
+    """
+    aiohttp-приложение, которое принимает обновления от Telegram и кладет их в очередь бота.
+    :param app: telegram.ext.Application
+    """
+    async def receive_update(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            logger.warning("Вебхук: тело запроса не JSON (%d байт)", request.content_length or 0)
+            return web.Response(status=400)
+        try:
+            update = Update.de_json(data, app.bot)
+        except Exception:
+            # JSON не того вида, что у обновления: повтор от Telegram будет таким же, поэтому отвечаем 200 —
+            # иначе Telegram повторял бы его и задерживал следующие обновления
+            logger.exception("Вебхук: не удалось разобрать обновление")
+            return web.Response()
+        await app.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    web_app = web.Application()
+    web_app.router.add_post(path, receive_update)
+    web_app.router.add_get("/health", health)
+    web_app.router.add_get("/metrics", metrics_view)
+    return web_app
+
+
+async def serve_webhook(app, url: str = WEBHOOK_URL, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                        path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET, stop_event: asyncio.Event = None,
+                        set_webhook: bool = True) -> None:
+    """
+    Запускает бота в режиме вебхука в текущем цикле событий и работает до stop_event (или SIGINT/SIGTERM).
+    :param url: публичный адрес сервера без пути; если пустой, вебхук в Telegram не регистрируется
+    :param set_webhook: регистрировать ли вебхук в Telegram при запуске
+    """
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows или не главный поток
+
+    runner = web.AppRunner(create_web_app(app, path, secret))
+    await runner.setup()
+
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        if set_webhook and url:
+            await app.bot.set_webhook(
+                url=url.rstrip("/") + path,
+                secret_token=secret or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+        site = web.TCPSite(runner, listen, port)
+        await site.start()
+        logger.info("Вебхук слушает %s:%s%s", listen, port, path)
+        try:
+            await stop_event.wait()
+        finally:
+            await runner.cleanup()
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
@@ -0,0 +1,128 @@
+"""
+Обработка обновлений в нескольких процессах.
+
+Главный процесс получает обновления (polling или вебхук) и раскладывает их по очередям
+процессов-обработчиков по from_user.id. Все сообщения одного пользователя попадают в один
+процесс и обрабатываются там строго по очереди, поэтому порядок диалога сохраняется.
+У каждого обработчика свой файл user_data.<номер>.db; при изменении числа процессов
+пользователи переезжают в другие процессы и теряют незавершенные ответы из user_data
+(состояние диалога хранится в общем states.db и не теряется).
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+WORKER_QUEUE_SIZE = 1000  # Сколько обновлений может ждать в очереди одного процесса
+STOP_TIMEOUT = 30  # Секунд на завершение процесса после остановки бота
+
+logger = logging.getLogger(__name__)
+
+
+# ============================ ПРОЦЕСС-ОБРАБОТЧИК ============================
+
+def _worker_main(index: int, updates, base_url: str = None) -> None:
+    # Останавливает процессы главный процесс (через None в очереди), Ctrl+C здесь игнорируем
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import main
+    from metrics import METRICS_PORT, InstrumentedRequest
+    from telegram.request import HTTPXRequest
+
+    builder = ApplicationBuilder().token(main.TOKEN).updater(None).request(
+        InstrumentedRequest(HTTPXRequest(connection_pool_size=256))
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    # Напоминания и очистку медиа выполняет только первый процесс; метрики каждого процесса — на своем порту
+    app = main.build_application(builder, persistence_file=f"user_data.{index}.db", scheduled_jobs=index == 0,
+                                 metrics_port=METRICS_PORT + 1 + index if METRICS_PORT else 0)
+    asyncio.run(_consume(app, updates))
+
+
+async def _consume(app, updates) -> None:
+    loop = asyncio.get_running_loop()
+    async with app:
+        await app.post_init(app)
+        await app.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, updates.get)
+                if data is None:
+                    break
+                # Через очередь приложения: обновления одного пользователя идут по порядку (см. backpressure.py)
+                await app.update_queue.put(Update.de_json(data, app.bot))
+        finally:
+            await app.stop()
+    await app.post_shutdown(app)
+
+
+# ============================ МАРШРУТИЗАЦИЯ ============================
+
+class ShardRouter:
+    """
+    Запускает workers процессов-обработчиков и отправляет каждое обновление в процесс
+    с номером from_user.id % workers.
+    :param base_url: адрес Bot API для обработчиков (например, локальной имитации)
+    """
+
+    def __init__(self, workers: int, base_url: str = None):
+        context = multiprocessing.get_context("spawn")
+        self.queues = [context.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.processes = [
+            context.Process(target=_worker_main, args=(index, updates, base_url), name=f"bot-worker-{index}")
+            for index, updates in enumerate(self.queues)
+        ]
+
+    def shard(self, update: Update) -> int:
+        user = update.effective_user
+        return user.id % len(self.queues) if user else 0
+
+    async def route(self, update: Update, context) -> None:
+        """Обработчик главного процесса: передает обновление нужному процессу."""
+        updates = self.queues[self.shard(update)]
+        data = update.to_dict()
+        try:
+            updates.put_nowait(data)
+        except queue.Full:
+            # Очередь процесса переполнена: ждем, не принимая следующих обновлений (сохраняет порядок)
+            await asyncio.get_running_loop().run_in_executor(None, updates.put, data)
+
+    async def start(self, app=None) -> None:
+        for process in self.processes:
+            process.start()
+        logger.info("Запущено процессов-обработчиков: %d", len(self.processes))
+
+    async def stop(self, app=None) -> None:
+        for updates in self.queues:
+            updates.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Процесс %s не завершился вовремя, останавливаем принудительно", process.name)
+                process.terminate()
+
+
+def build_front_application(router: ShardRouter, builder: ApplicationBuilder = None):
+    """Главное приложение: только получает обновления и раздает их процессам."""
+    if builder is None:
+        from setting import TOKEN
+        builder = ApplicationBuilder().token(TOKEN)
+    app = builder.post_init(router.start).post_shutdown(router.stop).build()
+    app.add_handler(TypeHandler(Update, router.route))
+    return app
+
+
+def run_sharded(workers: int, mode: str = "polling") -> None:
+    """Запускает бота в режиме нескольких процессов."""
+    router = ShardRouter(workers)
+    app = build_front_application(router)
+    if mode == "webhook":
+        from webhook import serve_webhook
+        asyncio.run(serve_webhook(app))
+    else:
+        app.run_polling()